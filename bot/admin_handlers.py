@@ -1,19 +1,76 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Message, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 import csv
 import io
 from datetime import datetime
 import logging
 import asyncio
-from typing import Optional, Dict
-from .database import Database
+from tempfile import SpooledTemporaryFile
+from typing import Optional, Dict, List, Set, Tuple
+from .database import USER_EXPORT_COLUMNS, BroadcastJob, db
+from .broadcast import (
+    BLOCKED, FAILED, NOT_FOUND, SENT, BroadcastResult, broadcast_shutdown, run_broadcast_job
+)
 from .config import ADMIN_IDS
+from .user_pool import user_pool
+from .stats import ACTIVE_USERS, BROADCAST, GENERATED_FORMAT, GENERATED_USERS, REQUESTED_NATIONALITY, stats
+from .exporters import EXPORT_SPOOL_SIZE, choose_compression, compressed_writer, export_filename
 
 logger = logging.getLogger(__name__)
-db = Database('bot.db')
 
-# Словарь для хранения активных рассылок
-active_broadcasts: Dict[int, bool] = {}
+# За сколько дней показывать статистику и сколько национальностей в ней перечислять
+STATS_DAYS = 7
+STATS_TOP = 10
+
+# Сколько последних рассылок показывать в истории
+BROADCAST_HISTORY_LIMIT = 10
+
+# Выполняющиеся рассылки: id задания -> id администратора
+active_broadcasts: Dict[int, int] = {}
+# Задания, которые администратор попросил остановить
+cancelled_broadcasts: Set[int] = set()
+# Фоновые задачи рассылок; их дожидается stop_broadcasts при остановке бота
+broadcast_tasks: Set[asyncio.Task] = set()
+# Как часто resume_broadcasts проверяет, запущено ли приложение, секунды
+RESUME_POLL_INTERVAL = 0.5
+
+def _totals(by_key: Dict[str, Dict[str, int]]) -> List[Tuple[str, int]]:
+    """Суммирует дневные значения по разрезам, от большего к меньшему."""
+    return sorted(((key, sum(days.values())) for key, days in by_key.items()),
+                  key=lambda item: item[1], reverse=True)
+
+def format_daily_stats(daily: Dict[str, Dict[str, Dict[str, int]]]) -> str:
+    """Форматирует дневные итоги StatsCollector.get_daily для панели администратора."""
+    lines = ["*👥 Активные пользователи по дням:*"]
+    active = daily.get(ACTIVE_USERS, {}).get("", {})
+    lines.extend(f"`{day}`: `{count}`" for day, count in sorted(active.items(), reverse=True))
+    if not active:
+        lines.append("нет данных")
+
+    generated = sum(daily.get(GENERATED_USERS, {}).get("", {}).values())
+    lines.append(f"\n*🎲 Генерации за {STATS_DAYS} дн.:* `{generated}` записей")
+    nationalities = _totals(daily.get(REQUESTED_NATIONALITY, {}))[:STATS_TOP]
+    if nationalities:
+        lines.append("Запрошенные национальности (запросов): "
+                     + ", ".join(f"`{key}` {count}" for key, count in nationalities))
+    formats = _totals(daily.get(GENERATED_FORMAT, {}))
+    if formats:
+        lines.append("Форматы: " + ", ".join(f"`{key}` {count}" for key, count in formats))
+
+    delivery = dict(_totals(daily.get(BROADCAST, {})))
+    total = sum(delivery.values())
+    lines.append(f"\n*📨 Рассылки за {STATS_DAYS} дн.:*")
+    if total:
+        sent = delivery.get(SENT, 0)
+        lines.append(f"Доставлено: `{sent}` из `{total}` (`{sent * 100 // total}%`)")
+        lines.append(
+            f"Заблокировали: `{delivery.get(BLOCKED, 0)}`, "
+            f"не найдены: `{delivery.get(NOT_FOUND, 0)}`, "
+            f"ошибки: `{delivery.get(FAILED, 0)}`"
+        )
+    else:
+        lines.append("нет данных")
+    return "\n".join(lines) + "\n\n"
 
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показывает административное меню."""
@@ -28,7 +85,8 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     keyboard = [
         [InlineKeyboardButton("📊 Статистика пользователей", callback_data='admin_stats')],
         [InlineKeyboardButton("📤 Выгрузить пользователей (CSV)", callback_data='export_users')],
-        [InlineKeyboardButton("📨 Создать рассылку", callback_data='broadcast_message')]
+        [InlineKeyboardButton("📨 Создать рассылку", callback_data='broadcast_message')],
+        [InlineKeyboardButton("📜 История рассылок", callback_data='broadcast_history')]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("🔧 *Панель администратора*\nВыберите действие:", reply_markup=reply_markup, parse_mode='Markdown')
@@ -47,13 +105,20 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if query.data == 'admin_stats':
         try:
-            users = db.get_all_users()
-            users_count = len(users)
-            logger.info(f"Got users count: {users_count}")
+            user_stats = await db.get_user_stats()
+            logger.info(f"Got user stats: {user_stats}")
+            daily = await stats.get_daily(STATS_DAYS)
             
+            pool_stats = user_pool.stats()
             stats_text = (
                 "*📊 Статистика бота:*\n"
-                f"Всего пользователей: `{users_count}`\n"
+                f"Всего пользователей: `{user_stats['users']}`\n"
+                f"Активных рассылок: `{user_stats['running_broadcasts']}`\n\n"
+                + format_daily_stats(daily) +
+                "*🗃 Пул генерации:*\n"
+                f"Попаданий: `{pool_stats['hits']}`\n"
+                f"Промахов: `{pool_stats['misses']}`\n"
+                f"Профилей: `{pool_stats['profiles']}`, готовых записей: `{pool_stats['items']}`\n"
             )
             await query.edit_message_text(stats_text, parse_mode='Markdown')
         except Exception as e:
@@ -65,35 +130,40 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     elif query.data == 'export_users':
         try:
-            users = db.get_all_users()
-            logger.info(f"Exporting {len(users)} users")
+            users_count = (await db.get_user_stats())['users']
+            logger.info(f"Exporting {users_count} users")
             
-            if not users:
+            if not users_count:
                 await query.edit_message_text("ℹ️ Нет данных для экспорта: список пользователей пуст.")
                 return
 
-            # Создаем CSV файл в памяти
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['ID', 'Username'])
-            
-            for user in users:
-                writer.writerow([user[0], user[1]])
-            
-            output.seek(0)
-            file_content = output.getvalue().encode()
-            output.close()
-            
-            filename = f'users_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            logger.info(f"Sending CSV file: {filename}")
-            
-            # Отправляем файл
-            await context.bot.send_document(
-                chat_id=user_id,
-                document=io.BytesIO(file_content),
-                filename=filename,
-                caption="📊 Экспорт пользователей"
-            )
+            # CSV пишется в буфер через сжимающий поток, без промежуточной копии
+            name = f'users_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+            compression = choose_compression("auto", users_count)
+            with SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as buffer:
+                with compressed_writer(buffer, compression, f"{name}.csv") as stream:
+                    output = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+                    writer = csv.writer(output)
+                    writer.writerow(USER_EXPORT_COLUMNS)
+                    
+                    # Пользователи читаются страницами, а не всей таблицей
+                    async for page in db.iter_users(with_settings=True):
+                        writer.writerows(page)
+                    
+                    output.flush()
+                    output.detach()
+                buffer.seek(0)
+                
+                filename = export_filename(name, "csv", compression)
+                logger.info(f"Sending CSV file: {filename}")
+                
+                # Отправляем файл
+                await context.bot.send_document(
+                    chat_id=user_id,
+                    document=buffer,
+                    filename=filename,
+                    caption="📊 Экспорт пользователей"
+                )
             
             # Подтверждаем успешный экспорт
             await query.edit_message_text("✅ Файл с данными пользователей сгенерирован и отправлен.")
@@ -101,6 +171,39 @@ async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             logger.error(f"Error exporting users: {e}", exc_info=True)
             await query.edit_message_text("❌ Произошла ошибка при экспорте пользователей.")
 
+    elif query.data == 'broadcast_history':
+        try:
+            history = await db.get_broadcast_history(BROADCAST_HISTORY_LIMIT)
+            if not history:
+                await query.edit_message_text("ℹ️ Рассылок еще не было.")
+                return
+
+            lines = ["*📜 Последние рассылки:*\n"]
+            keyboard = []
+            for broadcast_id, _, timestamp, total_users, sent_count, failed_count, job_id in history:
+                lines.append(f"*#{broadcast_id}* `{timestamp}`: отправлено `{sent_count}` из `{total_users}`")
+                if failed_count:
+                    failures = await db.get_broadcast_failure_counts(broadcast_id)
+                    lines.append(
+                        f"  заблокировали `{failures.get(BLOCKED, 0)}`, "
+                        f"не найдены `{failures.get(NOT_FOUND, 0)}`, "
+                        f"ошибки `{failures.get(FAILED, 0)}`"
+                    )
+                    # Повторять имеет смысл только временные ошибки
+                    if job_id is not None and failures.get(FAILED):
+                        keyboard.append([InlineKeyboardButton(
+                            f"🔁 Повторить #{broadcast_id} ({failures[FAILED]})",
+                            callback_data=f'retry_broadcast_{broadcast_id}'
+                        )])
+            await query.edit_message_text(
+                "\n".join(lines),
+                reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None,
+                parse_mode='Markdown'
+            )
+        except Exception as e:
+            logger.error(f"Error getting broadcast history: {e}", exc_info=True)
+            await query.edit_message_text("❌ Произошла ошибка при получении истории рассылок.")
+
     elif query.data == 'broadcast_message':
         try:
             context.user_data['waiting_for_broadcast'] = True
@@ -174,6 +277,33 @@ async def broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.edit_message_text("❌ Рассылка отменена.")
         return
 
+    if active_broadcasts:
+        await query.message.reply_text("ℹ️ Дождитесь окончания текущей рассылки или отмените ее.")
+        return
+
+    if query.data.startswith('retry_broadcast_'):
+        try:
+            broadcast_id = int(query.data[len('retry_broadcast_'):])
+            job = await db.create_retry_job(broadcast_id, user_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            if job is None:
+                await query.message.reply_text("❌ Текст этой рассылки не сохранился, повтор невозможен.")
+                return
+            if not job.total:
+                await db.finish_broadcast_job(job.id, "done", job.created_at)
+                await query.message.reply_text("ℹ️ Нет получателей для повторной отправки.")
+                return
+
+            status_message = await query.message.reply_text(
+                f"🔁 Повторная отправка рассылки #{broadcast_id}...\n"
+                f"Прогресс: 0/{job.total}\n\n"
+                "Для отмены используйте команду /cancel_broadcast"
+            )
+            start_broadcast(context.application, job, status_message, update)
+        except Exception as e:
+            logger.error(f"Error retrying broadcast: {e}", exc_info=True)
+            await query.message.reply_text("❌ Произошла ошибка при повторной рассылке.")
+        return
+
     if query.data == 'confirm_broadcast':
         try:
             broadcast_data = context.user_data.get('broadcast_message')
@@ -182,98 +312,183 @@ async def broadcast_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 await query.edit_message_text("❌ Ошибка: сообщение для рассылки не найдено.")
                 return
             
-            # Получаем всех пользователей
-            users = db.get_all_users()
-            if not users:
+            # Задание рассылки сохраняется в базе вместе со списком получателей
+            job = await db.create_broadcast_job(
+                admin_id=user_id,
+                text=broadcast_data['text'],
+                parse_mode=broadcast_data['parse_mode'],
+                created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            )
+            if not job.total:
+                await db.finish_broadcast_job(job.id, "done", job.created_at)
                 await query.edit_message_text("ℹ️ Нет пользователей для рассылки.")
                 return
 
-            total_users = len(users)
-            sent_count = 0
-            failed_count = 0
-            failed_users = []
-
-            logger.info(f"Starting broadcast to {total_users} users")
-            
-            # Устанавливаем флаг активной рассылки
-            active_broadcasts[user_id] = True
-
             status_message = await query.message.reply_text(
                 "📨 Выполняется рассылка...\n"
-                f"Прогресс: 0/{total_users}\n\n"
+                f"Прогресс: 0/{job.total}\n\n"
                 "Для отмены используйте команду /cancel_broadcast"
             )
-
-            batch_size = 25  # Размер пакета для обновления статуса
-            last_update_time = datetime.now()
-
-            for i, user in enumerate(users, 1):
-                # Проверяем, не была ли отменена рассылка
-                if not active_broadcasts.get(user_id):
-                    logger.info("Broadcast was cancelled by admin")
-                    await status_message.edit_text("🛑 Рассылка прервана администратором.")
-                    return
-
-                try:
-                    await context.bot.send_message(
-                        chat_id=user[0],  # telegram_id
-                        text=broadcast_data['text'],
-                        parse_mode=broadcast_data['parse_mode']
-                    )
-                    sent_count += 1
-                    logger.debug(f"Message sent to user {user[0]}")
-                    # Добавляем задержку между отправками
-                    await asyncio.sleep(0.05)  # 50ms между сообщениями
-                except Exception as e:
-                    failed_count += 1
-                    failed_users.append(user[0])
-                    logger.error(f"Failed to send broadcast to user {user[0]}: {str(e)}")
-
-                # Обновляем статус каждые batch_size сообщений или каждые 3 секунды
-                current_time = datetime.now()
-                if i % batch_size == 0 or (current_time - last_update_time).seconds >= 3:
-                    try:
-                        await status_message.edit_text(
-                            "📨 Выполняется рассылка...\n"
-                            f"Прогресс: {i}/{total_users}\n"
-                            f"✅ Отправлено: {sent_count}\n"
-                            f"❌ Ошибок: {failed_count}"
-                        )
-                        last_update_time = current_time
-                    except Exception as e:
-                        logger.error(f"Failed to update status message: {str(e)}")
-
-            # Удаляем флаг активной рассылки
-            active_broadcasts.pop(user_id, None)
-
-            # Сохраняем результаты рассылки
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            try:
-                db.save_broadcast_results(
-                    admin_id=user_id,
-                    timestamp=timestamp,
-                    total_users=total_users,
-                    sent_count=sent_count,
-                    failed_count=failed_count,
-                    failed_users=failed_users
-                )
-                logger.info(f"Broadcast results saved: sent={sent_count}, failed={failed_count}")
-            except Exception as e:
-                logger.error(f"Failed to save broadcast results: {str(e)}")
-
-            result_text = (
-                "✅ Рассылка завершена\n\n"
-                f"📊 Статистика:\n"
-                f"- Всего пользователей: {total_users}\n"
-                f"- Успешно отправлено: {sent_count}\n"
-                f"- Ошибок отправки: {failed_count}\n\n"
-                f"📝 Результаты сохранены ({timestamp})"
-            )
-            await status_message.edit_text(result_text)
+            start_broadcast(context.application, job, status_message, update)
         except Exception as e:
             logger.error(f"Error during broadcast: {e}", exc_info=True)
             await query.message.reply_text("❌ Произошла ошибка при выполнении рассылки.")
 
+def start_broadcast(application, job: BroadcastJob, status_message: Optional[Message],
+                    update: Optional[object] = None) -> None:
+    """
+    Запускает задание рассылки фоновой задачей.
+
+    Рассылка идет в фоне, чтобы чат администратора мог обработать
+    /cancel_broadcast. Задание отмечается активным сразу, до первого
+    шага задачи, чтобы повторное подтверждение уже было отклонено.
+
+    Задача не передается application.create_task: Application.stop()
+    дожидался бы конца всей рассылки. Ее останавливает stop_broadcasts.
+    """
+    active_broadcasts[job.id] = job.admin_id
+    _track_task(run_broadcast_with_status(application.bot, job, status_message))
+
+def schedule_resume_broadcasts(application) -> None:
+    """Запускает в фоне resume_broadcasts (вызывается из post_init)."""
+    _track_task(resume_broadcasts(application))
+
+def _track_task(coroutine) -> asyncio.Task:
+    task = asyncio.create_task(coroutine)
+    broadcast_tasks.add(task)
+    task.add_done_callback(broadcast_tasks.discard)
+    return task
+
+async def stop_broadcasts() -> None:
+    """
+    Приостанавливает рассылки при остановке бота.
+
+    Уже начатые отправки завершаются, их итоги сохраняются, а задания
+    остаются в статусе running и продолжаются при следующем запуске.
+    Вызывается до закрытия базы (post_stop).
+    """
+    broadcast_shutdown.set()
+    # Задачи, запущенные во время ожидания, тоже нужно дождаться
+    while broadcast_tasks:
+        logger.info(f"Waiting for {len(broadcast_tasks)} broadcast tasks to pause")
+        await asyncio.gather(*broadcast_tasks, return_exceptions=True)
+
+async def run_broadcast_with_status(bot: Bot, job: BroadcastJob, status_message: Optional[Message]) -> None:
+    """
+    Выполняет задание рассылки и сохраняет итоги.
+
+    Ход рассылки показывается в status_message; None - рассылка идет без отчетов.
+    """
+    admin_id = job.admin_id
+    logger.info(f"Running broadcast job {job.id} for {job.total} users")
+    
+    # Устанавливаем флаг активной рассылки
+    active_broadcasts[job.id] = admin_id
+
+    async def report_progress(result: BroadcastResult) -> None:
+        await status_message.edit_text(
+            "📨 Выполняется рассылка...\n"
+            f"Прогресс: {result.processed}/{result.total}\n"
+            f"✅ Отправлено: {result.sent}\n"
+            f"❌ Ошибок: {result.failed_count}"
+        )
+
+    try:
+        result = await run_broadcast_job(
+            bot, job,
+            on_progress=report_progress if status_message is not None else None,
+            is_cancelled=lambda: job.id in cancelled_broadcasts
+        )
+    except Exception as e:
+        logger.error(f"Error in broadcast job {job.id}: {str(e)}", exc_info=True)
+        return
+    finally:
+        # Удаляем флаг активной рассылки
+        active_broadcasts.pop(job.id, None)
+        cancelled_broadcasts.discard(job.id)
+
+    if result.interrupted:
+        if status_message is not None:
+            await status_message.edit_text(
+                "⏸ Рассылка приостановлена: бот перезапускается.\n"
+                f"Отправлено: {result.sent} из {result.total}. "
+                "Рассылка продолжится после запуска бота."
+            )
+        return
+
+    if result.cancelled:
+        logger.info(f"Broadcast job {job.id} was cancelled by admin")
+
+    # Сохраняем результаты рассылки, в том числе прерванной: в истории
+    # остается то, что успели отправить, а статусы получателей удаляются
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        await db.save_broadcast_results(
+            admin_id=admin_id,
+            timestamp=timestamp,
+            total_users=result.total,
+            sent_count=result.sent,
+            failed_count=result.failed_count,
+            job_id=job.id
+        )
+        logger.info(f"Broadcast results saved: sent={result.sent}, failed={result.failed_count}")
+    except Exception as e:
+        logger.error(f"Failed to save broadcast results: {str(e)}")
+
+    if status_message is None:
+        return
+    if result.cancelled:
+        await status_message.edit_text(
+            "🛑 Рассылка прервана администратором.\n"
+            f"Отправлено: {result.sent} из {result.total}\n\n"
+            f"📝 Результаты сохранены ({timestamp})"
+        )
+        return
+    result_text = (
+        "✅ Рассылка завершена\n\n"
+        f"📊 Статистика:\n"
+        f"- Всего пользователей: {result.total}\n"
+        f"- Успешно отправлено: {result.sent}\n"
+        f"- Заблокировали бота: {result.blocked}\n"
+        f"- Чат не найден: {result.not_found}\n"
+        f"- Других ошибок: {result.failed}\n\n"
+        f"📝 Результаты сохранены ({timestamp})"
+    )
+    await status_message.edit_text(result_text)
+
+async def resume_broadcasts(application) -> None:
+    """
+    Продолжает рассылки, прерванные остановкой бота.
+
+    Запускается задачей из post_init и ждет, пока приложение запустится:
+    до Application.start() отправлять сообщения и запускать рассылки рано.
+    """
+    while not application.running:
+        if broadcast_shutdown.is_set():
+            return
+        await asyncio.sleep(RESUME_POLL_INTERVAL)
+
+    try:
+        jobs = await db.get_running_broadcast_jobs()
+    except Exception as e:
+        logger.error(f"Error loading broadcast jobs: {str(e)}")
+        return
+
+    for job in jobs:
+        if broadcast_shutdown.is_set():
+            return
+        logger.info(f"Resuming broadcast job {job.id}: {job.sent + job.blocked + job.not_found + job.failed}/{job.total} done")
+        try:
+            status_message = await application.bot.send_message(
+                chat_id=job.admin_id,
+                text="📨 Рассылка возобновлена после перезапуска бота...\n"
+                     "Для отмены используйте команду /cancel_broadcast"
+            )
+        except Exception as e:
+            logger.error(f"Failed to notify admin {job.admin_id} about resumed broadcast: {str(e)}")
+            status_message = None
+        start_broadcast(application, job, status_message)
+
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Отменяет текущую операцию."""
     user_id = update.effective_user.id
@@ -293,9 +508,10 @@ async def cancel_broadcast_command(update: Update, context: ContextTypes.DEFAULT
     if user_id not in ADMIN_IDS:
         return
 
-    if user_id in active_broadcasts:
-        active_broadcasts[user_id] = False
-        logger.info(f"Active broadcast cancelled by admin {user_id}")
+    jobs = [job_id for job_id, admin_id in active_broadcasts.items() if admin_id == user_id]
+    if jobs:
+        cancelled_broadcasts.update(jobs)
+        logger.info(f"Active broadcast jobs {jobs} cancelled by admin {user_id}")
         await update.message.reply_text("🛑 Отмена рассылки...")
     else:
         await update.message.reply_text("❌ Нет активной рассылки для отмены.")
@@ -303,7 +519,7 @@ async def cancel_broadcast_command(update: Update, context: ContextTypes.DEFAULT
 def register_admin_handlers(application):
     """Регистрирует обработчики административных команд."""
     application.add_handler(CommandHandler("admin", admin_menu))
-    application.add_handler(CallbackQueryHandler(admin_callback, pattern='^(admin_stats|export_users|broadcast_message)$'))
-    application.add_handler(CallbackQueryHandler(broadcast_callback, pattern='^(confirm_broadcast|cancel_broadcast)$'))
+    application.add_handler(CallbackQueryHandler(admin_callback, pattern='^(admin_stats|export_users|broadcast_message|broadcast_history)$'))
+    application.add_handler(CallbackQueryHandler(broadcast_callback, pattern='^(confirm_broadcast|cancel_broadcast|retry_broadcast_\\d+)$'))
     application.add_handler(CommandHandler("cancel", cancel_command))
     application.add_handler(CommandHandler("cancel_broadcast", cancel_broadcast_command)) 
\ No newline at end of file
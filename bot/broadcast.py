@@ -0,0 +1,291 @@
+"""
+Рассылка сообщений пользователям с учетом лимитов Telegram.
+
+Задания рассылки хранятся в базе: получатели обрабатываются пачками,
+итоги каждой пачки сохраняются, и после перезапуска бота задание
+продолжается с места остановки.
+
+Сообщения отправляются параллельно несколькими отправителями, а общий
+темп ограничивается корзиной токенов. При RetryAfter приостанавливается
+вся рассылка, а ошибки классифицируются: заблокировавшим бота и
+несуществующим чатам повторно не пишем, временные ошибки повторяем.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from .database import BroadcastJob, db
+from .stats import BROADCAST, stats
+
+logger = logging.getLogger(__name__)
+
+# Сообщений в секунду на всю рассылку (лимит Telegram - около 30)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Количество одновременных отправок
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+# Повторы при временных ошибках
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+# Сколько получателей обрабатывается между сохранениями прогресса задания
+BROADCAST_CHECKPOINT_SIZE = int(os.getenv("BROADCAST_CHECKPOINT_SIZE", "200"))
+# Как часто сообщать о ходе рассылки, секунды
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))
+
+# Результаты отправки одному пользователю
+SENT = "sent"
+BLOCKED = "blocked"  # пользователь заблокировал бота или удален
+NOT_FOUND = "not_found"  # чат не найден
+FAILED = "failed"  # прочие ошибки
+
+class TokenBucket:
+    """Корзина токенов: не больше rate операций в секунду с запасом capacity."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated: Optional[float] = None
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Дожидается свободного токена."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает выдачу токенов (после RetryAfter)."""
+        now = asyncio.get_running_loop().time()
+        self._resume_at = max(self._resume_at, now + seconds)
+        self._tokens = 0
+
+# Выставляется при остановке бота: задания прерываются между отправками,
+# остаются в статусе running и продолжаются после перезапуска
+broadcast_shutdown = asyncio.Event()
+
+# Общий темп всех рассылок бота: лимит Telegram действует на бота целиком,
+# поэтому одновременные рассылки делят одну корзину
+broadcast_bucket = TokenBucket(BROADCAST_RATE)
+
+def classify_error(error: Exception) -> str:
+    """Определяет, почему не удалось отправить сообщение."""
+    if isinstance(error, Forbidden):
+        return BLOCKED
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if "chat not found" in message or "user not found" in message:
+            return NOT_FOUND
+        if "deactivated" in message:
+            return BLOCKED
+    return FAILED
+
+@dataclass
+class BroadcastResult:
+    """Итоги рассылки."""
+    total: int = 0
+    sent: int = 0
+    blocked: int = 0
+    not_found: int = 0
+    failed: int = 0
+    cancelled: bool = False
+    # Рассылка приостановлена остановкой бота и продолжится после перезапуска
+    interrupted: bool = False
+    failed_users: List[int] = field(default_factory=list)
+    # Итог по каждому обработанному получателю: (telegram_id, статус)
+    statuses: List[Tuple[int, str]] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed_count
+
+    @property
+    def failed_count(self) -> int:
+        return self.blocked + self.not_found + self.failed
+
+ProgressCallback = Callable[[BroadcastResult], Awaitable[None]]
+
+class Broadcaster:
+    """Отправляет одно сообщение многим пользователям."""
+
+    def __init__(self, bot: Bot, bucket: Optional[TokenBucket] = None,
+                 concurrency: int = BROADCAST_CONCURRENCY,
+                 max_retries: int = BROADCAST_MAX_RETRIES):
+        """
+        Args:
+            bot: Бот, от имени которого идет рассылка
+            bucket: Корзина токенов; по умолчанию общая broadcast_bucket
+            concurrency: Количество одновременных отправок
+            max_retries: Повторы при временных ошибках
+        """
+        self.bot = bot
+        self.bucket = bucket if bucket is not None else broadcast_bucket
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+    async def send(self, chat_id: int, text: str, parse_mode: Optional[str] = None) -> str:
+        """Отправляет сообщение одному пользователю с повторами и возвращает результат."""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return SENT
+            except RetryAfter as e:
+                # Лимит превышен: ждет вся рассылка, а попытка не считается
+                logger.warning(f"Flood limit hit, pausing broadcast for {e.retry_after}s")
+                self.bucket.pause(float(e.retry_after))
+            except (Forbidden, BadRequest) as e:
+                status = classify_error(e)
+                logger.debug(f"Broadcast to {chat_id} failed ({status}): {str(e)}")
+                return status
+            except NetworkError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Failed to send broadcast to user {chat_id}: {str(e)}")
+                    return FAILED
+                await asyncio.sleep(2 ** (attempt - 1))
+            except Exception as e:
+                logger.error(f"Failed to send broadcast to user {chat_id}: {str(e)}")
+                return FAILED
+
+    async def run(self, chat_ids: Iterable[int], text: str, parse_mode: Optional[str] = None,
+                  total: Optional[int] = None, on_progress: Optional[ProgressCallback] = None,
+                  is_cancelled: Optional[Callable[[], bool]] = None) -> BroadcastResult:
+        """
+        Рассылает сообщение.
+
+        Args:
+            chat_ids: Получатели (можно передать ленивый итератор)
+            text: Текст сообщения
+            parse_mode: Режим разметки
+            total: Количество получателей, если chat_ids не список
+            on_progress: Корутина, которая раз в BROADCAST_PROGRESS_INTERVAL
+                         секунд получает текущие итоги
+            is_cancelled: Проверка отмены; при отмене новые отправки не начинаются
+        """
+        if total is None:
+            chat_ids = list(chat_ids)
+            total = len(chat_ids)
+        result = BroadcastResult(total=total)
+        recipients = iter(chat_ids)
+
+        async def worker() -> None:
+            for chat_id in recipients:
+                if is_cancelled is not None and is_cancelled():
+                    result.cancelled = True
+                    return
+                status = await self.send(chat_id, text, parse_mode)
+                result.statuses.append((chat_id, status))
+                if status == SENT:
+                    result.sent += 1
+                else:
+                    setattr(result, status, getattr(result, status) + 1)
+                    result.failed_users.append(chat_id)
+
+        async def reporter() -> None:
+            while True:
+                await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+                try:
+                    await on_progress(result)
+                except Exception as e:
+                    logger.error(f"Failed to report broadcast progress: {str(e)}")
+
+        logger.info(f"Starting broadcast to {total} users")
+        progress_task = asyncio.create_task(reporter()) if on_progress is not None else None
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            if progress_task is not None:
+                progress_task.cancel()
+        logger.info(f"Broadcast finished: sent={result.sent}, blocked={result.blocked}, "
+                    f"not_found={result.not_found}, failed={result.failed}")
+        return result
+
+def _job_result(job: BroadcastJob) -> BroadcastResult:
+    return BroadcastResult(total=job.total, sent=job.sent, blocked=job.blocked,
+                           not_found=job.not_found, failed=job.failed)
+
+async def run_broadcast_job(bot: Bot, job: BroadcastJob, on_progress: Optional[ProgressCallback] = None,
+                            is_cancelled: Optional[Callable[[], bool]] = None) -> BroadcastResult:
+    """
+    Выполняет (или продолжает) задание рассылки.
+
+    Получатели берутся пачками по BROADCAST_CHECKPOINT_SIZE: пачка отмечается
+    взятой в работу, рассылается, и итоги сохраняются одной транзакцией.
+    Получатели, взятые в работу прошлым запуском, который не успел сохранить
+    итоги, считаются неудачными - так никто не получит сообщение дважды.
+
+    При остановке бота (broadcast_shutdown) новые отправки не начинаются,
+    итоги отправленного сохраняются, неотправленные получатели пачки
+    возвращаются в ожидание, а задание остается в статусе running.
+
+    Returns:
+        BroadcastResult: итоги всего задания, включая прошлые запуски;
+        неудачные получатели остаются в базе и в failed_users не попадают
+    """
+    await db.release_broadcast_claims(job.id, lost=True)
+    job = await db.get_broadcast_job(job.id)
+    done = _job_result(job)
+    broadcaster = Broadcaster(bot)
+
+    async def report_batch(batch: BroadcastResult) -> None:
+        await on_progress(BroadcastResult(
+            total=done.total,
+            sent=done.sent + batch.sent,
+            blocked=done.blocked + batch.blocked,
+            not_found=done.not_found + batch.not_found,
+            failed=done.failed + batch.failed
+        ))
+
+    def cancelled() -> bool:
+        return is_cancelled is not None and is_cancelled()
+
+    def stopped() -> bool:
+        return cancelled() or broadcast_shutdown.is_set()
+
+    while True:
+        if stopped():
+            done.cancelled = cancelled()
+            done.interrupted = not done.cancelled
+            break
+        recipients = await db.claim_broadcast_recipients(job.id, BROADCAST_CHECKPOINT_SIZE)
+        if not recipients:
+            break
+        batch = await broadcaster.run(recipients, job.text, job.parse_mode,
+                                      on_progress=report_batch if on_progress is not None else None,
+                                      is_cancelled=stopped)
+        await db.checkpoint_broadcast(job.id, batch.statuses)
+        for status in (SENT, BLOCKED, NOT_FOUND, FAILED):
+            setattr(done, status, getattr(done, status) + getattr(batch, status))
+            stats.increment(BROADCAST, status, getattr(batch, status))
+        if batch.cancelled:
+            done.cancelled = cancelled()
+            done.interrupted = not done.cancelled
+            # Неотправленные получатели пачки возвращаются в ожидание
+            await db.release_broadcast_claims(job.id, lost=False)
+            break
+
+    if done.interrupted:
+        logger.info(f"Broadcast job {job.id} interrupted by shutdown, will resume after restart")
+        return done
+
+    finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    await db.finish_broadcast_job(job.id, "cancelled" if done.cancelled else "done", finished_at)
+    return done
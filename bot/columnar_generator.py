@@ -0,0 +1,412 @@
+"""
+Колоночная генерация больших наборов пользователей на NumPy.
+
+Используется для офлайн-подготовки синтетических наборов данных, когда
+нужно намного больше пользователей, чем бот выдает за один запрос.
+Все поля разыгрываются векторно и хранятся компактными массивами индексов
+в справочники UserGenerator; словари строятся только по запросу.
+"""
+import logging
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+from .password_generator import parse_password_settings
+from .user_generator import UserGenerator
+from .user_settings import PASSWORD_CHARSETS
+
+logger = logging.getLogger(__name__)
+
+GENDERS = ["male", "female"]
+
+# Количество слотов username: до 4 социальных сетей и логин
+_USERNAME_SLOTS = 5
+_USERNAME_SUFFIXES = ["_official", "_real", "_original", "_me"]
+
+class _Table:
+    """Справочник из нескольких списков, склеенных в один массив."""
+
+    def __init__(self, lists: List[List[str]]):
+        flat = [value for values in lists for value in values]
+        # Значения могут быть списками, поэтому массив заполняется поэлементно
+        self.values = np.empty(len(flat), dtype=object)
+        self.values[:] = flat
+        self.sizes = np.array([len(values) for values in lists], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(self.sizes)[:-1])).astype(np.int64)
+
+    def draw(self, rng: np.random.Generator, groups: np.ndarray) -> np.ndarray:
+        """Разыгрывает по одному индексу из списка группы каждой строки."""
+        local = (rng.random(len(groups)) * self.sizes[groups]).astype(np.int64)
+        return (self.offsets[groups] + local).astype(_index_dtype(len(self.values)))
+
+def _index_dtype(size: int) -> type:
+    """Подбирает минимальный целочисленный тип для индексов справочника."""
+    return np.int16 if size < 2 ** 15 else np.int32
+
+@lru_cache(maxsize=1)
+def _tables() -> Dict[str, Union[_Table, list]]:
+    """Строит справочники из данных UserGenerator (один раз за процесс)."""
+    codes = UserGenerator.get_available_countries()
+    countries = [UserGenerator._countries[code] for code in codes]
+
+    def by_country(source: Dict[str, List[str]]) -> _Table:
+        return _Table([source[code] for code in codes])
+
+    names = {}
+    for kind in ("first_names", "last_names"):
+        # Группа имени = страна * 2 + пол
+        names[kind] = _Table([
+            country[f"{kind}_{gender}"] for country in countries for gender in GENDERS
+        ])
+    phone_codes = {"RU": UserGenerator._ru_phone_operators, "US": UserGenerator._us_area_codes}
+
+    return {
+        "codes": codes,
+        "country_names": np.array([country["name"] for country in countries], dtype=object),
+        "phone_prefixes": [country["phone_prefix"] for country in countries],
+        "first_names": names["first_names"],
+        "last_names": names["last_names"],
+        "cities": _Table([country["cities"] for country in countries]),
+        "streets": _Table([country["streets"] for country in countries]),
+        "street_suffixes": _Table([UserGenerator._countries["US"]["street_suffixes"]]),
+        "states": _Table([UserGenerator._countries["US"]["states"]]),
+        "phone_codes": _Table([phone_codes.get(code, []) for code in codes]),
+        "email_domains": by_country(UserGenerator._email_domains),
+        "education_levels": by_country(UserGenerator._education_levels),
+        "universities": by_country(UserGenerator._universities),
+        "occupations": by_country(UserGenerator._occupations),
+        "marital_status": by_country(UserGenerator._marital_status),
+        "languages": by_country(UserGenerator._languages),
+        "hobbies": by_country(UserGenerator._hobbies),
+        "blood_types": np.array(UserGenerator._blood_types, dtype=object),
+        "social_media": _Table([
+            [list(sample) for sample in UserGenerator._social_media_samples[size]]
+            for size in (2, 3, 4)
+        ]),
+    }
+
+def _name_slugs(table: _Table) -> List[str]:
+    """Транслитерированные имена справочника в том же порядке."""
+    slugs = UserGenerator._get_slugs()
+    return [slugs[name] for name in table.values]
+
+def _draw_distinct(rng: np.random.Generator, table: _Table, groups: np.ndarray,
+                   sizes: np.ndarray, width: int) -> np.ndarray:
+    """
+    Разыгрывает выборки без повторений переменного размера.
+
+    Возвращает матрицу локальных индексов (count x width), где лишние
+    позиции строки заполнены -1. Строки с повторами разыгрываются заново.
+    """
+    count = len(groups)
+    population = table.sizes[groups][:, None]
+    picked = (rng.random((count, width)) * population).astype(np.int8)
+    valid = np.arange(width)[None, :] < sizes[:, None]
+
+    while True:
+        duplicates = np.zeros(count, dtype=bool)
+        for a in range(width):
+            for b in range(a + 1, width):
+                duplicates |= (picked[:, a] == picked[:, b]) & valid[:, b]
+        rows = np.flatnonzero(duplicates)
+        if not len(rows):
+            break
+        picked[rows] = (rng.random((len(rows), width)) * population[rows]).astype(np.int8)
+
+    picked[~valid] = -1
+    return picked
+
+def _draw_passwords(rng: np.random.Generator, password_settings: Optional[str],
+                    count: int) -> Dict[str, np.ndarray]:
+    """Генерирует пароли матрицей ASCII-байт с длинами строк."""
+    charsets, min_length, max_length = parse_password_settings(password_settings)
+    if max_length > np.iinfo(np.uint16).max:
+        raise ValueError(f"Password length is too large: {max_length}")
+    available = "".join(PASSWORD_CHARSETS[charset] for charset in charsets)
+    width = max(max_length, len(charsets))
+
+    lengths = np.maximum(rng.integers(min_length, max_length + 1, size=count), len(charsets))
+    alphabet = np.frombuffer(available.encode("ascii"), dtype=np.uint8)
+    chars = alphabet[rng.integers(0, len(alphabet), size=(count, width))]
+
+    # Обязательные символы ставятся на случайные различные позиции строки
+    keys = rng.random((count, width), dtype=np.float32)
+    keys[np.arange(width)[None, :] >= lengths[:, None]] = np.inf
+    positions = np.argsort(keys, axis=1)[:, :len(charsets)]
+    rows = np.arange(count)
+    for column, charset in enumerate(charsets):
+        required = np.frombuffer(PASSWORD_CHARSETS[charset].encode("ascii"), dtype=np.uint8)
+        chars[rows, positions[:, column]] = required[rng.integers(0, len(required), size=count)]
+
+    chars[np.arange(width)[None, :] >= lengths[:, None]] = 0
+    return {"password": chars, "password_length": lengths.astype(np.uint16)}
+
+def _draw_usernames(rng: np.random.Generator, count: int) -> Dict[str, np.ndarray]:
+    """Разыгрывает параметры username для всех слотов всех строк."""
+    shape = (count, _USERNAME_SLOTS)
+    # 50% без добавки, 35% цифры, по 3.75% на каждое слово-суффикс
+    suffix = np.zeros(shape, dtype=np.uint8)
+    roll = rng.random(shape)
+    suffix[(roll >= 0.5) & (roll < 0.85)] = 1
+    words = roll >= 0.85
+    suffix[words] = 2 + rng.integers(0, len(_USERNAME_SUFFIXES), size=int(words.sum()))
+    return {
+        "username_variant": rng.integers(0, 7, size=shape, dtype=np.uint8),
+        "username_number": rng.integers(1, 1000, size=shape, dtype=np.int16),
+        "username_suffix": suffix,
+        "username_suffix_number": rng.integers(1, 10000, size=shape, dtype=np.int16),
+    }
+
+def generate_columns(count: int, nationalities: Optional[List[str]] = None,
+                     gender: Optional[str] = None, password_settings: Optional[str] = None,
+                     seed: Optional[int] = None) -> "UserColumns":
+    """
+    Генерирует пользователей в колоночном виде.
+
+    Args:
+        count: Количество пользователей
+        nationalities: Коды стран или None для всех доступных стран
+        gender: "male", "female" или None для случайного пола
+        password_settings: Строка настроек пароля
+        seed: Зерно генератора случайных чисел
+
+    Returns:
+        UserColumns: Колонки сгенерированных пользователей
+    """
+    tables = _tables()
+    rng = np.random.default_rng(seed)
+    today = np.datetime64("today", "D")
+
+    allowed = UserGenerator._normalize_countries(nationalities)
+    allowed_index = np.array([tables["codes"].index(code) for code in allowed], dtype=np.uint8)
+    country = allowed_index[rng.integers(0, len(allowed_index), size=count)]
+    if gender in GENDERS:
+        genders = np.full(count, GENDERS.index(gender), dtype=np.uint8)
+    else:
+        genders = rng.integers(0, 2, size=count, dtype=np.uint8)
+    name_group = country.astype(np.int64) * 2 + genders
+
+    # Возраст - int() от нормального распределения, ограниченного 18-90 годами
+    probabilities = np.diff(np.concatenate(([0.0], UserGenerator._age_cum_weights)))
+    ages = rng.choice(np.arange(18, 91), size=count, p=probabilities / probabilities.sum())
+    birth_date = today - 365 * ages + rng.integers(0, 366, size=count)
+    birth_year = birth_date.astype("datetime64[Y]").astype(np.int64) + 1970
+    today_year = today.astype("datetime64[Y]").astype(np.int64) + 1970
+
+    language_counts = rng.integers(1, 4, size=count)
+    hobby_counts = rng.integers(2, 5, size=count)
+    platform_counts = rng.integers(2, 5, size=count)
+
+    columns = {
+        "country": country,
+        "gender": genders,
+        "first_name": tables["first_names"].draw(rng, name_group),
+        "last_name": tables["last_names"].draw(rng, name_group),
+        "city": tables["cities"].draw(rng, country),
+        "street": tables["streets"].draw(rng, country),
+        "house": rng.integers(1, 151, size=count, dtype=np.uint8),
+        "apartment": rng.integers(1, 101, size=count, dtype=np.uint8),
+        "street_suffix": tables["street_suffixes"].draw(rng, np.zeros(count, dtype=np.int64)),
+        "state": tables["states"].draw(rng, np.zeros(count, dtype=np.int64)),
+        "postal_code": rng.integers(10000, 100000, size=count, dtype=np.int32),
+        "phone_code": tables["phone_codes"].draw(rng, country),
+        "phone_number": rng.integers(0, 10 ** 9, size=count, dtype=np.int64),
+        "email_variant": rng.integers(0, 5, size=count, dtype=np.uint8),
+        "email_number": np.where(rng.random(count) < 0.7, rng.integers(1, 10000, size=count), 0).astype(np.int16),
+        "email_domain": tables["email_domains"].draw(rng, country),
+        "birth_date": birth_date,
+        "age": (today_year - birth_year).astype(np.uint8),
+        "height": rng.integers(150, 201, size=count, dtype=np.uint8),
+        "weight": rng.integers(45, 121, size=count, dtype=np.uint8),
+        "blood_type": rng.integers(0, len(tables["blood_types"]), size=count, dtype=np.uint8),
+        "education_level": tables["education_levels"].draw(rng, country),
+        "university": tables["universities"].draw(rng, country),
+        "graduation_year": (today_year - rng.integers(0, 41, size=count)).astype(np.int16),
+        "occupation": tables["occupations"].draw(rng, country),
+        "marital_status": tables["marital_status"].draw(rng, country),
+        "languages": _draw_distinct(rng, tables["languages"], country, language_counts, 3),
+        "hobbies": _draw_distinct(rng, tables["hobbies"], country, hobby_counts, 4),
+        "social_media": tables["social_media"].draw(rng, platform_counts - 2),
+    }
+    columns.update(_draw_usernames(rng, count))
+    columns.update(_draw_passwords(rng, password_settings, count))
+    return UserColumns(count, columns)
+
+class UserColumns:
+    """
+    Пользователи в колоночном виде.
+
+    Колонки - массивы NumPy, в основном индексы в справочники; строки
+    и словари строятся только по запросу через column(), row() или iter_rows().
+    """
+
+    # Колонки, которые декодируются простым обращением к справочнику
+    _categorical = {
+        "first_name": "first_names",
+        "last_name": "last_names",
+        "city": "cities",
+        "street": "streets",
+        "education_level": "education_levels",
+        "university": "universities",
+        "occupation": "occupations",
+        "marital_status": "marital_status",
+    }
+
+    def __init__(self, count: int, columns: Dict[str, np.ndarray]):
+        self.count = count
+        self.columns = columns
+        self._tables = _tables()
+        self._first_slugs = None
+        self._last_slugs = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        """Объем памяти, занимаемый колонками."""
+        return sum(column.nbytes for column in self.columns.values())
+
+    def column(self, name: str) -> np.ndarray:
+        """Возвращает колонку с декодированными значениями."""
+        values = self.columns[name]
+        if name in self._categorical:
+            return self._tables[self._categorical[name]].values[values]
+        if name == "country":
+            return self._tables["country_names"][values]
+        if name == "gender":
+            return np.array(GENDERS, dtype=object)[values]
+        if name == "blood_type":
+            return self._tables["blood_types"][values]
+        if name == "birth_date":
+            return np.datetime_as_string(values, unit="D")
+        return values
+
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict]:
+        """Лениво строит словари пользователей в формате UserGenerator."""
+        stop = self.count if stop is None else min(stop, self.count)
+        for index in range(start, stop):
+            yield self.row(index)
+
+    def to_dicts(self) -> List[Dict]:
+        """Строит словари всех пользователей."""
+        return list(self.iter_rows())
+
+    def row(self, index: int) -> Dict[str, Union[str, int, List[str], Dict]]:
+        """Строит словарь одного пользователя в формате UserGenerator."""
+        c = self.columns
+        t = self._tables
+        if self._first_slugs is None:
+            self._first_slugs = _name_slugs(t["first_names"])
+            self._last_slugs = _name_slugs(t["last_names"])
+
+        country = int(c["country"][index])
+        first_slug = self._first_slugs[c["first_name"][index]]
+        last_slug = self._last_slugs[c["last_name"][index]]
+        platforms = t["social_media"].values[c["social_media"][index]]
+        usernames = [self._username(index, slot, first_slug, last_slug) for slot in range(len(platforms))]
+        languages = t["languages"].values[t["languages"].offsets[country] + c["languages"][index]]
+        hobbies = t["hobbies"].values[t["hobbies"].offsets[country] + c["hobbies"][index]]
+        password_length = int(c["password_length"][index])
+
+        return {
+            "gender": GENDERS[c["gender"][index]],
+            "first_name": t["first_names"].values[c["first_name"][index]],
+            "last_name": t["last_names"].values[c["last_name"][index]],
+            "address": self._address(index, country),
+            "email": self._email(index, first_slug, last_slug),
+            "phone": self._phone(index, country),
+            "birth_date": str(c["birth_date"][index]),
+            "age": int(c["age"][index]),
+            "physical": {
+                "height": int(c["height"][index]),
+                "weight": int(c["weight"][index]),
+                "blood_type": t["blood_types"][c["blood_type"][index]]
+            },
+            "education": {
+                "level": t["education_levels"].values[c["education_level"][index]],
+                "university": t["universities"].values[c["university"][index]],
+                "graduation_year": int(c["graduation_year"][index])
+            },
+            "occupation": t["occupations"].values[c["occupation"][index]],
+            "languages": [value for value, picked in zip(languages, c["languages"][index]) if picked >= 0],
+            "hobbies": [value for value, picked in zip(hobbies, c["hobbies"][index]) if picked >= 0],
+            "marital_status": t["marital_status"].values[c["marital_status"][index]],
+            "social_media": dict(zip(platforms, usernames)),
+            "login": {
+                "username": self._username(index, _USERNAME_SLOTS - 1, first_slug, last_slug),
+                "password": c["password"][index, :password_length].tobytes().decode("ascii")
+            },
+            "country": t["country_names"][country]
+        }
+
+    def _address(self, index: int, country: int) -> str:
+        c = self.columns
+        t = self._tables
+        code = t["codes"][country]
+        city = t["cities"].values[c["city"][index]]
+        street = t["streets"].values[c["street"][index]]
+        house = c["house"][index]
+        if code == "RU":
+            return f"г. {city}, ул. {street}, д. {house}, кв. {c['apartment'][index]}"
+        elif code == "US":
+            suffix = t["street_suffixes"].values[c["street_suffix"][index]]
+            state = t["states"].values[c["state"][index]]
+            return f"{house} {street} {suffix}, {city}, {state} {c['postal_code'][index]}"
+        return f"{house} {street} St., {city}"
+
+    def _phone(self, index: int, country: int) -> str:
+        t = self._tables
+        code = t["codes"][country]
+        prefix = t["phone_prefixes"][country]
+        number = int(self.columns["phone_number"][index])
+        if code == "RU":
+            operator = t["phone_codes"].values[self.columns["phone_code"][index]]
+            return f"{prefix} {operator} {100 + number % 900}-{10 + number // 900 % 90}-{10 + number // 81000 % 90}"
+        elif code == "US":
+            area_code = t["phone_codes"].values[self.columns["phone_code"][index]]
+            return f"{prefix} ({area_code}) {100 + number % 900}-{1000 + number // 900 % 9000}"
+        return f"{prefix} {100000000 + number % 900000000}"
+
+    def _email(self, index: int, first: str, last: str) -> str:
+        c = self.columns
+        variant = c["email_variant"][index]
+        if variant == 0:
+            username = f"{first}{last}"
+        elif variant == 1:
+            username = f"{first}.{last}"
+        elif variant == 2:
+            username = f"{first[0]}{last}"
+        elif variant == 3:
+            username = f"{first}{last[:3]}"
+        else:
+            username = f"{first[:3]}{last[:3]}"
+        if c["email_number"][index]:
+            username += str(c["email_number"][index])
+        return f"{username}@{self._tables['email_domains'].values[c['email_domain'][index]]}"
+
+    def _username(self, index: int, slot: int, first: str, last: str) -> str:
+        c = self.columns
+        variant = c["username_variant"][index, slot]
+        if variant == 0:
+            username = f"{first}{last}"
+        elif variant == 1:
+            username = f"{first}_{last}"
+        elif variant == 2:
+            username = f"{first}.{last}"
+        elif variant == 3:
+            username = f"{first[0]}{last}"
+        elif variant == 4:
+            username = f"the_{first}"
+        elif variant == 5:
+            username = f"real_{first}"
+        else:
+            username = f"{first}{c['username_number'][index, slot]}"
+
+        suffix = c["username_suffix"][index, slot]
+        if suffix == 1:
+            username += str(c["username_suffix_number"][index, slot])
+        elif suffix > 1:
+            username += _USERNAME_SUFFIXES[suffix - 2]
+        return username
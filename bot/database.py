@@ -2,15 +2,115 @@ from sqlalchemy import create_engine, Column, Integer, String, Boolean, BigInteg
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import asyncio
 import sqlite3
 import json
 import logging
-from typing import List, Optional
-from .user_settings import UserSettings
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from .user_settings import (
+    UserSettings, AVAILABLE_NATIONALITIES, AVAILABLE_FIELDS, EXTENDED_FIELDS, encode_mask, decode_mask
+)
+from .password_generator import encode_password_policy, decode_password_policy
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 logger = logging.getLogger(__name__)
 
+# Количество постоянных соединений с базой
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Размер страницы при обходе таблицы пользователей
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "1000"))
+
+# Запросы вынесены в константы: sqlite3 кэширует подготовленные выражения
+# по тексту запроса, и одинаковый текст переиспользует их между вызовами
+_UPSERT_USER = 'INSERT OR REPLACE INTO users (telegram_id, username) VALUES (?, ?)'
+_UPSERT_SETTINGS = '''INSERT OR REPLACE INTO user_settings 
+                      (telegram_id, gender, nationality_mask, password_min, password_max,
+                       password_charsets, results_count, include_mask, exclude_mask,
+                       output_format, compression)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+def _settings_row(settings: UserSettings) -> tuple:
+    """Параметры _UPSERT_SETTINGS для настроек пользователя."""
+    return (settings.telegram_id,
+            settings.gender,
+            encode_mask(settings.nationality, AVAILABLE_NATIONALITIES),
+            *encode_password_policy(settings.password_settings),
+            settings.results_count,
+            encode_mask(settings.include_fields, AVAILABLE_FIELDS),
+            encode_mask(settings.exclude_fields, AVAILABLE_FIELDS),
+            settings.output_format,
+            settings.compression)
+
+_SELECT_SETTINGS = '''SELECT telegram_id, gender, nationality_mask, password_min, password_max,
+                              password_charsets, results_count, include_mask, exclude_mask,
+                              output_format, compression
+                       FROM user_settings WHERE telegram_id = ?'''
+
+def _settings_from_row(row: tuple) -> UserSettings:
+    """Восстанавливает настройки пользователя из строки _SELECT_SETTINGS."""
+    return UserSettings(
+        telegram_id=row[0],
+        gender=row[1],
+        nationality=decode_mask(row[2], AVAILABLE_NATIONALITIES),
+        password_settings=decode_password_policy(row[3], row[4], row[5]),
+        results_count=row[6],
+        include_fields=decode_mask(row[7], AVAILABLE_FIELDS),
+        exclude_fields=decode_mask(row[8], AVAILABLE_FIELDS),
+        output_format=row[9] or "text",
+        compression=row[10] or "auto"
+    )
+
+# Постраничный обход по первичному ключу: каждая страница - поиск по индексу
+# от последнего telegram_id, без OFFSET и без чтения всей таблицы
+_SELECT_USERS_PAGE = '''SELECT telegram_id, username FROM users
+                        WHERE telegram_id > ? ORDER BY telegram_id LIMIT ?'''
+# Та же страница вместе с настройками для выгрузки пользователей
+_SELECT_USERS_EXPORT_PAGE = '''SELECT u.telegram_id, u.username, s.gender, s.nationality_mask,
+                                      s.results_count, s.output_format, s.compression
+                               FROM users u LEFT JOIN user_settings s USING (telegram_id)
+                               WHERE u.telegram_id > ? ORDER BY u.telegram_id LIMIT ?'''
+# Заголовок выгрузки пользователей, по столбцу на значение get_users_export_page
+USER_EXPORT_COLUMNS = ['ID', 'Username', 'Gender', 'Nationality', 'Results count', 'Output format', 'Compression']
+_SELECT_USER_STATS = """SELECT (SELECT COUNT(*) FROM users),
+                               (SELECT COUNT(*) FROM broadcast_jobs WHERE status = 'running')"""
+_SELECT_JOB = '''SELECT id, admin_id, text, parse_mode, status, created_at,
+                        total, sent, blocked, not_found, failed
+                 FROM broadcast_jobs WHERE id = ?'''
+_CLAIM_RECIPIENTS = '''UPDATE broadcast_recipients SET status = 'claimed'
+                       WHERE job_id = ? AND telegram_id IN (
+                           SELECT telegram_id FROM broadcast_recipients
+                           WHERE job_id = ? AND status IS NULL
+                           ORDER BY telegram_id LIMIT ?)
+                       RETURNING telegram_id'''
+_UPDATE_RECIPIENT = '''UPDATE broadcast_recipients SET status = ?
+                       WHERE job_id = ? AND telegram_id = ?'''
+_UPDATE_JOB_COUNTERS = '''UPDATE broadcast_jobs
+                          SET sent = sent + ?, blocked = blocked + ?,
+                              not_found = not_found + ?, failed = failed + ?
+                          WHERE id = ?'''
+_INSERT_BROADCAST = '''INSERT INTO broadcast_history 
+                       (admin_id, timestamp, total_users, sent_count, failed_count, job_id)
+                       VALUES (?, ?, ?, ?, ?, ?)'''
+# Неудачные получатели задания переносятся в историю с классом ошибки
+_INSERT_BROADCAST_FAILURES = """INSERT INTO broadcast_failures (broadcast_id, error, telegram_id)
+                                SELECT ?, status, telegram_id FROM broadcast_recipients
+                                WHERE job_id = ? AND status IN ('blocked', 'not_found', 'failed')"""
+_SELECT_BROADCAST_FAILURE_COUNTS = '''SELECT error, COUNT(*) FROM broadcast_failures
+                                      WHERE broadcast_id = ? GROUP BY error'''
+_INSERT_ACTIVE_USER = 'INSERT OR IGNORE INTO daily_active_users (day, telegram_id) VALUES (?, ?)'
+_UPSERT_STAT = '''INSERT INTO stats_daily (day, metric, key, value) VALUES (?, ?, ?, ?)
+                  ON CONFLICT (day, metric, key) DO UPDATE SET value = value + excluded.value'''
+_SELECT_STATS = '''SELECT day, metric, key, value FROM stats_daily
+                   WHERE day >= ? ORDER BY day, metric, key'''
+_SELECT_BROADCASTS = '''SELECT id, admin_id, timestamp, total_users, sent_count, failed_count, job_id
+                        FROM broadcast_history ORDER BY timestamp DESC LIMIT ?'''
+
 Base = declarative_base()
 
 class User(Base):
@@ -27,6 +127,189 @@ class Settings(Base):
     id = Column(Integer, primary_key=True)
     channel_id = Column(String, nullable=False)
 
+def _migration_base_schema(c: sqlite3.Cursor) -> None:
+    """1: исходные таблицы и столбцы формата вывода и сжатия."""
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                (telegram_id INTEGER PRIMARY KEY, username TEXT)''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS user_settings
+                (telegram_id INTEGER PRIMARY KEY,
+                 gender TEXT,
+                 nationality TEXT,
+                 password_settings TEXT,
+                 results_count INTEGER,
+                 include_fields TEXT,
+                 exclude_fields TEXT,
+                 FOREIGN KEY (telegram_id) REFERENCES users(telegram_id))''')
+    
+    # Базы до введения версий могли уже получить эти столбцы
+    c.execute("PRAGMA table_info(user_settings)")
+    columns = {row[1] for row in c.fetchall()}
+    for column, definition in (("output_format", "TEXT DEFAULT 'text'"),
+                               ("compression", "TEXT DEFAULT 'auto'")):
+        if column not in columns:
+            c.execute(f"ALTER TABLE user_settings ADD COLUMN {column} {definition}")
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS broadcast_history
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 admin_id INTEGER NOT NULL,
+                 timestamp TEXT NOT NULL,
+                 total_users INTEGER NOT NULL,
+                 sent_count INTEGER NOT NULL,
+                 failed_count INTEGER NOT NULL,
+                 failed_users TEXT,
+                 FOREIGN KEY (admin_id) REFERENCES users(telegram_id))''')
+
+def _migration_compact_settings(c: sqlite3.Cursor) -> None:
+    """2: списки настроек - битовые маски, настройки пароля - разобранные поля."""
+    c.execute('''CREATE TABLE user_settings_compact
+                (telegram_id INTEGER PRIMARY KEY,
+                 gender TEXT,
+                 nationality_mask INTEGER NOT NULL DEFAULT 0,
+                 password_min INTEGER,
+                 password_max INTEGER,
+                 password_charsets INTEGER,
+                 results_count INTEGER,
+                 include_mask INTEGER NOT NULL DEFAULT 0,
+                 exclude_mask INTEGER NOT NULL DEFAULT 0,
+                 output_format TEXT DEFAULT 'text',
+                 compression TEXT DEFAULT 'auto',
+                 FOREIGN KEY (telegram_id) REFERENCES users(telegram_id))''')
+    
+    c.execute('''SELECT telegram_id, gender, nationality, password_settings, results_count,
+                        include_fields, exclude_fields, output_format, compression
+                 FROM user_settings''')
+    settings = [
+        UserSettings(
+            telegram_id=row[0],
+            gender=row[1],
+            nationality=json.loads(row[2]) if row[2] else None,
+            password_settings=row[3],
+            results_count=row[4],
+            include_fields=json.loads(row[5]) if row[5] else None,
+            exclude_fields=json.loads(row[6]) if row[6] else None,
+            output_format=row[7] or "text",
+            compression=row[8] or "auto"
+        )
+        for row in c.fetchall()
+    ]
+    c.executemany('''INSERT INTO user_settings_compact
+                     (telegram_id, gender, nationality_mask, password_min, password_max,
+                      password_charsets, results_count, include_mask, exclude_mask,
+                      output_format, compression)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  [(item.telegram_id,
+                    item.gender,
+                    encode_mask(item.nationality, AVAILABLE_NATIONALITIES),
+                    *encode_password_policy(item.password_settings),
+                    item.results_count,
+                    encode_mask(item.include_fields, AVAILABLE_FIELDS),
+                    encode_mask(item.exclude_fields, AVAILABLE_FIELDS),
+                    item.output_format,
+                    item.compression)
+                   for item in settings])
+    
+    c.execute("DROP TABLE user_settings")
+    c.execute("ALTER TABLE user_settings_compact RENAME TO user_settings")
+
+def _migration_broadcast_jobs(c: sqlite3.Cursor) -> None:
+    """3: задания рассылки и статусы их получателей."""
+    c.execute('''CREATE TABLE broadcast_jobs
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 admin_id INTEGER NOT NULL,
+                 text TEXT NOT NULL,
+                 parse_mode TEXT,
+                 status TEXT NOT NULL DEFAULT 'running',
+                 created_at TEXT NOT NULL,
+                 finished_at TEXT,
+                 total INTEGER NOT NULL DEFAULT 0,
+                 sent INTEGER NOT NULL DEFAULT 0,
+                 blocked INTEGER NOT NULL DEFAULT 0,
+                 not_found INTEGER NOT NULL DEFAULT 0,
+                 failed INTEGER NOT NULL DEFAULT 0)''')
+    # status: NULL - ожидает отправки, claimed - взят в работу,
+    # sent/blocked/not_found/failed - итог отправки
+    c.execute('''CREATE TABLE broadcast_recipients
+                (job_id INTEGER NOT NULL,
+                 telegram_id INTEGER NOT NULL,
+                 status TEXT,
+                 PRIMARY KEY (job_id, telegram_id),
+                 FOREIGN KEY (job_id) REFERENCES broadcast_jobs(id)) WITHOUT ROWID''')
+
+def _migration_stats(c: sqlite3.Cursor) -> None:
+    """4: дневные счетчики статистики и активные пользователи по дням."""
+    # metric - что считаем (active_users, generated_users, ...), key - разрез
+    # (страна, формат, статус доставки) или пустая строка
+    c.execute('''CREATE TABLE stats_daily
+                (day TEXT NOT NULL,
+                 metric TEXT NOT NULL,
+                 key TEXT NOT NULL DEFAULT '',
+                 value INTEGER NOT NULL DEFAULT 0,
+                 PRIMARY KEY (day, metric, key)) WITHOUT ROWID''')
+    # Нужна только для того, чтобы каждый пользователь учитывался за день один раз
+    c.execute('''CREATE TABLE daily_active_users
+                (day TEXT NOT NULL,
+                 telegram_id INTEGER NOT NULL,
+                 PRIMARY KEY (day, telegram_id)) WITHOUT ROWID''')
+
+def _migration_broadcast_failures(c: sqlite3.Cursor) -> None:
+    """5: неудачные получатели рассылок в отдельной таблице вместо JSON в истории."""
+    c.execute("ALTER TABLE broadcast_history ADD COLUMN job_id INTEGER REFERENCES broadcast_jobs(id)")
+    c.execute("CREATE INDEX idx_broadcast_history_timestamp ON broadcast_history (timestamp)")
+    # Ключ начинается с рассылки и класса ошибки: отчет и повтор читают
+    # непрерывный диапазон первичного ключа
+    c.execute('''CREATE TABLE broadcast_failures
+                (broadcast_id INTEGER NOT NULL,
+                 error TEXT NOT NULL,
+                 telegram_id INTEGER NOT NULL,
+                 PRIMARY KEY (broadcast_id, error, telegram_id),
+                 FOREIGN KEY (broadcast_id) REFERENCES broadcast_history(id)) WITHOUT ROWID''')
+    
+    # Класс ошибки в старых записях неизвестен - переносим их как failed
+    c.execute("SELECT id, failed_users FROM broadcast_history WHERE failed_users IS NOT NULL")
+    for broadcast_id, failed_users in c.fetchall():
+        try:
+            telegram_ids = {user[0] if isinstance(user, list) else user for user in json.loads(failed_users)}
+        except (ValueError, TypeError, IndexError):
+            logger.warning(f"Skipping unreadable failed_users of broadcast {broadcast_id}")
+            continue
+        c.executemany("INSERT OR IGNORE INTO broadcast_failures (broadcast_id, error, telegram_id) VALUES (?, 'failed', ?)",
+                      [(broadcast_id, telegram_id) for telegram_id in telegram_ids])
+    c.execute("UPDATE broadcast_history SET failed_users = NULL")
+
+def _migration_extended_fields(c: sqlite3.Cursor) -> None:
+    """6: разделы профиля включаются в сохраненные наборы полей."""
+    # Раньше эти разделы выводились независимо от набора полей, и у
+    # пользователей, которые настраивали поля, их в наборе нет
+    c.execute("UPDATE user_settings SET include_mask = include_mask | ? WHERE include_mask != 0",
+              (encode_mask(EXTENDED_FIELDS, AVAILABLE_FIELDS),))
+
+# Миграции схемы по порядку; номер версии схемы (PRAGMA user_version) -
+# количество примененных миграций. Новые миграции добавляются только в конец
+_MIGRATIONS = [
+    _migration_base_schema,
+    _migration_compact_settings,
+    _migration_broadcast_jobs,
+    _migration_stats,
+    _migration_broadcast_failures,
+    _migration_extended_fields,
+]
+
+@dataclass
+class BroadcastJob:
+    """Задание рассылки со счетчиками уже обработанных получателей."""
+    id: int
+    admin_id: int
+    text: str
+    parse_mode: Optional[str]
+    status: str
+    created_at: str
+    total: int
+    sent: int
+    blocked: int
+    not_found: int
+    failed: int
+
 async def init_db():
     engine = create_async_engine('sqlite+aiosqlite:///bot.db')
     async with engine.begin() as conn:
@@ -36,53 +319,111 @@ async def init_db():
 async def get_session_maker(engine):
     return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+class ConnectionPool:
+    """
+    Пул постоянных соединений с SQLite.
+
+    Соединения открываются по мере надобности (не больше size) и живут
+    до закрытия пула, поэтому кэш подготовленных выражений каждого
+    соединения переиспользуется между запросами.
+    """
+
+    def __init__(self, db_file: str, size: int = DB_POOL_SIZE):
+        self.db_file = db_file
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=20.0, check_same_thread=False,
+                               cached_statements=256)
+        # WAL позволяет читать во время записи, а NORMAL в режиме WAL
+        # не теряет целостность и не синхронизирует диск на каждый коммит
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Берет свободное соединение или открывает новое, если лимит не исчерпан."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+        if not can_open:
+            return self._idle.get()
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Возвращает соединение в пул, откатив незавершенную транзакцию."""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        """Закрывает все свободные соединения пула."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
 class Database:
     def __init__(self, db_file: str):
         self.db_file = db_file
         logger.info(f"Initializing database with file: {db_file}")
+        self.pool = ConnectionPool(db_file)
         self.create_tables()
 
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_file, timeout=20.0)
+        conn = self.pool.acquire()
         try:
             yield conn
         finally:
-            conn.close()
+            self.pool.release(conn)
+
+    def close(self):
+        """Закрывает соединения с базой."""
+        self.pool.close()
 
     def create_tables(self):
+        """Создает таблицы и применяет к базе недостающие миграции схемы."""
         try:
             with self.get_connection() as conn:
                 c = conn.cursor()
+                c.execute("PRAGMA user_version")
+                version = c.fetchone()[0]
                 
-                logger.debug("Creating users table")
-                c.execute('''CREATE TABLE IF NOT EXISTS users
-                            (telegram_id INTEGER PRIMARY KEY, username TEXT)''')
+                for number, migration in enumerate(_MIGRATIONS[version:], start=version + 1):
+                    logger.info(f"Applying database migration {number}: {migration.__name__}")
+                    # Каждая миграция применяется вместе с номером версии в одной транзакции
+                    c.execute("BEGIN")
+                    try:
+                        migration(c)
+                        c.execute(f"PRAGMA user_version = {number}")
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
                 
-                logger.debug("Creating user_settings table")
-                c.execute('''CREATE TABLE IF NOT EXISTS user_settings
-                            (telegram_id INTEGER PRIMARY KEY,
-                             gender TEXT,
-                             nationality TEXT,
-                             password_settings TEXT,
-                             results_count INTEGER,
-                             include_fields TEXT,
-                             exclude_fields TEXT,
-                             FOREIGN KEY (telegram_id) REFERENCES users(telegram_id))''')
-                
-                logger.debug("Creating broadcast_history table")
-                c.execute('''CREATE TABLE IF NOT EXISTS broadcast_history
-                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                             admin_id INTEGER NOT NULL,
-                             timestamp TEXT NOT NULL,
-                             total_users INTEGER NOT NULL,
-                             sent_count INTEGER NOT NULL,
-                             failed_count INTEGER NOT NULL,
-                             failed_users TEXT,
-                             FOREIGN KEY (admin_id) REFERENCES users(telegram_id))''')
-                
-                conn.commit()
-                logger.info("Database tables created successfully")
+                logger.info(f"Database schema is at version {len(_MIGRATIONS)}")
         except Exception as e:
             logger.error(f"Error creating tables: {str(e)}")
             raise
@@ -97,24 +438,13 @@ class Database:
                 conn.execute('BEGIN')
                 try:
                     # Добавляем пользователя
-                    c.execute('INSERT OR REPLACE INTO users (telegram_id, username) VALUES (?, ?)',
-                             (telegram_id, username))
+                    c.execute(_UPSERT_USER, (telegram_id, username))
                     
                     # Создаем настройки по умолчанию
                     default_settings = UserSettings.get_default_settings(telegram_id)
                     
                     # Сохраняем настройки
-                    c.execute('''INSERT OR REPLACE INTO user_settings 
-                                (telegram_id, gender, nationality, password_settings,
-                                 results_count, include_fields, exclude_fields)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                             (default_settings.telegram_id,
-                              default_settings.gender,
-                              json.dumps(default_settings.nationality) if default_settings.nationality else None,
-                              default_settings.password_settings,
-                              default_settings.results_count,
-                              json.dumps(default_settings.include_fields) if default_settings.include_fields else None,
-                              json.dumps(default_settings.exclude_fields) if default_settings.exclude_fields else None))
+                    c.execute(_UPSERT_SETTINGS, _settings_row(default_settings))
                     
                     # Завершаем транзакцию
                     conn.commit()
@@ -134,22 +464,14 @@ class Database:
             with self.get_connection() as conn:
                 c = conn.cursor()
                 
-                c.execute('SELECT * FROM user_settings WHERE telegram_id = ?', (telegram_id,))
+                c.execute(_SELECT_SETTINGS, (telegram_id,))
                 row = c.fetchone()
                 
                 if not row:
                     logger.debug(f"No settings found for user {telegram_id}, creating default")
                     return UserSettings.get_default_settings(telegram_id)
                     
-                settings = UserSettings(
-                    telegram_id=row[0],
-                    gender=row[1],
-                    nationality=json.loads(row[2]) if row[2] else None,
-                    password_settings=row[3],
-                    results_count=row[4],
-                    include_fields=json.loads(row[5]) if row[5] else None,
-                    exclude_fields=json.loads(row[6]) if row[6] else None
-                )
+                settings = _settings_from_row(row)
                 
                 return settings
         except Exception as e:
@@ -162,17 +484,7 @@ class Database:
             with self.get_connection() as conn:
                 c = conn.cursor()
                 
-                c.execute('''INSERT OR REPLACE INTO user_settings 
-                            (telegram_id, gender, nationality, password_settings,
-                             results_count, include_fields, exclude_fields)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                         (settings.telegram_id,
-                          settings.gender,
-                          json.dumps(settings.nationality) if settings.nationality else None,
-                          settings.password_settings,
-                          settings.results_count,
-                          json.dumps(settings.include_fields) if settings.include_fields else None,
-                          json.dumps(settings.exclude_fields) if settings.exclude_fields else None))
+                c.execute(_UPSERT_SETTINGS, _settings_row(settings))
                 
                 conn.commit()
                 logger.debug(f"Settings saved successfully for user {settings.telegram_id}")
@@ -180,67 +492,386 @@ class Database:
             logger.error(f"Error saving user settings: {str(e)}")
             raise
 
-    def get_all_users(self) -> list:
-        """Получает список всех пользователей."""
+    def save_user_settings_batch(self, settings_list: List[UserSettings]):
+        """Сохраняет настройки нескольких пользователей одной транзакцией."""
         try:
             with self.get_connection() as conn:
-                c = conn.cursor()
-                logger.info("Fetching all users from database")
-                
-                # Проверяем существование таблицы
-                c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-                if not c.fetchone():
-                    logger.error("Users table does not exist!")
-                    return []
-                
-                # Получаем количество пользователей
-                c.execute('SELECT COUNT(*) FROM users')
-                count = c.fetchone()[0]
-                logger.info(f"Total users in database: {count}")
-                
-                # Получаем всех пользователей
-                c.execute('SELECT telegram_id, username FROM users')
-                users = c.fetchall()
-                
-                if not users:
-                    logger.warning("No users found in database")
-                    return []
-                    
-                logger.info(f"Successfully fetched {len(users)} users from database")
-                return users
-                
-        except sqlite3.Error as e:
-            logger.error(f"SQLite error in get_all_users: {str(e)}", exc_info=True)
-            return []
+                with conn:
+                    conn.executemany(_UPSERT_SETTINGS, map(_settings_row, settings_list))
+                logger.debug(f"Settings saved successfully for {len(settings_list)} users")
         except Exception as e:
-            logger.error(f"Unexpected error in get_all_users: {str(e)}", exc_info=True)
-            return []
+            logger.error(f"Error saving user settings batch: {str(e)}")
+            raise
+
+    def get_users_page(self, after_id: int = 0, limit: int = USERS_PAGE_SIZE) -> List[Tuple[int, str]]:
+        """Получает до limit пользователей (telegram_id, username) с telegram_id больше after_id."""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute(_SELECT_USERS_PAGE, (after_id, limit)).fetchall()
+        except Exception as e:
+            logger.error(f"Error getting users page: {str(e)}")
+            raise
+
+    def get_users_export_page(self, after_id: int = 0, limit: int = USERS_PAGE_SIZE) -> List[tuple]:
+        """
+        Получает страницу пользователей вместе с их настройками для выгрузки.
+
+        Столбцы соответствуют USER_EXPORT_COLUMNS; у пользователей без
+        настроек значения настроек пустые.
+        """
+        try:
+            with self.get_connection() as conn:
+                return [
+                    (telegram_id, username, gender,
+                     ", ".join(decode_mask(nationality_mask, AVAILABLE_NATIONALITIES) or []),
+                     results_count, output_format, compression)
+                    for telegram_id, username, gender, nationality_mask, results_count, output_format, compression
+                    in conn.execute(_SELECT_USERS_EXPORT_PAGE, (after_id, limit))
+                ]
+        except Exception as e:
+            logger.error(f"Error getting users export page: {str(e)}")
+            raise
+
+    def get_user_stats(self) -> Dict[str, int]:
+        """Считает пользователей и незавершенные рассылки, не читая сами строки."""
+        try:
+            with self.get_connection() as conn:
+                users, running_broadcasts = conn.execute(_SELECT_USER_STATS).fetchone()
+                return {"users": users, "running_broadcasts": running_broadcasts}
+        except Exception as e:
+            logger.error(f"Error getting user stats: {str(e)}")
+            raise
+
+    def create_broadcast_job(self, admin_id: int, text: str, parse_mode: Optional[str],
+                             created_at: str) -> BroadcastJob:
+        """Создает задание рассылки всем пользователям из таблицы users."""
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    c = conn.cursor()
+                    c.execute('''INSERT INTO broadcast_jobs (admin_id, text, parse_mode, created_at)
+                                 VALUES (?, ?, ?, ?)''', (admin_id, text, parse_mode, created_at))
+                    job_id = c.lastrowid
+                    c.execute('''INSERT INTO broadcast_recipients (job_id, telegram_id)
+                                 SELECT ?, telegram_id FROM users''', (job_id,))
+                    c.execute('UPDATE broadcast_jobs SET total = ? WHERE id = ?', (c.rowcount, job_id))
+                    c.execute(_SELECT_JOB, (job_id,))
+                    job = BroadcastJob(*c.fetchone())
+                logger.info(f"Broadcast job {job_id} created for {job.total} users")
+                return job
+        except Exception as e:
+            logger.error(f"Error creating broadcast job: {str(e)}")
+            raise
+
+    def get_broadcast_job(self, job_id: int) -> Optional[BroadcastJob]:
+        """Получает задание рассылки с текущими счетчиками."""
+        try:
+            with self.get_connection() as conn:
+                row = conn.execute(_SELECT_JOB, (job_id,)).fetchone()
+                return BroadcastJob(*row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting broadcast job: {str(e)}")
+            raise
+
+    def get_running_broadcast_jobs(self) -> List[BroadcastJob]:
+        """Получает незавершенные задания рассылки (например, прерванные перезапуском)."""
+        try:
+            with self.get_connection() as conn:
+                rows = conn.execute("SELECT id FROM broadcast_jobs WHERE status = 'running' ORDER BY id").fetchall()
+                return [BroadcastJob(*conn.execute(_SELECT_JOB, row).fetchone()) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting running broadcast jobs: {str(e)}")
+            raise
+
+    def claim_broadcast_recipients(self, job_id: int, limit: int) -> List[int]:
+        """Отмечает очередную пачку ожидающих получателей как взятую в работу."""
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    rows = conn.execute(_CLAIM_RECIPIENTS, (job_id, job_id, limit)).fetchall()
+                return sorted(row[0] for row in rows)
+        except Exception as e:
+            logger.error(f"Error claiming broadcast recipients: {str(e)}")
+            raise
+
+    def checkpoint_broadcast(self, job_id: int, statuses: List[Tuple[int, str]]) -> None:
+        """
+        Сохраняет итоги отправки пачке получателей и обновляет счетчики задания
+        одной транзакцией.
+
+        Args:
+            statuses: Пары (telegram_id, статус sent/blocked/not_found/failed)
+        """
+        counts = {"sent": 0, "blocked": 0, "not_found": 0, "failed": 0}
+        for _, status in statuses:
+            counts[status] += 1
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    conn.executemany(_UPDATE_RECIPIENT,
+                                     [(status, job_id, telegram_id) for telegram_id, status in statuses])
+                    conn.execute(_UPDATE_JOB_COUNTERS,
+                                 (counts["sent"], counts["blocked"], counts["not_found"], counts["failed"], job_id))
+        except Exception as e:
+            logger.error(f"Error saving broadcast checkpoint: {str(e)}")
+            raise
+
+    def release_broadcast_claims(self, job_id: int, lost: bool) -> None:
+        """
+        Разбирается с получателями, взятыми в работу, но без итога.
+
+        Args:
+            lost: True - процесс упал во время отправки и неизвестно, ушло ли
+                  сообщение: получатели считаются неудачными, чтобы не отправить
+                  им сообщение дважды. False - отправка не начиналась (отмена),
+                  получатели возвращаются в ожидание.
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    if lost:
+                        c = conn.execute("""UPDATE broadcast_recipients SET status = 'failed'
+                                            WHERE job_id = ? AND status = 'claimed'""", (job_id,))
+                        conn.execute(_UPDATE_JOB_COUNTERS, (0, 0, 0, c.rowcount, job_id))
+                    else:
+                        conn.execute("""UPDATE broadcast_recipients SET status = NULL
+                                        WHERE job_id = ? AND status = 'claimed'""", (job_id,))
+        except Exception as e:
+            logger.error(f"Error releasing broadcast claims: {str(e)}")
+            raise
+
+    def finish_broadcast_job(self, job_id: int, status: str, finished_at: str) -> None:
+        """Отмечает задание рассылки завершенным (done) или отмененным (cancelled)."""
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    conn.execute('UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ?',
+                                 (status, finished_at, job_id))
+        except Exception as e:
+            logger.error(f"Error finishing broadcast job: {str(e)}")
+            raise
 
     def save_broadcast_results(self, admin_id: int, timestamp: str, total_users: int,
-                             sent_count: int, failed_count: int, failed_users: list) -> None:
-        """Сохраняет результаты рассылки в базу данных."""
+                               sent_count: int, failed_count: int, job_id: int) -> int:
+        """
+        Сохраняет итоги завершенного задания рассылки в историю.
+
+        Неудачные получатели переносятся в broadcast_failures, а статусы
+        получателей задания удаляются - они больше не нужны.
+
+        Returns:
+            int: id записи истории
+        """
         try:
             with self.get_connection() as conn:
-                c = conn.cursor()
-                c.execute('''INSERT INTO broadcast_history 
-                           (admin_id, timestamp, total_users, sent_count, failed_count, failed_users)
-                           VALUES (?, ?, ?, ?, ?, ?)''',
-                        (admin_id, timestamp, total_users, sent_count, failed_count,
-                         json.dumps(failed_users) if failed_users else None))
-                conn.commit()
+                with conn:
+                    c = conn.cursor()
+                    c.execute(_INSERT_BROADCAST,
+                              (admin_id, timestamp, total_users, sent_count, failed_count, job_id))
+                    broadcast_id = c.lastrowid
+                    c.execute(_INSERT_BROADCAST_FAILURES, (broadcast_id, job_id))
+                    c.execute('DELETE FROM broadcast_recipients WHERE job_id = ?', (job_id,))
                 logger.info(f"Broadcast results saved successfully for admin {admin_id}")
+                return broadcast_id
         except Exception as e:
             logger.error(f"Error saving broadcast results: {str(e)}")
             raise
 
+    def get_broadcast_failure_counts(self, broadcast_id: int) -> Dict[str, int]:
+        """Считает неудачных получателей рассылки по классам ошибок."""
+        try:
+            with self.get_connection() as conn:
+                return dict(conn.execute(_SELECT_BROADCAST_FAILURE_COUNTS, (broadcast_id,)).fetchall())
+        except Exception as e:
+            logger.error(f"Error getting broadcast failure counts: {str(e)}")
+            raise
+
+    def create_retry_job(self, broadcast_id: int, admin_id: int, created_at: str,
+                         errors: Tuple[str, ...] = ('failed',)) -> Optional[BroadcastJob]:
+        """
+        Создает задание повторной рассылки получателям, которым не удалось
+        отправить сообщение с ошибками классов errors.
+
+        Returns:
+            Optional[BroadcastJob]: новое задание или None, если рассылка
+            не связана с заданием (записи до введения заданий) и текст неизвестен
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    c = conn.cursor()
+                    c.execute('''SELECT j.text, j.parse_mode FROM broadcast_history h
+                                 JOIN broadcast_jobs j ON j.id = h.job_id WHERE h.id = ?''', (broadcast_id,))
+                    row = c.fetchone()
+                    if row is None:
+                        return None
+                    c.execute('''INSERT INTO broadcast_jobs (admin_id, text, parse_mode, created_at)
+                                 VALUES (?, ?, ?, ?)''', (admin_id, *row, created_at))
+                    job_id = c.lastrowid
+                    placeholders = ", ".join("?" * len(errors))
+                    c.execute(f'''INSERT INTO broadcast_recipients (job_id, telegram_id)
+                                  SELECT ?, telegram_id FROM broadcast_failures
+                                  WHERE broadcast_id = ? AND error IN ({placeholders})''',
+                              (job_id, broadcast_id, *errors))
+                    c.execute('UPDATE broadcast_jobs SET total = ? WHERE id = ?', (c.rowcount, job_id))
+                    c.execute(_SELECT_JOB, (job_id,))
+                    job = BroadcastJob(*c.fetchone())
+                logger.info(f"Retry job {job_id} created for {job.total} recipients of broadcast {broadcast_id}")
+                return job
+        except Exception as e:
+            logger.error(f"Error creating retry job: {str(e)}")
+            raise
+
+    def save_stats(self, counters: List[Tuple[str, str, str, int]],
+                   active_users: List[Tuple[str, int]]) -> None:
+        """
+        Прибавляет накопленные счетчики к дневной статистике одной транзакцией.
+
+        Args:
+            counters: Приращения (day, metric, key, value)
+            active_users: Пары (day, telegram_id); впервые за день встреченные
+                          пользователи увеличивают счетчик active_users
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn:
+                    c = conn.cursor()
+                    by_day: Dict[str, List[Tuple[str, int]]] = {}
+                    for day, telegram_id in active_users:
+                        by_day.setdefault(day, []).append((day, telegram_id))
+                    for day, rows in by_day.items():
+                        c.executemany(_INSERT_ACTIVE_USER, rows)
+                        if c.rowcount > 0:
+                            c.execute(_UPSERT_STAT, (day, "active_users", "", c.rowcount))
+                    c.executemany(_UPSERT_STAT, counters)
+        except Exception as e:
+            logger.error(f"Error saving stats: {str(e)}")
+            raise
+
+    def get_stats(self, since_day: str) -> List[Tuple[str, str, str, int]]:
+        """Получает дневные счетчики (day, metric, key, value) начиная с since_day."""
+        try:
+            with self.get_connection() as conn:
+                return conn.execute(_SELECT_STATS, (since_day,)).fetchall()
+        except Exception as e:
+            logger.error(f"Error getting stats: {str(e)}")
+            raise
+
     def get_broadcast_history(self, limit: int = 10) -> list:
         """Получает историю рассылок."""
         try:
             with self.get_connection() as conn:
                 c = conn.cursor()
-                c.execute('''SELECT * FROM broadcast_history 
-                           ORDER BY timestamp DESC LIMIT ?''', (limit,))
+                c.execute(_SELECT_BROADCASTS, (limit,))
                 return c.fetchall()
         except Exception as e:
             logger.error(f"Error getting broadcast history: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
+
+class AsyncDatabase:
+    """
+    Асинхронный доступ к базе для обработчиков.
+
+    Все запросы выполняются в потоках базы, поэтому медленный диск или
+    блокировка файла не останавливают цикл событий бота. Потоков столько
+    же, сколько соединений в пуле: в режиме WAL чтения идут параллельно
+    друг с другом и с записью, а записи SQLite выстраивает в очередь сам.
+    Порядок независимых запросов не гарантируется; зависимые запросы
+    вызывающий выполняет последовательно (await).
+    """
+
+    def __init__(self, db_file: str):
+        self.database = Database(db_file)
+        self._executor = ThreadPoolExecutor(max_workers=self.database.pool.size, thread_name_prefix="db")
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def add_user(self, telegram_id: int, username: str) -> None:
+        await self._run(self.database.add_user, telegram_id, username)
+
+    async def get_user_settings(self, telegram_id: int) -> Optional[UserSettings]:
+        return await self._run(self.database.get_user_settings, telegram_id)
+
+    async def save_user_settings(self, settings: UserSettings) -> None:
+        await self._run(self.database.save_user_settings, settings)
+
+    async def save_user_settings_batch(self, settings_list: List[UserSettings]) -> None:
+        await self._run(self.database.save_user_settings_batch, settings_list)
+
+    async def iter_users(self, page_size: int = USERS_PAGE_SIZE,
+                         with_settings: bool = False) -> AsyncIterator[List[tuple]]:
+        """
+        Обходит всех пользователей страницами по page_size в порядке telegram_id.
+
+        Строки страницы - (telegram_id, username), а с with_settings -
+        строки выгрузки со столбцами USER_EXPORT_COLUMNS.
+
+        В памяти держится одна страница, а поток базы занят только на время
+        ее чтения. Пользователи, добавленные во время обхода, попадут в него,
+        если их telegram_id больше уже пройденных.
+        """
+        get_page = self.database.get_users_export_page if with_settings else self.database.get_users_page
+        after_id = 0
+        while True:
+            page = await self._run(get_page, after_id, page_size)
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            after_id = page[-1][0]
+
+    async def get_user_stats(self) -> Dict[str, int]:
+        return await self._run(self.database.get_user_stats)
+
+    async def create_broadcast_job(self, admin_id: int, text: str, parse_mode: Optional[str],
+                                   created_at: str) -> BroadcastJob:
+        return await self._run(self.database.create_broadcast_job, admin_id, text, parse_mode, created_at)
+
+    async def get_broadcast_job(self, job_id: int) -> Optional[BroadcastJob]:
+        return await self._run(self.database.get_broadcast_job, job_id)
+
+    async def get_running_broadcast_jobs(self) -> List[BroadcastJob]:
+        return await self._run(self.database.get_running_broadcast_jobs)
+
+    async def claim_broadcast_recipients(self, job_id: int, limit: int) -> List[int]:
+        return await self._run(self.database.claim_broadcast_recipients, job_id, limit)
+
+    async def checkpoint_broadcast(self, job_id: int, statuses: List[Tuple[int, str]]) -> None:
+        await self._run(self.database.checkpoint_broadcast, job_id, statuses)
+
+    async def release_broadcast_claims(self, job_id: int, lost: bool) -> None:
+        await self._run(self.database.release_broadcast_claims, job_id, lost)
+
+    async def finish_broadcast_job(self, job_id: int, status: str, finished_at: str) -> None:
+        await self._run(self.database.finish_broadcast_job, job_id, status, finished_at)
+
+    async def save_broadcast_results(self, admin_id: int, timestamp: str, total_users: int,
+                                     sent_count: int, failed_count: int, job_id: int) -> int:
+        return await self._run(self.database.save_broadcast_results, admin_id, timestamp, total_users,
+                               sent_count, failed_count, job_id)
+
+    async def get_broadcast_failure_counts(self, broadcast_id: int) -> Dict[str, int]:
+        return await self._run(self.database.get_broadcast_failure_counts, broadcast_id)
+
+    async def create_retry_job(self, broadcast_id: int, admin_id: int, created_at: str) -> Optional[BroadcastJob]:
+        return await self._run(self.database.create_retry_job, broadcast_id, admin_id, created_at)
+
+    async def save_stats(self, counters: List[Tuple[str, str, str, int]],
+                         active_users: List[Tuple[str, int]]) -> None:
+        await self._run(self.database.save_stats, counters, active_users)
+
+    async def get_stats(self, since_day: str) -> List[Tuple[str, str, str, int]]:
+        return await self._run(self.database.get_stats, since_day)
+
+    async def get_broadcast_history(self, limit: int = 10) -> list:
+        return await self._run(self.database.get_broadcast_history, limit)
+
+    def close(self) -> None:
+        """Дожидается завершения запросов и закрывает соединения."""
+        self._executor.shutdown(wait=True)
+        self.database.close()
+
+db = AsyncDatabase('bot.db')
@@ -0,0 +1,270 @@
+"""
+Потоковая выгрузка сгенерированных данных в файлы.
+
+Записи приходят пакетами (шардами) и сразу пишутся в буфер, который
+держится в памяти, пока он небольшой, и переезжает во временный файл
+на диске, когда становится большим. Весь документ целиком в памяти
+не собирается.
+
+Форматы выгрузки регистрируются декоратором register_serializer.
+Сжатие (gzip/zip) выполняется на лету: сериализатор пишет прямо в
+сжимающий поток, и в буфер попадают уже сжатые данные.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import zipfile
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from typing import Any, AsyncIterable, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from .user_generator import SOCIAL_MEDIA_PLATFORMS
+
+logger = logging.getLogger(__name__)
+
+# Размер буфера в памяти, после которого выгрузка переносится на диск
+EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE", str(4 * 1024 * 1024)))
+
+# Количество записей, начиная с которого файл сжимается в режиме auto.
+# Пользователь генерирует не больше 100 записей за раз; 50 записей в JSON -
+# около 30 КБ, которые gzip сжимает в 6-7 раз
+COMPRESSION_THRESHOLD = int(os.getenv("COMPRESSION_THRESHOLD", "50"))
+
+# Вложенные поля, набор ключей которых меняется от записи к записи:
+# в CSV для них выводятся столбцы всех возможных ключей
+CSV_VARIABLE_FIELDS = {
+    "social_media": SOCIAL_MEDIA_PLATFORMS,
+}
+
+# Режимы сжатия: имя -> суффикс имени файла
+COMPRESSIONS = {
+    "gzip": ".gz",
+    "zip": ".zip",
+}
+
+Records = AsyncIterable[List[Dict[str, Any]]]
+Serializer = Callable[[Records, BinaryIO], Awaitable[int]]
+
+# Зарегистрированные форматы: имя -> (сериализатор, расширение файла)
+SERIALIZERS: Dict[str, Tuple[Serializer, str]] = {}
+
+def register_serializer(name: str, extension: str) -> Callable[[Serializer], Serializer]:
+    """
+    Регистрирует сериализатор формата выгрузки.
+
+    Сериализатор - корутина (records, fileobj) -> количество записей,
+    которая пишет пакеты записей в бинарный файл по мере их поступления.
+    """
+    def decorator(serializer: Serializer) -> Serializer:
+        SERIALIZERS[name] = (serializer, extension)
+        return serializer
+    return decorator
+
+def get_extension(fmt: str) -> str:
+    """Возвращает расширение файла для формата выгрузки."""
+    return SERIALIZERS[fmt][1]
+
+async def _write_json(records: Records, fileobj: BinaryIO, compact: bool) -> int:
+    if compact:
+        dump = lambda record: json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        head, separator, tail = '{"results":[', ",", '],"count":%d}'
+    else:
+        dump = lambda record: json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        head, separator, tail = '{\n  "results": [\n    ', ",\n    ", '\n  ],\n  "count": %d\n}'
+
+    fileobj.write(head.encode())
+    count = 0
+    async for batch in records:
+        if not batch:
+            continue
+        chunk = separator.join(map(dump, batch))
+        if count:
+            chunk = separator + chunk
+        fileobj.write(chunk.encode())
+        count += len(batch)
+    fileobj.write((tail % count).encode())
+    return count
+
+@register_serializer("json", "json")
+async def write_json(records: Records, fileobj: BinaryIO) -> int:
+    """Записывает JSON-документ {"results": [...], "count": N} с отступами."""
+    return await _write_json(records, fileobj, compact=False)
+
+@register_serializer("compact", "json")
+async def write_compact_json(records: Records, fileobj: BinaryIO) -> int:
+    """Записывает тот же JSON-документ без отступов и пробелов."""
+    return await _write_json(records, fileobj, compact=True)
+
+@register_serializer("ndjson", "ndjson")
+async def write_ndjson(records: Records, fileobj: BinaryIO) -> int:
+    """Записывает записи в формате NDJSON (одна запись на строку)."""
+    count = 0
+    async for batch in records:
+        if not batch:
+            continue
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch)
+        fileobj.write(lines.encode())
+        count += len(batch)
+    return count
+
+def _flatten(record: Dict[str, Any], prefix: str = "") -> Iterator[Tuple[str, Any]]:
+    """Разворачивает вложенные словари в пары (ключ.через.точку, значение)."""
+    for key, value in record.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, list):
+            yield f"{prefix}{key}", "; ".join(map(str, value))
+        else:
+            yield f"{prefix}{key}", value
+
+def _csv_columns(record: Dict[str, Any]) -> List[str]:
+    """
+    Возвращает столбцы CSV для записей с теми же полями, что и record.
+
+    Для полей из CSV_VARIABLE_FIELDS выводятся все возможные ключи,
+    а не только те, что есть в этой записи.
+    """
+    columns = []
+    for key, value in record.items():
+        if key in CSV_VARIABLE_FIELDS:
+            columns.extend(f"{key}.{name}" for name in CSV_VARIABLE_FIELDS[key])
+        else:
+            columns.extend(column for column, _ in _flatten({key: value}))
+    return columns
+
+@register_serializer("csv", "csv")
+async def write_csv(records: Records, fileobj: BinaryIO) -> int:
+    """
+    Записывает записи в CSV, разворачивая вложенные поля в столбцы
+    вида location.city, а списки - в строку через "; ".
+
+    Набор полей берется из первой записи: все записи одной выгрузки
+    строятся по одним настройкам и имеют одинаковые поля. Столбцы
+    полей с переменным набором ключей (социальные сети) фиксированы,
+    и отсутствующие у записи значения остаются пустыми.
+    """
+    count = 0
+    header = None
+    chunk = io.StringIO()
+    writer = csv.writer(chunk)
+    async for batch in records:
+        for record in batch:
+            row = dict(_flatten(record))
+            if header is None:
+                header = _csv_columns(record)
+                # BOM, чтобы Excel распознал кодировку
+                fileobj.write("\ufeff".encode())
+                writer.writerow(header)
+            writer.writerow([row.get(column, "") for column in header])
+        fileobj.write(chunk.getvalue().encode())
+        chunk.seek(0)
+        chunk.truncate()
+        count += len(batch)
+    return count
+
+def _xml_element(tag: str, value: Any) -> str:
+    if isinstance(value, dict):
+        content = "".join(_xml_element(key, item) for key, item in value.items())
+    elif isinstance(value, list):
+        content = "".join(_xml_element("item", item) for item in value)
+    else:
+        content = escape(str(value))
+    return f"<{tag}>{content}</{tag}>"
+
+@register_serializer("xml", "xml")
+async def write_xml(records: Records, fileobj: BinaryIO) -> int:
+    """Записывает записи в XML: <users><user>...</user></users>, элементы списков - <item>."""
+    fileobj.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<users>\n')
+    count = 0
+    async for batch in records:
+        chunk = "".join(_xml_element("user", record) + "\n" for record in batch)
+        fileobj.write(chunk.encode())
+        count += len(batch)
+    fileobj.write(b"</users>\n")
+    return count
+
+def choose_compression(mode: Optional[str], count: int) -> Optional[str]:
+    """
+    Определяет сжатие по настройке пользователя и размеру выгрузки.
+
+    Args:
+        mode: auto (gzip от COMPRESSION_THRESHOLD записей), none, gzip или zip
+        count: Количество записей в выгрузке
+
+    Returns:
+        Optional[str]: gzip, zip или None без сжатия
+    """
+    if mode in COMPRESSIONS:
+        return mode
+    if mode in (None, "auto") and count >= COMPRESSION_THRESHOLD:
+        return "gzip"
+    return None
+
+def export_filename(name: str, extension: str, compression: Optional[str] = None) -> str:
+    """Возвращает имя отправляемого файла с учетом сжатия."""
+    if compression == "zip":
+        return f"{name}.zip"
+    return f"{name}.{extension}{COMPRESSIONS.get(compression, '')}"
+
+@contextmanager
+def compressed_writer(fileobj: BinaryIO, compression: Optional[str], member_name: str) -> Iterator[BinaryIO]:
+    """
+    Открывает поток записи в fileobj, сжимающий данные на лету.
+
+    Args:
+        fileobj: Буфер, в который попадут итоговые (сжатые) данные
+        compression: gzip, zip или None без сжатия
+        member_name: Имя файла внутри zip-архива
+    """
+    if compression is None:
+        yield fileobj
+    elif compression == "gzip":
+        with gzip.GzipFile(filename=member_name, fileobj=fileobj, mode="wb", mtime=0) as stream:
+            yield stream
+    elif compression == "zip":
+        with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(member_name, "w", force_zip64=True) as stream:
+                yield stream
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+async def export_records(records: Records, fmt: str = "json", compression: Optional[str] = None,
+                         name: str = "user_data") -> Tuple[SpooledTemporaryFile, int]:
+    """
+    Выгружает записи в буфер в одном из зарегистрированных форматов.
+
+    Args:
+        records: Асинхронный поток пакетов записей
+        fmt: Имя зарегистрированного формата
+        compression: gzip, zip или None без сжатия
+        name: Имя файла без расширения (для записи внутри zip-архива)
+
+    Returns:
+        Tuple[SpooledTemporaryFile, int]: буфер, перемотанный в начало,
+        и количество записей. Буфер закрывает вызывающий.
+    """
+    if fmt not in SERIALIZERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    serializer, extension = SERIALIZERS[fmt]
+    buffer = SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    try:
+        with compressed_writer(buffer, compression, f"{name}.{extension}") as stream:
+            count = await serializer(records, stream)
+    except Exception as e:
+        buffer.close()
+        logger.error(f"Error in export_records: {str(e)}")
+        raise
+    buffer.seek(0)
+    return buffer, count
+
+def parse_export_format(args: Optional[List[str]], default: str = "json") -> str:
+    """Извлекает формат выгрузки из аргументов команды (ndjson, compact, csv, xml)."""
+    for arg in args or []:
+        if arg.lower() in SERIALIZERS:
+            return arg.lower()
+    return default
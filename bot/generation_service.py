@@ -0,0 +1,144 @@
+"""
+Сервис генерации пользователей в пуле процессов.
+
+Генерация - чистый Python и нагружает CPU, поэтому большие запросы
+делятся на шарды, которые выполняются в отдельных процессах, а цикл
+событий бота остается свободным для обработки других чатов.
+"""
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Collection, Deque, Dict, List, Optional, Union
+
+from .user_generator import UserGenerator, spawn_seed
+
+logger = logging.getLogger(__name__)
+
+# Количество процессов пула (по умолчанию - по числу ядер)
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "0")) or os.cpu_count() or 1
+# Максимальный размер одного шарда
+GENERATION_SHARD_SIZE = int(os.getenv("GENERATION_SHARD_SIZE", "250"))
+# Запросы не больше этого размера генерируются прямо в цикле событий
+GENERATION_INLINE_LIMIT = int(os.getenv("GENERATION_INLINE_LIMIT", "10"))
+# Момент, от которого считаются даты и возраст при заданном зерне: с ним
+# результат не зависит от дня запуска
+SEED_EPOCH = datetime(2025, 1, 1)
+
+def _generate_shard(seed: int, count: int, nationalities: Optional[List[str]],
+                    gender: Optional[str], password_settings: Optional[str],
+                    fields: Optional[Collection[str]], now: datetime) -> List[Dict]:
+    """Генерирует один шард собственным генератором случайных чисел."""
+    return UserGenerator.generate_batch(
+        count, nationalities, gender, password_settings, fields,
+        rng=random.Random(seed), now=now
+    )
+
+class GenerationService:
+    """Генерирует пользователей шардами в пуле процессов."""
+
+    def __init__(self, max_workers: int = GENERATION_WORKERS,
+                 shard_size: int = GENERATION_SHARD_SIZE,
+                 inline_limit: int = GENERATION_INLINE_LIMIT):
+        self.max_workers = max_workers
+        self.shard_size = shard_size
+        self.inline_limit = inline_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            logger.info(f"Starting generation pool with {self.max_workers} workers")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def split(self, count: int) -> List[int]:
+        """Делит количество пользователей на шарды примерно равного размера."""
+        shards = max(1, -(-count // self.shard_size))
+        base, extra = divmod(count, shards)
+        return [base + 1 if i < extra else base for i in range(shards)]
+
+    async def iter_batches(self, count: int, nationalities: Optional[List[str]] = None,
+                           gender: Optional[str] = None,
+                           password_settings: Optional[str] = None,
+                           fields: Optional[Collection[str]] = None,
+                           seed: Optional[int] = None,
+                           now: Optional[datetime] = None) -> AsyncIterator[List[Dict[str, Union[str, int, List[str]]]]]:
+        """
+        Генерирует пользователей шардами и отдает их по мере готовности.
+
+        Шарды отдаются в исходном порядке, а в работе одновременно находится
+        не больше 2 * max_workers шардов, поэтому потребитель, который сразу
+        записывает шард в файл, держит в памяти лишь несколько шардов.
+
+        Остальные аргументы совпадают с UserGenerator.generate_batch.
+
+        Args:
+            seed: Зерно генерации. Каждый шард получает свой поток,
+                  выведенный из зерна и номера шарда, поэтому результат
+                  воспроизводим и не зависит от того, где выполнялся шард.
+                  None - случайное зерно.
+            now: Момент расчета дат и возраста. По умолчанию с зерном -
+                 SEED_EPOCH, чтобы результат не менялся со временем,
+                 без зерна - текущий момент.
+        """
+        if now is None:
+            now = SEED_EPOCH if seed is not None else datetime.now()
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        sizes = self.split(count)
+
+        if count <= self.inline_limit:
+            for shard, size in enumerate(sizes):
+                yield _generate_shard(spawn_seed(seed, shard), size, nationalities,
+                                      gender, password_settings, fields, now)
+            return
+
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        pending: Deque[asyncio.Future] = deque()
+        shards = iter(enumerate(sizes))
+        try:
+            while True:
+                for shard, size in islice(shards, 2 * self.max_workers - len(pending)):
+                    pending.append(loop.run_in_executor(
+                        executor, _generate_shard, spawn_seed(seed, shard),
+                        size, nationalities, gender, password_settings, fields, now
+                    ))
+                if not pending:
+                    break
+                yield await pending.popleft()
+        finally:
+            # Потребитель мог прервать итерацию - незапущенные шарды не нужны
+            for future in pending:
+                future.cancel()
+
+    async def generate_batch(self, count: int, nationalities: Optional[List[str]] = None,
+                             gender: Optional[str] = None,
+                             password_settings: Optional[str] = None,
+                             fields: Optional[Collection[str]] = None,
+                             seed: Optional[int] = None,
+                             now: Optional[datetime] = None) -> List[Dict[str, Union[str, int, List[str]]]]:
+        """
+        Генерирует пакет пользователей, не блокируя цикл событий.
+
+        Аргументы совпадают с iter_batches.
+        """
+        return [
+            user
+            async for shard in self.iter_batches(count, nationalities, gender,
+                                                 password_settings, fields, seed, now)
+            for user in shard
+        ]
+
+    def shutdown(self) -> None:
+        """Останавливает пул процессов."""
+        if self._executor is not None:
+            logger.info("Shutting down generation pool")
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+generation_service = GenerationService()
@@ -1,37 +1,42 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+import io
 import logging
+import os
 import traceback
-import json
-import io
+from typing import List, Optional
 from datetime import datetime
 
-from .database import User, Settings, init_db, get_session_maker
 from .keyboards import get_main_keyboard
-from .utils import get_random_user, format_user_data, broadcast_message, translate_gender, format_settings
-from .database import Database
-from .user_settings import UserSettings, DEFAULT_SETTINGS
+from .utils import (
+    get_random_users, iter_random_users, parse_seed, format_user_data, translate_gender, format_settings,
+    pack_messages, RECORD_SEPARATOR
+)
+from .database import db
+from .settings_cache import settings_cache
+from .user_pool import user_pool
+from .stats import stats
+from .exporters import choose_compression, export_filename, export_records, get_extension, parse_export_format
+from .user_settings import UserSettings, DEFAULT_SETTINGS, OUTPUT_FORMATS, COMPRESSION_MODES
 from .settings_keyboards import (
     get_settings_keyboard, get_gender_keyboard,
     get_nationality_keyboard, get_password_settings_keyboard,
-    get_fields_keyboard, get_results_count_keyboard
+    get_fields_keyboard, get_results_count_keyboard,
+    get_output_format_keyboard
 )
-from .admin_handlers import admin_menu
+from .admin_handlers import active_broadcasts, admin_menu, start_broadcast
 
 logger = logging.getLogger(__name__)
 
-db = Database('bot.db')
+# Сколько пользователей показывает список для администратора
+USERS_LIST_LIMIT = 50
+# Начиная с какого количества пользователей текстовый ответ отправляется файлом
+TEXT_DOCUMENT_THRESHOLD = int(os.getenv("TEXT_DOCUMENT_THRESHOLD", "20"))
 
-async def get_session_maker_from_context(context):
-    """Get or create session maker from context."""
-    if 'session_maker' not in context.bot_data:
-        engine = await init_db()
-        session_maker = await get_session_maker(engine)
-        context.bot_data['session_maker'] = session_maker
-        logger.info("Database initialized")
-    return context.bot_data['session_maker']
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Учитывает пользователя в активных за день (вызывается для каждого обновления)."""
+    if update.effective_user:
+        stats.track_active(update.effective_user.id)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /start command."""
@@ -44,7 +49,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Start command from user: {user.id} (@{user.username})")
         
         # Добавляем пользователя в базу данных
-        db.add_user(user.id, user.username)
+        # add_user записывает настройки по умолчанию поверх кэшированных
+        settings_cache.discard(user.id)
+        await db.add_user(user.id, user.username)
         
         # Отправляем приветственное сообщение
         await update.message.reply_text(
@@ -62,20 +69,68 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(traceback.format_exc())
         await update.message.reply_text("Произошла ошибка. Попробуйте позже.")
 
+async def send_export(update: Update, settings: UserSettings, seed: Optional[int], fmt: str):
+    """Генерирует пользователей и отправляет их файлом в формате fmt."""
+    compression = choose_compression(settings.compression, settings.results_count)
+    # Результаты пишутся (и сжимаются) в буфер по мере генерации шардов
+    buffer, count = await export_records(
+        iter_random_users(settings, settings.results_count, seed), fmt, compression
+    )
+    with buffer:
+        await update.message.reply_document(
+            document=buffer,
+            filename=export_filename('user_data', get_extension(fmt), compression),
+            caption=f"Сгенерировано пользователей: {count}"
+        )
+    stats.track_generation(settings.nationality, fmt, count)
+
+async def reply_records(update: Update, messages: List[str]):
+    """
+    Отправляет отформатированных пользователей: несколько в одном сообщении,
+    а больше TEXT_DOCUMENT_THRESHOLD - одним Markdown-файлом.
+    """
+    if len(messages) > TEXT_DOCUMENT_THRESHOLD:
+        document = io.BytesIO(RECORD_SEPARATOR.join(messages).encode())
+        await update.message.reply_document(
+            document=document,
+            filename='user_data.md',
+            caption=f"Сгенерировано пользователей: {len(messages)}"
+        )
+        return
+    for text in pack_messages(messages):
+        await update.message.reply_text(text, parse_mode='Markdown')
+
 async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /generate."""
+    """
+    Обрабатывает команду /generate.
+
+    Результат выводится в формате из настроек: текстом в чат или файлом.
+    Аргументы: json, ndjson, compact, csv или xml - формат на этот раз,
+    seed=N - зерно генерации.
+    """
     user_id = update.effective_user.id
-    settings = db.get_user_settings(user_id)
+    settings = await settings_cache.get(user_id)
     
     try:
-        user_data = await get_random_user(settings)
-        if settings.results_count > 1:
-            for user in user_data['results']:
-                formatted_data = await format_user_data({'results': [user]})
-                await update.message.reply_text(formatted_data, parse_mode='Markdown')
+        try:
+            seed = parse_seed(context.args)
+        except ValueError:
+            await update.message.reply_text("Зерно генерации должно быть целым числом: /generate seed=12345")
+            return
+
+        fmt = parse_export_format(context.args, settings.output_format)
+        if fmt != "text":
+            await send_export(update, settings, seed, fmt)
+            return
+
+        if seed is None:
+            # Готовые сообщения из пула, пул пополняется в фоне
+            messages = await user_pool.take(settings, settings.results_count)
         else:
-            formatted_data = await format_user_data(user_data)
-            await update.message.reply_text(formatted_data, parse_mode='Markdown')
+            user_data = await get_random_users(settings, settings.results_count, seed)
+            messages = [await format_user_data({'results': [user]}) for user in user_data['results']]
+        await reply_records(update, messages)
+        stats.track_generation(settings.nationality, fmt, len(messages))
     except Exception as e:
         logger.error(f"Error in generate command: {str(e)}")
         await update.message.reply_text(
@@ -83,32 +138,23 @@ async def generate(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def generatejson(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обрабатывает команду /generatejson. Генерирует данные в формате JSON."""
+    """
+    Обрабатывает команду /generatejson. Генерирует данные в формате JSON.
+
+    Аргументы: ndjson, compact, csv или xml - другой формат файла,
+    seed=N - зерно генерации.
+    """
     user_id = update.effective_user.id
-    settings = db.get_user_settings(user_id)
+    settings = await settings_cache.get(user_id)
     
     try:
-        # Создаем список для хранения всех результатов
-        all_results = []
-        
-        # Генерируем данные нужное количество раз
-        for _ in range(settings.results_count):
-            user_data = await get_random_user(settings)
-            # Добавляем результат в общий список
-            all_results.extend(user_data['results'])
-        
-        # Формируем итоговый JSON со всеми результатами
-        json_data = json.dumps({
-            'count': len(all_results),
-            'results': all_results
-        }, ensure_ascii=False, indent=2)
-        
-        # Отправляем файл
-        await update.message.reply_document(
-            document=io.StringIO(json_data),
-            filename='user_data.json',
-            caption=f"Сгенерировано пользователей: {len(all_results)}"
-        )
+        try:
+            seed = parse_seed(context.args)
+        except ValueError:
+            await update.message.reply_text("Зерно генерации должно быть целым числом: /generatejson seed=12345")
+            return
+
+        await send_export(update, settings, seed, parse_export_format(context.args))
     except Exception as e:
         logger.error(f"Error in generatejson command: {str(e)}")
         await update.message.reply_text(
@@ -120,17 +166,19 @@ async def admin_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user.id not in context.bot_data['admin_ids']:
         return
     
-    session_maker = await get_session_maker_from_context(context)
-    async with session_maker() as session:
-        async with session.begin():
-            result = await session.execute(select(User))
-            users = result.scalars().all()
+    admin_ids = context.bot_data['admin_ids']
+    total = (await db.get_user_stats())['users']
     
-        users_text = "Список пользователей:\n\n"
-        for user in users:
-            users_text += f"ID: {user.telegram_id}\nUsername: @{user.username}\nAdmin: {'Да' if user.is_admin else 'Нет'}\n\n"
+    # Показываем только первую страницу: весь список не поместится в сообщение
+    users_text = "Список пользователей:\n\n"
+    async for page in db.iter_users(page_size=USERS_LIST_LIMIT):
+        for telegram_id, username in page:
+            users_text += f"ID: {telegram_id}\nUsername: @{username}\nAdmin: {'Да' if telegram_id in admin_ids else 'Нет'}\n\n"
+        break
+    if total > USERS_LIST_LIMIT:
+        users_text += f"... и еще {total - USERS_LIST_LIMIT} (всего {total})"
     
-        await update.message.reply_text(users_text)
+    await update.message.reply_text(users_text)
 
 async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправляет сообщение всем пользователям."""
@@ -162,47 +210,34 @@ async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = ' '.join(context.args)
     logger.info(f"Broadcasting message: {message[:50]}...")
     
+    if active_broadcasts:
+        await update.message.reply_text("ℹ️ Дождитесь окончания текущей рассылки или отмените ее.")
+        return
+
     try:
-        # Получаем всех пользователей через Database класс
-        logger.info("Fetching users from database...")
-        users = db.get_all_users()
+        # Получатели записываются в задание рассылки прямо в базе,
+        # без загрузки списка пользователей в память
+        job = await db.create_broadcast_job(
+            admin_id=user.id,
+            text=message,
+            parse_mode='Markdown',
+            created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
         
-        if not users:
+        if not job.total:
             logger.warning("No users found in database for broadcast")
+            await db.finish_broadcast_job(job.id, "done", job.created_at)
             await update.message.reply_text("ℹ️ Нет пользователей для рассылки.")
             return
             
-        logger.info(f"Starting broadcast to {len(users)} users")
-        await update.message.reply_text(f"📨 Начинаю рассылку {len(users)} пользователям...")
-        
-        failed_users = await broadcast_message(context.bot, users, message)
-        
-        status = "✅ Рассылка завершена\n"
-        if failed_users:
-            status += f"❌ Не удалось отправить сообщение {len(failed_users)} пользователям из {len(users)}"
-        else:
-            status += f"✅ Сообщение успешно отправлено всем пользователям ({len(users)})"
-        
-        # Сохраняем результаты рассылки
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            logger.info("Saving broadcast results...")
-            db.save_broadcast_results(
-                admin_id=user.id,
-                timestamp=timestamp,
-                total_users=len(users),
-                sent_count=len(users) - len(failed_users),
-                failed_count=len(failed_users),
-                failed_users=[u[0] if isinstance(u, tuple) else u.telegram_id for u in failed_users]
-            )
-            status += f"\n\n📝 Результаты сохранены ({timestamp})"
-            logger.info("Broadcast results saved successfully")
-        except Exception as e:
-            logger.error(f"Failed to save broadcast results: {str(e)}")
-            status += "\n\n⚠️ Не удалось сохранить результаты рассылки"
-        
-        logger.info(f"Broadcast completed. Status: {status}")
-        await update.message.reply_text(status)
+        logger.info(f"Starting broadcast to {job.total} users")
+        status_message = await update.message.reply_text(
+            "📨 Выполняется рассылка...\n"
+            f"Прогресс: 0/{job.total}\n\n"
+            "Для отмены используйте команду /cancel_broadcast"
+        )
+        # Рассылка, прогресс и сохранение итогов - как у рассылки из панели администратора
+        start_broadcast(context.application, job, status_message, update)
         
     except Exception as e:
         error_msg = f"Error in broadcast: {str(e)}"
@@ -223,6 +258,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "   - Настройки пароля\n"
         "   - Выбор полей\n"
         "   - Количество результатов\n"
+        "   - Формат вывода (текст, JSON, NDJSON, CSV, XML)\n"
         "/help - Показать это сообщение\n\n"
         "По умолчанию генерируются пользователи обоих полов "
         "из нескольких стран со стандартными полями данных.",
@@ -231,7 +267,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    settings = db.get_user_settings(user_id)
+    settings = await settings_cache.get(user_id)
     formatted_settings = format_settings(settings)
     
     # Сохраняем текущие настройки в контексте
@@ -249,7 +285,7 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
     query = update.callback_query
     user_id = query.from_user.id
     data = query.data
-    settings = db.get_user_settings(user_id)
+    settings = await settings_cache.get(user_id)
 
     await query.answer()
 
@@ -257,7 +293,7 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
         settings = UserSettings(user_id)
         for key, value in DEFAULT_SETTINGS.items():
             setattr(settings, key, value)
-        db.save_user_settings(settings)
+        await settings_cache.save(settings)
         context.user_data['settings'] = settings.__dict__
         formatted_settings = format_settings(settings)
         await query.message.edit_text(
@@ -301,10 +337,46 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
             reply_markup=get_results_count_keyboard()
         )
     
+    elif data == "settings_format":
+        await query.message.edit_text(
+            "📄 Выберите формат результата /generate:\n"
+            "(текст - сообщения в чате, остальные - файл)\n\n"
+            "Нижние кнопки - сжатие файлов (авто - для больших выгрузок)",
+            reply_markup=get_output_format_keyboard(settings.output_format, settings.compression)
+        )
+    
+    elif data.startswith("format_"):
+        fmt = data.split("_", 1)[1]
+        if fmt in OUTPUT_FORMATS:
+            settings.output_format = fmt
+            await settings_cache.save(settings)
+        formatted_settings = format_settings(settings)
+        await query.message.edit_text(
+            "⚙️ *Настройки генерации*\n\n"
+            f"{formatted_settings}\n\n"
+            f"✅ Формат установлен: {OUTPUT_FORMATS.get(settings.output_format)}",
+            reply_markup=get_settings_keyboard(context),
+            parse_mode='Markdown'
+        )
+    
+    elif data.startswith("compress_"):
+        mode = data.split("_", 1)[1]
+        if mode in COMPRESSION_MODES:
+            settings.compression = mode
+            await settings_cache.save(settings)
+        formatted_settings = format_settings(settings)
+        await query.message.edit_text(
+            "⚙️ *Настройки генерации*\n\n"
+            f"{formatted_settings}\n\n"
+            f"✅ Сжатие файлов: {COMPRESSION_MODES.get(settings.compression)}",
+            reply_markup=get_settings_keyboard(context),
+            parse_mode='Markdown'
+        )
+    
     elif data.startswith("gender_"):
         gender = data.split("_")[1]
         settings.gender = None if gender == "any" else gender
-        db.save_user_settings(settings)
+        await settings_cache.save(settings)
         formatted_settings = format_settings(settings)
         await query.message.edit_text(
             "⚙️ *Настройки генерации*\n\n"
@@ -322,7 +394,7 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
             settings.nationality.remove(nat)
         else:
             settings.nationality.append(nat)
-        db.save_user_settings(settings)
+        await settings_cache.save(settings)
         await query.message.edit_text(
             "🌍 Выберите национальности:\n"
             "(Можно выбрать несколько)\n\n"
@@ -331,14 +403,14 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
         )
     
     elif data.startswith("field_"):
-        field = data.split("_")[1]
+        field = data.split("_", 1)[1]
         if settings.include_fields is None:
             settings.include_fields = []
         if field in settings.include_fields:
             settings.include_fields.remove(field)
         else:
             settings.include_fields.append(field)
-        db.save_user_settings(settings)
+        await settings_cache.save(settings)
         await query.message.edit_text(
             "📋 Выберите поля для включения в результат:\n\n"
             f"Текущие поля: {', '.join(settings.include_fields) if settings.include_fields else 'Все'}",
@@ -348,7 +420,7 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
     elif data.startswith("count_"):
         count = int(data.split("_")[1])
         settings.results_count = count
-        db.save_user_settings(settings)
+        await settings_cache.save(settings)
         formatted_settings = format_settings(settings)
         await query.message.edit_text(
             "⚙️ *Настройки генерации*\n\n"
@@ -375,7 +447,7 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
             else:
                 current_settings.append(param)
             settings.password_settings = ",".join(current_settings) if current_settings else None
-            db.save_user_settings(settings)
+            await settings_cache.save(settings)
             
             # Форматируем текущие настройки для отображения
             display_settings = []
@@ -426,7 +498,7 @@ async def handle_password_length(update: Update, context: ContextTypes.DEFAULT_T
 
     text = update.message.text
     user_id = update.effective_user.id
-    settings = db.get_user_settings(user_id)
+    settings = await settings_cache.get(user_id)
     
     try:
         if '-' in text:
@@ -461,7 +533,7 @@ async def handle_password_length(update: Update, context: ContextTypes.DEFAULT_T
         current_settings.append(length_setting)
         settings.password_settings = ",".join(current_settings)
         
-        db.save_user_settings(settings)
+        await settings_cache.save(settings)
         
         # Форматируем сообщение об успехе
         if '-' in length_setting:
@@ -0,0 +1,113 @@
+"""
+Inline-режим: @бот в любом чате предлагает готовых сгенерированных
+пользователей, которых можно сразу отправить собеседнику.
+
+Ответ на inline-запрос должен приходить мгновенно, поэтому результаты
+(InlineQueryResultArticle) готовятся заранее и хранятся в отдельном
+пуле по профилям настроек. Если пул профиля пуст, недостающие
+результаты генерируются сразу.
+
+В запросе можно указать страну и пол: "@бот de female", "@бот ru муж".
+"""
+import copy
+import logging
+import os
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import ContextTypes
+
+from .settings_cache import settings_cache
+from .stats import stats
+from .user_pool import UserPool
+from .user_settings import UserSettings, AVAILABLE_NATIONALITIES
+from .utils import get_random_users, format_user_data, translate_gender
+
+logger = logging.getLogger(__name__)
+
+# Сколько результатов показывать в ответе на inline-запрос (не больше 50)
+INLINE_RESULTS = int(os.getenv("INLINE_RESULTS", "10"))
+# Сколько секунд Telegram кэширует ответ на одинаковый запрос пользователя
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "5"))
+# Сколько готовых результатов держать на профиль
+INLINE_POOL_SIZE = int(os.getenv("INLINE_POOL_SIZE", str(INLINE_RESULTS * 3)))
+
+# Слова запроса, задающие пол
+GENDER_WORDS = {
+    "male": "male", "m": "male", "муж": "male", "мужчина": "male", "м": "male",
+    "female": "female", "f": "female", "жен": "female", "женщина": "female", "ж": "female",
+}
+
+def parse_inline_query(query: str) -> Tuple[Optional[List[str]], Optional[str]]:
+    """
+    Извлекает из текста inline-запроса страны и пол.
+
+    Returns:
+        Tuple: (коды стран или None, male/female или None)
+    """
+    nationalities = []
+    gender = None
+    for word in query.lower().split():
+        if word.upper() in AVAILABLE_NATIONALITIES:
+            if word.upper() not in nationalities:
+                nationalities.append(word.upper())
+        elif word in GENDER_WORDS:
+            gender = GENDER_WORDS[word]
+    return nationalities or None, gender
+
+def _describe(user: dict) -> Tuple[str, str]:
+    """Заголовок и краткое описание результата."""
+    if 'name' in user:
+        title = f"{user['name']['first']} {user['name']['last']}"
+    elif 'login' in user:
+        title = user['login']['username']
+    else:
+        title = "Случайный пользователь"
+    details = []
+    if 'gender' in user:
+        details.append(translate_gender(user['gender']))
+    if 'dob' in user:
+        details.append(f"{user['dob']['age']} лет")
+    if 'location' in user:
+        details.append(f"{user['location']['country']}, {user['location']['city']}")
+    if 'email' in user:
+        details.append(user['email'])
+    return title, ", ".join(details)
+
+async def _produce_articles(settings: UserSettings, count: int) -> List[InlineQueryResultArticle]:
+    """Генерирует пользователей и оформляет их результатами inline-запроса."""
+    user_data = await get_random_users(settings, count)
+    articles = []
+    for user in user_data['results']:
+        title, description = _describe(user)
+        articles.append(InlineQueryResultArticle(
+            id=uuid4().hex,
+            title=title,
+            description=description,
+            input_message_content=InputTextMessageContent(
+                await format_user_data({'results': [user]}), parse_mode='Markdown'
+            )
+        ))
+    return articles
+
+# Готовые результаты inline-запросов
+inline_pool = UserPool(_produce_articles, size=INLINE_POOL_SIZE)
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отвечает на inline-запрос готовыми сгенерированными пользователями."""
+    query = update.inline_query
+    try:
+        nationalities, gender = parse_inline_query(query.query)
+        # Настройки пользователя, уточненные запросом; кэш не изменяется
+        settings = copy.deepcopy(await settings_cache.get(query.from_user.id))
+        if nationalities:
+            settings.nationality = nationalities
+        if gender:
+            settings.gender = gender
+
+        results = await inline_pool.take(settings, INLINE_RESULTS)
+        await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=True)
+        stats.track_generation(settings.nationality, "inline", len(results))
+    except Exception as e:
+        logger.error(f"Error in inline query: {str(e)}")
@@ -3,18 +3,24 @@ import asyncio
 import os
 import signal
 from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes, TypeHandler, InlineQueryHandler
 
 from bot.config import BOT_TOKEN, ADMIN_IDS
-from bot.database import init_db
+from bot.database import init_db, db
+from bot.generation_service import generation_service
+from bot.user_pool import user_pool
+from bot.inline import inline_pool, inline_query
+from bot.settings_cache import settings_cache
+from bot.stats import stats
+from bot.webhook import BOT_MODE, run_webhook
+from bot.update_processor import ChatOrderedUpdateProcessor
 from bot.handlers import (
     start, help_command, generate, generatejson, settings,
     handle_settings_callback, handle_password_length,
-    message_handler, admin_broadcast
+    message_handler, admin_broadcast, track_activity
 )
 from bot.admin_handlers import (
-    register_admin_handlers, handle_broadcast_message,
-    admin_menu, admin_callback, broadcast_callback
+    register_admin_handlers, handle_broadcast_message, schedule_resume_broadcasts, stop_broadcasts
 )
 
 # Настройка логирования
@@ -33,15 +39,48 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             "Произошла ошибка при обработке команды. Попробуйте позже."
         )
 
+async def post_init(application: Application) -> None:
+    """Запускает фоновые задачи после старта бота."""
+    # Рассылки возобновляются, когда приложение уже запущено (после start())
+    schedule_resume_broadcasts(application)
+
+async def post_stop(application: Application) -> None:
+    """Приостанавливает рассылки, пока база еще открыта."""
+    await stop_broadcasts()
+
+async def post_shutdown(application: Application) -> None:
+    """Освобождает ресурсы после остановки бота."""
+    await user_pool.shutdown()
+    await inline_pool.shutdown()
+    generation_service.shutdown()
+    await settings_cache.close()
+    await stats.close()
+    db.close()
+
 def run():
     """Запускает бота."""
     try:
         # Создание приложения
-        application = Application.builder().token(BOT_TOKEN).build()
+        builder = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            # Обновления разных чатов обрабатываются параллельно, одного чата - по порядку
+            .concurrent_updates(ChatOrderedUpdateProcessor())
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+        )
+        if BOT_MODE == "webhook":
+            # Обновления приходят на встроенный сервер, getUpdates не нужен
+            builder = builder.updater(None)
+        application = builder.build()
 
         # Добавляем admin_ids в контекст бота
         application.bot_data['admin_ids'] = ADMIN_IDS
 
+        # Учет активных пользователей до всех остальных обработчиков
+        application.add_handler(TypeHandler(Update, track_activity), group=-1)
+
         # Регистрация обработчиков команд
         application.add_handler(CommandHandler("start", start))
         application.add_handler(CommandHandler("help", help_command))
@@ -53,16 +92,18 @@ def run():
         # Регистрация обработчика настроек
         application.add_handler(CallbackQueryHandler(
             handle_settings_callback,
-            pattern='^(settings_|gender_|nat_|field_|count_|pass_)'
+            pattern='^(settings_|gender_|nat_|field_|count_|pass_|format_|compress_)'
         ))
 
+        # Inline-режим (@бот в любом чате)
+        application.add_handler(InlineQueryHandler(inline_query))
+
         # Регистрация обработчика текстовых сообщений
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
         
-        # Регистрация административных обработчиков
-        application.add_handler(CommandHandler("admin", admin_menu))
-        application.add_handler(CallbackQueryHandler(admin_callback, pattern='^(admin_stats|export_users|broadcast_message)$'))
-        application.add_handler(CallbackQueryHandler(broadcast_callback, pattern='^(confirm_broadcast|cancel_broadcast)$'))
+        # Регистрация административных обработчиков (/admin, кнопки меню,
+        # /cancel и /cancel_broadcast)
+        register_admin_handlers(application)
         
         # Регистрация обработчика сообщений для рассылки
         application.add_handler(MessageHandler(
@@ -76,6 +117,10 @@ def run():
         logger.info("Bot initialization completed successfully!")
         logger.info(f"Admin IDs: {ADMIN_IDS}")
 
+        if BOT_MODE == "webhook":
+            asyncio.run(run_webhook(application))
+            return
+
         # Запуск бота с новыми параметрами
         application.run_polling(
             drop_pending_updates=True,
@@ -1,10 +1,12 @@
 import random
 import string
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
-from .user_settings import PASSWORD_CHARSETS
+from .user_settings import PASSWORD_CHARSETS, decode_mask, encode_mask
 
-def parse_password_settings(settings_str: Optional[str]) -> tuple[List[str], int, int]:
+@lru_cache(maxsize=256)
+def parse_password_settings(settings_str: Optional[str]) -> Tuple[Tuple[str, ...], int, int]:
     """
     Парсит строку настроек пароля и возвращает список наборов символов и диапазон длины.
     
@@ -12,12 +14,14 @@ def parse_password_settings(settings_str: Optional[str]) -> tuple[List[str], int
         settings_str: Строка настроек в формате "8-12,lower,upper,number"
                      или "12,lower,upper,number" для фиксированной длины
     
+    Результат кэшируется: у пользователей немного различных строк настроек.
+    
     Returns:
-        Tuple[List[str], int, int]: (наборы символов, мин. длина, макс. длина)
+        Tuple[Tuple[str, ...], int, int]: (наборы символов, мин. длина, макс. длина)
     """
     if not settings_str:
         # Значения по умолчанию
-        return ["lower", "upper", "number"], 8, 12
+        return ("lower", "upper", "number"), 8, 12
         
     parts = settings_str.split(",")
     charsets = []
@@ -39,19 +43,42 @@ def parse_password_settings(settings_str: Optional[str]) -> tuple[List[str], int
     if not charsets:  # если не указаны наборы символов
         charsets = ["lower", "upper", "number"]
         
-    return charsets, min_length, max_length
+    return tuple(charsets), min_length, max_length
+
+def encode_password_policy(settings_str: Optional[str]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """
+    Кодирует строку настроек пароля для хранения в базе.
+    
+    Returns:
+        Tuple: (мин. длина, макс. длина, маска наборов символов)
+        или (None, None, None) для настроек по умолчанию
+    """
+    if not settings_str:
+        return None, None, None
+    charsets, min_length, max_length = parse_password_settings(settings_str)
+    return min_length, max_length, encode_mask(charsets, list(PASSWORD_CHARSETS))
+
+def decode_password_policy(min_length: Optional[int], max_length: Optional[int],
+                           charset_mask: Optional[int]) -> Optional[str]:
+    """Восстанавливает строку настроек пароля из значений encode_password_policy."""
+    if min_length is None:
+        return None
+    length = str(min_length) if min_length == max_length else f"{min_length}-{max_length}"
+    return ",".join([length] + (decode_mask(charset_mask, list(PASSWORD_CHARSETS)) or []))
 
-def generate_password(settings_str: Optional[str] = None) -> str:
+def generate_password(settings_str: Optional[str] = None, rng: Optional[random.Random] = None) -> str:
     """
     Генерирует пароль согласно настройкам.
     
     Args:
         settings_str: Строка настроек в формате "8-12,lower,upper,number"
                      или None для использования настроек по умолчанию
+        rng: Генератор случайных чисел или None для нового независимого
     
     Returns:
         str: Сгенерированный пароль
     """
+    rng = rng or random.Random()
     charsets, min_length, max_length = parse_password_settings(settings_str)
     
     # Собираем все доступные символы из выбранных наборов
@@ -63,21 +90,67 @@ def generate_password(settings_str: Optional[str] = None) -> str:
         available_chars = string.ascii_letters + string.digits
     
     # Определяем длину пароля
-    password_length = random.randint(min_length, max_length)
+    password_length = rng.randint(min_length, max_length)
     
     # Генерируем пароль
     password = ""
     
     # Сначала добавляем как минимум один символ из каждого набора
     for charset in charsets:
-        password += random.choice(PASSWORD_CHARSETS[charset])
+        password += rng.choice(PASSWORD_CHARSETS[charset])
     
     # Добавляем оставшиеся символы
     remaining_length = password_length - len(password)
-    password += ''.join(random.choice(available_chars) for _ in range(remaining_length))
+    password += ''.join(rng.choice(available_chars) for _ in range(remaining_length))
     
     # Перемешиваем символы в пароле
     password_list = list(password)
-    random.shuffle(password_list)
+    rng.shuffle(password_list)
+    
+    return ''.join(password_list)
+
+def generate_passwords(settings_str: Optional[str], count: int,
+                       rng: Optional[random.Random] = None) -> List[str]:
+    """
+    Генерирует несколько паролей по одним и тем же настройкам.
+    
+    Настройки разбираются один раз, а длины паролей и символы
+    разыгрываются сразу для всего пакета.
+    
+    Args:
+        settings_str: Строка настроек в формате "8-12,lower,upper,number"
+                     или None для использования настроек по умолчанию
+        count: Количество паролей
+        rng: Генератор случайных чисел или None для нового независимого
+    
+    Returns:
+        List[str]: Сгенерированные пароли
+    """
+    rng = rng or random.Random()
+    charsets, min_length, max_length = parse_password_settings(settings_str)
+    
+    # Собираем все доступные символы из выбранных наборов
+    available_chars = "".join(PASSWORD_CHARSETS[charset] for charset in charsets)
+    if not available_chars:  # если почему-то нет символов
+        available_chars = string.ascii_letters + string.digits
+    required_sets = [PASSWORD_CHARSETS[charset] for charset in charsets]
+    
+    lengths = rng.choices(range(min_length, max_length + 1), k=count)
+    remaining_lengths = [max(0, length - len(required_sets)) for length in lengths]
+    # Необязательные символы разыгрываются сразу для всех паролей
+    pool = rng.choices(available_chars, k=sum(remaining_lengths))
+    rnd = rng.random
+    
+    passwords = []
+    offset = 0
+    for remaining_length in remaining_lengths:
+        password_list = pool[offset:offset + remaining_length]
+        offset += remaining_length
+        # Обязательные символы вставляются на случайные позиции: это равносильно
+        # перемешиванию, так как остальные символы и так независимы
+        for chars in required_sets:
+            char = chars[int(rnd() * len(chars))]
+            password_list.insert(int(rnd() * (len(password_list) + 1)), char)
+        passwords.append(''.join(password_list))
     
-    return ''.join(password_list) 
\ No newline at end of file
+    return passwords
@@ -0,0 +1,121 @@
+"""
+Кэш настроек пользователей с отложенной записью.
+
+Настройки читаются из базы один раз и дальше отдаются из памяти.
+Изменения (например, переключение кнопок национальностей и полей)
+меняют только кэш, а фоновая задача через небольшую паузу записывает
+все накопившиеся изменения одной транзакцией.
+"""
+import asyncio
+import copy
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional, Set
+
+from .database import AsyncDatabase, db
+from .user_settings import UserSettings
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество настроек в кэше
+SETTINGS_CACHE_SIZE = int(os.getenv("SETTINGS_CACHE_SIZE", "10000"))
+# Пауза перед записью изменений, секунды (изменения за это время объединяются)
+SETTINGS_FLUSH_DELAY = float(os.getenv("SETTINGS_FLUSH_DELAY", "2.0"))
+# Наибольшая пауза между повторами неудавшейся записи, секунды
+SETTINGS_FLUSH_RETRY_MAX = float(os.getenv("SETTINGS_FLUSH_RETRY_MAX", "60"))
+
+class SettingsCache:
+    """LRU-кэш UserSettings перед базой с объединяющей отложенной записью."""
+
+    def __init__(self, database: AsyncDatabase, max_size: int = SETTINGS_CACHE_SIZE,
+                 flush_delay: float = SETTINGS_FLUSH_DELAY,
+                 flush_retry_max: float = SETTINGS_FLUSH_RETRY_MAX):
+        self.database = database
+        self.max_size = max_size
+        self.flush_delay = flush_delay
+        self.flush_retry_max = flush_retry_max
+        self._entries: "OrderedDict[int, UserSettings]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def get(self, telegram_id: int) -> UserSettings:
+        """Возвращает настройки пользователя, при необходимости загрузив их из базы."""
+        settings = self._entries.get(telegram_id)
+        if settings is not None:
+            self._entries.move_to_end(telegram_id)
+            return settings
+
+        settings = await self.database.get_user_settings(telegram_id)
+        # Пока шел запрос, настройки могли уже попасть в кэш
+        cached = self._entries.get(telegram_id)
+        if cached is not None:
+            return cached
+        self._entries[telegram_id] = settings
+        self._evict()
+        return settings
+
+    async def save(self, settings: UserSettings) -> None:
+        """Сохраняет настройки в кэш; в базу они будут записаны фоновой задачей."""
+        self._entries[settings.telegram_id] = settings
+        self._entries.move_to_end(settings.telegram_id)
+        self._dirty.add(settings.telegram_id)
+        self._evict()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    def discard(self, telegram_id: int) -> None:
+        """Забывает настройки пользователя вместе с незаписанными изменениями."""
+        self._entries.pop(telegram_id, None)
+        self._dirty.discard(telegram_id)
+
+    def _evict(self) -> None:
+        # Незаписанные настройки не вытесняются до ближайшей записи
+        if len(self._entries) <= self.max_size:
+            return
+        for telegram_id in [key for key in self._entries if key not in self._dirty]:
+            if len(self._entries) <= self.max_size:
+                break
+            del self._entries[telegram_id]
+
+    async def _delayed_flush(self) -> None:
+        delay = self.flush_delay
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+                # Изменения, сделанные во время записи, ждут следующей
+                if not self._dirty:
+                    return
+                delay = self.flush_delay
+            except Exception as e:
+                # Изменения снова помечены незаписанными: повторяем запись,
+                # удваивая паузу, пока база не станет доступна
+                delay = min(max(delay, 0.1) * 2, self.flush_retry_max)
+                logger.error(f"Error in settings cache flush: {str(e)}, retrying in {delay:.1f}s")
+
+    async def flush(self) -> None:
+        """Записывает все измененные настройки одной транзакцией."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, set()
+            # Копии, чтобы обработчики могли менять настройки во время записи
+            batch = [copy.deepcopy(self._entries[telegram_id]) for telegram_id in dirty
+                     if telegram_id in self._entries]
+            try:
+                await self.database.save_user_settings_batch(batch)
+                logger.debug(f"Flushed settings for {len(batch)} users")
+            except Exception:
+                self._dirty |= dirty
+                raise
+            self._evict()
+
+    async def close(self) -> None:
+        """Останавливает отложенную запись и записывает оставшиеся изменения."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+settings_cache = SettingsCache(db)
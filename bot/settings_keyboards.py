@@ -1,23 +1,37 @@
+from functools import lru_cache
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from .user_settings import AVAILABLE_NATIONALITIES, AVAILABLE_FIELDS, PASSWORD_CHARSETS
+from .user_settings import (
+    AVAILABLE_NATIONALITIES, AVAILABLE_FIELDS, PASSWORD_CHARSETS, OUTPUT_FORMATS, COMPRESSION_MODES,
+    encode_mask
+)
 
-def get_settings_keyboard(context=None):
-    keyboard = [
-        [
-            InlineKeyboardButton("🌍 Национальность", callback_data="settings_nationality"),
-            InlineKeyboardButton("👥 Пол", callback_data="settings_gender")
-        ],
-        [
-            InlineKeyboardButton("🔐 Пароль", callback_data="settings_password"),
-            InlineKeyboardButton("📋 Поля", callback_data="settings_fields")
-        ],
-        [InlineKeyboardButton("🔢 Количество результатов", callback_data="settings_count")],
-        [
-            InlineKeyboardButton("✅ Сохранить", callback_data="settings_save"),
-            InlineKeyboardButton("🔄 Сбросить", callback_data="settings_reset")
-        ]
+# Клавиатуры неизменяемы, поэтому одни и те же объекты отдаются всем
+# пользователям: постоянные строятся один раз, а клавиатуры с отметками
+# кэшируются по битовой маске выбранных значений
+
+_BACK_BUTTON = InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")
+
+_SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🌍 Национальность", callback_data="settings_nationality"),
+        InlineKeyboardButton("👥 Пол", callback_data="settings_gender")
+    ],
+    [
+        InlineKeyboardButton("🔐 Пароль", callback_data="settings_password"),
+        InlineKeyboardButton("📋 Поля", callback_data="settings_fields")
+    ],
+    [
+        InlineKeyboardButton("🔢 Количество результатов", callback_data="settings_count"),
+        InlineKeyboardButton("📄 Формат", callback_data="settings_format")
+    ],
+    [
+        InlineKeyboardButton("✅ Сохранить", callback_data="settings_save"),
+        InlineKeyboardButton("🔄 Сбросить", callback_data="settings_reset")
     ]
-    return InlineKeyboardMarkup(keyboard)
+])
+
+def get_settings_keyboard(context=None):
+    return _SETTINGS_KEYBOARD
 
 def is_preset_active(preset_settings, current_settings):
     """Проверяет, соответствуют ли текущие настройки пресету"""
@@ -61,26 +75,28 @@ def get_presets_keyboard():
     keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")])
     return InlineKeyboardMarkup(keyboard)
 
+_GENDER_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("👨 Мужской", callback_data="gender_male"),
+        InlineKeyboardButton("👩 Женский", callback_data="gender_female")
+    ],
+    [InlineKeyboardButton("🔄 Любой", callback_data="gender_any")],
+    [_BACK_BUTTON]
+])
+
 def get_gender_keyboard():
-    keyboard = [
-        [
-            InlineKeyboardButton("👨 Мужской", callback_data="gender_male"),
-            InlineKeyboardButton("👩 Женский", callback_data="gender_female")
-        ],
-        [InlineKeyboardButton("🔄 Любой", callback_data="gender_any")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return _GENDER_KEYBOARD
 
 def get_nationality_keyboard(selected_nations=None):
-    if selected_nations is None:
-        selected_nations = []
-    
+    return _nationality_keyboard(encode_mask(selected_nations, AVAILABLE_NATIONALITIES))
+
+@lru_cache(maxsize=None)
+def _nationality_keyboard(mask: int) -> InlineKeyboardMarkup:
     keyboard = []
     row = []
     
-    for nat in AVAILABLE_NATIONALITIES:
-        mark = "✅" if nat in selected_nations else "⬜️"
+    for bit, nat in enumerate(AVAILABLE_NATIONALITIES):
+        mark = "✅" if mask >> bit & 1 else "⬜️"
         row.append(InlineKeyboardButton(
             f"{mark} {nat}",
             callback_data=f"nat_{nat}"
@@ -93,33 +109,36 @@ def get_nationality_keyboard(selected_nations=None):
     if row:
         keyboard.append(row)
     
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")])
+    keyboard.append([_BACK_BUTTON])
     return InlineKeyboardMarkup(keyboard)
 
+_PASSWORD_SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🔡 Строчные", callback_data="pass_lower"),
+        InlineKeyboardButton("🔠 Прописные", callback_data="pass_upper")
+    ],
+    [
+        InlineKeyboardButton("🔢 Цифры", callback_data="pass_number"),
+        InlineKeyboardButton("❗️ Спецсимволы", callback_data="pass_special")
+    ],
+    [InlineKeyboardButton("📏 Длина пароля", callback_data="pass_length")],
+    [_BACK_BUTTON]
+])
+
 def get_password_settings_keyboard():
-    keyboard = [
-        [
-            InlineKeyboardButton("🔡 Строчные", callback_data="pass_lower"),
-            InlineKeyboardButton("🔠 Прописные", callback_data="pass_upper")
-        ],
-        [
-            InlineKeyboardButton("🔢 Цифры", callback_data="pass_number"),
-            InlineKeyboardButton("❗️ Спецсимволы", callback_data="pass_special")
-        ],
-        [InlineKeyboardButton("📏 Длина пароля", callback_data="pass_length")],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+    return _PASSWORD_SETTINGS_KEYBOARD
 
 def get_fields_keyboard(include_fields=None):
-    if include_fields is None:
-        include_fields = []
-    
+    return _fields_keyboard(encode_mask(include_fields, AVAILABLE_FIELDS))
+
+# Наборов полей слишком много, чтобы кэшировать все; держим часто используемые
+@lru_cache(maxsize=1024)
+def _fields_keyboard(mask: int) -> InlineKeyboardMarkup:
     keyboard = []
     row = []
     
-    for field in AVAILABLE_FIELDS:
-        mark = "✅" if field in include_fields else "⬜️"
+    for bit, field in enumerate(AVAILABLE_FIELDS):
+        mark = "✅" if mask >> bit & 1 else "⬜️"
         row.append(InlineKeyboardButton(
             f"{mark} {field}",
             callback_data=f"field_{field}"
@@ -132,21 +151,57 @@ def get_fields_keyboard(include_fields=None):
     if row:
         keyboard.append(row)
     
-    keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")])
+    keyboard.append([_BACK_BUTTON])
     return InlineKeyboardMarkup(keyboard)
 
+_RESULTS_COUNT_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("1", callback_data="count_1"),
+        InlineKeyboardButton("5", callback_data="count_5"),
+        InlineKeyboardButton("10", callback_data="count_10")
+    ],
+    [
+        InlineKeyboardButton("25", callback_data="count_25"),
+        InlineKeyboardButton("50", callback_data="count_50"),
+        InlineKeyboardButton("100", callback_data="count_100")
+    ],
+    [_BACK_BUTTON]
+])
+
 def get_results_count_keyboard():
-    keyboard = [
-        [
-            InlineKeyboardButton("1", callback_data="count_1"),
-            InlineKeyboardButton("5", callback_data="count_5"),
-            InlineKeyboardButton("10", callback_data="count_10")
-        ],
-        [
-            InlineKeyboardButton("25", callback_data="count_25"),
-            InlineKeyboardButton("50", callback_data="count_50"),
-            InlineKeyboardButton("100", callback_data="count_100")
-        ],
-        [InlineKeyboardButton("⬅️ Назад", callback_data="settings_back")]
-    ]
-    return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+    return _RESULTS_COUNT_KEYBOARD
+
+@lru_cache(maxsize=None)
+def get_output_format_keyboard(current_format=None, current_compression=None):
+    keyboard = []
+    row = []
+    
+    for fmt, title in OUTPUT_FORMATS.items():
+        mark = "✅ " if fmt == current_format else ""
+        row.append(InlineKeyboardButton(
+            f"{mark}{title}",
+            callback_data=f"format_{fmt}"
+        ))
+        
+        if len(row) == 2:
+            keyboard.append(row)
+            row = []
+    
+    if row:
+        keyboard.append(row)
+    
+    # Сжатие файлов
+    row = []
+    for mode, title in COMPRESSION_MODES.items():
+        mark = "✅ " if mode == current_compression else ""
+        row.append(InlineKeyboardButton(
+            f"{mark}{title}",
+            callback_data=f"compress_{mode}"
+        ))
+        
+        if len(row) == 2:
+            keyboard.append(row)
+            row = []
+    
+    keyboard.append([_BACK_BUTTON])
+    return InlineKeyboardMarkup(keyboard)
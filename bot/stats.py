@@ -0,0 +1,121 @@
+"""
+Статистика бота на счетчиках.
+
+Обработчики только увеличивают счетчики в памяти, а фоновая задача
+периодически прибавляет накопленное к дневным итогам в базе
+(таблица stats_daily). Панель администратора читает только эти итоги
+и не пересчитывает исходные таблицы.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from .database import AsyncDatabase, db
+
+logger = logging.getLogger(__name__)
+
+# Как часто счетчики записываются в базу, секунды
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "60"))
+
+# Метрики дневной статистики
+ACTIVE_USERS = "active_users"
+GENERATED_USERS = "generated_users"  # сгенерировано записей
+# Запросов, в настройках которых выбрана национальность; страну каждой
+# записи выбирает генератор, поэтому записи по странам не считаются
+REQUESTED_NATIONALITY = "requested_nationality"
+GENERATED_FORMAT = "generated_format"  # запросов по формату вывода
+BROADCAST = "broadcast"  # получателей рассылок по итогу отправки
+
+class StatsCollector:
+    """Счетчики в памяти с периодической записью в дневные итоги."""
+
+    def __init__(self, database: AsyncDatabase, flush_interval: float = STATS_FLUSH_INTERVAL):
+        self.database = database
+        self.flush_interval = flush_interval
+        self._counters: Counter = Counter()
+        self._active: Set[Tuple[str, int]] = set()
+        # Пользователи, уже учтенные сегодня: повторно их в базу не пишем
+        self._seen_day: Optional[str] = None
+        self._seen: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def increment(self, metric: str, key: str = "", value: int = 1) -> None:
+        """Прибавляет value к счетчику metric в разрезе key за сегодня."""
+        if value:
+            self._counters[date.today().isoformat(), metric, key] += value
+            self._schedule_flush()
+
+    def track_active(self, telegram_id: int) -> None:
+        """Отмечает, что пользователь был активен сегодня."""
+        day = date.today().isoformat()
+        if day != self._seen_day:
+            self._seen_day = day
+            self._seen = set()
+        if telegram_id in self._seen:
+            return
+        self._seen.add(telegram_id)
+        self._active.add((day, telegram_id))
+        self._schedule_flush()
+
+    def track_generation(self, nationalities: Optional[Iterable[str]], fmt: str, count: int) -> None:
+        """Учитывает запрос генерации: количество записей, запрошенные национальности и формат."""
+        self.increment(GENERATED_USERS, value=count)
+        self.increment(GENERATED_FORMAT, fmt)
+        for code in set(code.upper() for code in nationalities or ["ALL"]):
+            self.increment(REQUESTED_NATIONALITY, code)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error in stats flush: {str(e)}")
+
+    async def flush(self) -> None:
+        """Записывает накопленные счетчики в базу одной транзакцией."""
+        async with self._flush_lock:
+            if not self._counters and not self._active:
+                return
+            counters, self._counters = self._counters, Counter()
+            active, self._active = self._active, set()
+            try:
+                await self.database.save_stats(
+                    [(day, metric, key, value) for (day, metric, key), value in counters.items()],
+                    sorted(active)
+                )
+                logger.debug(f"Flushed {len(counters)} counters and {len(active)} active users")
+            except Exception:
+                # Не записанное вернется в следующую запись
+                self._counters.update(counters)
+                self._active |= active
+                raise
+
+    async def get_daily(self, days: int) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """
+        Возвращает итоги за последние days дней, включая сегодня.
+
+        Returns:
+            Dict: metric -> key -> day -> value
+        """
+        await self.flush()
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        result: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for day, metric, key, value in await self.database.get_stats(since):
+            result.setdefault(metric, {}).setdefault(key, {})[day] = value
+        return result
+
+    async def close(self) -> None:
+        """Останавливает отложенную запись и записывает оставшиеся счетчики."""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+stats = StatsCollector(db)
@@ -0,0 +1,90 @@
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+Обновления разных чатов обрабатываются одновременно (не больше
+UPDATE_WORKERS обработчиков сразу), поэтому долгая генерация или
+рассылка одного пользователя не задерживает остальных. Обновления
+одного чата по-прежнему выполняются строго по очереди: нажатия кнопок
+настроек применяются в том порядке, в котором пришли.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Сколько обработчиков выполняется одновременно
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "32"))
+# Сколько обновлений может быть принято в работу, включая ждущих своей
+# очереди в чате; остальные ждут в очереди приложения
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "256"))
+
+class _ChatLock:
+    """Блокировка чата и количество обновлений, которые ее держат или ждут."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления параллельно, но последовательно в пределах чата."""
+
+    def __init__(self, workers: int = UPDATE_WORKERS, max_pending: int = UPDATE_MAX_PENDING):
+        # Семафор базового класса ограничивает принятые обновления, а workers -
+        # выполняющиеся. Обновление, ждущее своей очереди в чате, не занимает
+        # обработчик, и поток сообщений одного чата не блокирует остальные
+        super().__init__(max_concurrent_updates=max(workers, max_pending))
+        self.workers = workers
+        self._workers_semaphore = asyncio.BoundedSemaphore(workers)
+        self._chats: Dict[Hashable, _ChatLock] = {}
+
+    @staticmethod
+    def chat_key(update: object) -> Optional[Hashable]:
+        """
+        Ключ очереди обновления: чат, а без чата - пользователь.
+
+        Inline-запросы очереди не ждут: их порядок не важен, а ответ нужен
+        сразу, даже если в личном чате пользователя идет долгая генерация
+        (id личного чата совпадает с id пользователя).
+        """
+        if not isinstance(update, Update):
+            return None
+        if update.inline_query is not None or update.chosen_inline_result is not None:
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.chat_key(update)
+        if key is None:
+            async with self._workers_semaphore:
+                await coroutine
+            return
+
+        chat = self._chats.get(key)
+        if chat is None:
+            chat = self._chats[key] = _ChatLock()
+        chat.users += 1
+        try:
+            async with chat.lock:
+                async with self._workers_semaphore:
+                    await coroutine
+        finally:
+            chat.users -= 1
+            if not chat.users:
+                del self._chats[key]
+
+    async def initialize(self) -> None:
+        logger.info(f"Processing updates concurrently: {self.workers} workers, ordered per chat")
+
+    async def shutdown(self) -> None:
+        pass
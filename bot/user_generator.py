@@ -1,16 +1,62 @@
 """
 Модуль для генерации случайных данных пользователей с поддержкой разных стран.
 """
+import hashlib
 import random
-import string
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union
+from itertools import permutations
+from datetime import date, datetime
+from statistics import NormalDist
+from typing import Collection, Dict, List, Optional, Union
 
-from .password_generator import generate_password
+from .password_generator import generate_passwords
 
 logger = logging.getLogger(__name__)
 
+# Поля, из которых состоит сгенерированный пользователь
+USER_FIELDS = [
+    "gender", "first_name", "last_name", "address", "email", "phone",
+    "birth_date", "age", "physical", "education", "occupation", "languages",
+    "hobbies", "marital_status", "social_media", "login", "country"
+]
+
+# Социальные сети, из которых выбираются аккаунты пользователя
+SOCIAL_MEDIA_PLATFORMS = ["Instagram", "Facebook", "Twitter", "LinkedIn", "TikTok"]
+
+def spawn_seed(seed: int, *keys: Union[int, str]) -> int:
+    """
+    Выводит из зерна независимое зерно для дочернего потока.
+
+    Один и тот же набор (seed, keys) всегда дает одно и то же зерно, а разные
+    ключи - некоррелированные, поэтому шарды воспроизводимы и независимы.
+    """
+    data = ":".join(str(part) for part in (seed, *keys)).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+def _scatter(target: list, indices: List[int], values: list) -> None:
+    """Раскладывает значения, разыгранные для группы, по позициям в пакете."""
+    for index, value in zip(indices, values):
+        target[index] = value
+
+def _draw_samples(population: List[str], sizes: List[int], rng: random.Random) -> List[List[str]]:
+    """
+    Делает выборки без повторений заданных размеров из одной совокупности.
+
+    Размеры выборок малы по сравнению с совокупностью, поэтому элементы
+    разыгрываются сразу для всех выборок, а выборки с повторами
+    разыгрываются заново - это дешевле, чем random.sample на каждую запись.
+    """
+    pool = rng.choices(population, k=sum(sizes))
+    samples = []
+    offset = 0
+    for size in sizes:
+        picked = pool[offset:offset + size]
+        offset += size
+        while len(set(picked)) < size:
+            picked = rng.choices(population, k=size)
+        samples.append(picked)
+    return samples
+
 class UserGenerator:
     # Общие данные для всех стран
     _occupations = {
@@ -195,6 +241,10 @@ class UserGenerator:
         ]
     }
 
+    # Распределение возраста: int() от нормального распределения
+    # (среднее 35, отклонение 15), ограниченного диапазоном 18-90 лет
+    _age_cum_weights = [NormalDist(35, 15).cdf(age + 1) for age in range(18, 90)] + [1.0]
+
     _blood_types = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
 
     _marital_status = {
@@ -205,7 +255,14 @@ class UserGenerator:
         "FR": ["Célibataire", "Marié(e)", "Divorcé(e)", "Veuf/Veuve"]
     }
 
-    _social_media = ["Instagram", "Facebook", "Twitter", "LinkedIn", "TikTok"]
+    _social_media = SOCIAL_MEDIA_PLATFORMS
+
+    # Все упорядоченные наборы из 2-4 социальных сетей
+    _social_media_samples = {
+        2: list(permutations(_social_media, 2)),
+        3: list(permutations(_social_media, 3)),
+        4: list(permutations(_social_media, 4))
+    }
 
     # Расширенный список почтовых доменов
     _email_domains = {
@@ -459,6 +516,46 @@ class UserGenerator:
         }
     }
 
+    # Коды операторов и телефонные коды регионов
+    _ru_phone_operators = [
+        "900", "901", "902", "903", "904", "905", "906", "908", "909", "910", "911", "912",
+        "913", "914", "915", "916", "917", "918", "919", "920", "921", "922", "923", "924",
+        "925", "926", "927", "928", "929", "930", "931", "932", "933", "934", "935", "936",
+        "937", "938", "939", "950", "951", "952", "953", "954", "955", "956", "957", "958",
+        "959", "960", "961", "962", "963", "964", "965", "966", "967", "968", "969", "980",
+        "981", "982", "983", "984", "985", "986", "987", "988", "989", "999"
+    ]
+
+    _us_area_codes = [
+        "201", "202", "203", "205", "206", "207", "208", "209", "210", "212", "213", "214",
+        "215", "216", "217", "218", "219", "220", "223", "224", "225", "227", "228", "229",
+        "231", "234", "239", "240", "248", "251", "252", "253", "254", "256", "260", "262",
+        "267", "269", "270", "272", "276", "281", "283", "301", "302", "303", "304", "305",
+        "307", "308", "309", "310", "312", "313", "314", "315", "316", "317", "318", "319",
+        "320", "321", "323", "325", "327", "330", "331", "334", "336", "337", "339", "346",
+        "347", "351", "352", "360", "361", "364", "380", "385", "386", "401", "402", "404",
+        "405", "406", "407", "408", "409", "410", "412", "413", "414", "415", "417", "419",
+        "423", "424", "425", "430", "432", "434", "435", "440", "442", "443", "447", "458",
+        "463", "469", "470", "475", "478", "479", "480", "484", "501", "502", "503", "504",
+        "505", "507", "508", "509", "510", "512", "513", "515", "516", "517", "518", "520",
+        "530", "531", "534", "539", "540", "541", "551", "559", "561", "562", "563", "564",
+        "567", "570", "571", "573", "574", "575", "580", "585", "586", "601", "602", "603",
+        "605", "606", "607", "608", "609", "610", "612", "614", "615", "616", "617", "618",
+        "619", "620", "623", "626", "628", "629", "630", "631", "636", "641", "646", "650",
+        "651", "657", "660", "661", "662", "667", "669", "678", "681", "682", "701", "702",
+        "703", "704", "706", "707", "708", "712", "713", "714", "715", "716", "717", "718",
+        "719", "720", "724", "725", "727", "730", "731", "732", "734", "737", "740", "743",
+        "747", "754", "757", "760", "762", "763", "765", "769", "770", "772", "773", "774",
+        "775", "779", "781", "785", "786", "801", "802", "803", "804", "805", "806", "808",
+        "810", "812", "813", "814", "815", "816", "817", "818", "828", "830", "831", "832",
+        "843", "845", "847", "848", "850", "854", "856", "857", "858", "859", "860", "862",
+        "863", "864", "865", "870", "872", "878", "901", "903", "904", "906", "907", "908",
+        "909", "910", "912", "913", "914", "915", "916", "917", "918", "919", "920", "925",
+        "928", "929", "930", "931", "934", "936", "937", "938", "940", "941", "947", "949",
+        "951", "952", "954", "956", "959", "970", "971", "972", "973", "975", "978", "979",
+        "980", "984", "985", "989"
+    ]
+
     # Словарь для транслитерации
     _translit_dict = {
         'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
@@ -473,246 +570,289 @@ class UserGenerator:
         'Ъ': '', 'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya'
     }
 
+    _translit_table = str.maketrans(_translit_dict)
+
+    # Транслитерированные имена всех стран, очищенные от всего, кроме букв
+    # и цифр; заполняется при первом обращении через _get_slugs
+    _slugs: Dict[str, str] = {}
+
     @classmethod
     def _transliterate(cls, text: str) -> str:
         """Преобразует кириллицу в латиницу."""
-        result = ""
-        for char in text:
-            result += cls._translit_dict.get(char, char)
-        return result
+        return text.translate(cls._translit_table)
 
     @classmethod
-    def generate_user(cls, country_code: str = "RU", gender: Optional[str] = None, password_settings: Optional[str] = None) -> Dict[str, Union[str, int, List[str]]]:
-        """Генерирует случайного пользователя."""
-        try:
-            # Проверяем и нормализуем входные данные
-            country_code = country_code.upper()
-            if country_code not in cls._countries:
-                country_code = "RU"
-            
-            # Определяем пол, если не указан
-            if gender not in ["male", "female"]:
-                gender = random.choice(["male", "female"])
-            
-            # Получаем данные страны
-            country_data = cls._countries[country_code]
-            
-            # Генерируем основные данные
-            first_name = random.choice(
-                country_data["first_names_male" if gender == "male" else "first_names_female"]
-            )
-            last_name = random.choice(
-                country_data["last_names_male" if gender == "male" else "last_names_female"]
+    def _name_slug(cls, name: str) -> str:
+        """Транслитерирует имя и оставляет в нем только буквы и цифры."""
+        return ''.join(filter(str.isalnum, cls._transliterate(name.lower())))
+
+    @classmethod
+    def _get_slugs(cls) -> Dict[str, str]:
+        """Возвращает транслитерированные формы всех имен из _countries."""
+        if not cls._slugs:
+            cls._slugs.update(
+                (name, cls._name_slug(name))
+                for country_data in cls._countries.values()
+                for key in ("first_names_male", "first_names_female", "last_names_male", "last_names_female")
+                for name in country_data[key]
             )
-            
-            # Генерируем email с транслитерацией
-            email = cls._generate_email(first_name, last_name, country_code)
-            
-            # Генерируем социальные сети
-            social_media = {}
-            for platform in random.sample(cls._social_media, random.randint(2, 4)):
-                username = cls._generate_social_media_username(first_name, last_name)
-                social_media[platform] = username
-
-            # Генерируем данные для входа
-            login_username = cls._generate_social_media_username(first_name, last_name)
-            password = generate_password(password_settings)
-
-            # Остальные данные генерируются как обычно
-            address = cls._generate_address(country_code)
-            phone = cls._generate_phone(country_code)
-            birth_date = cls._generate_birth_date()
-            age = datetime.now().year - birth_date.year
-            
-            physical = {
-                "height": random.randint(150, 200),
-                "weight": random.randint(45, 120),
-                "blood_type": random.choice(cls._blood_types)
-            }
-            
-            education = {
-                "level": random.choice(cls._education_levels[country_code]),
-                "university": random.choice(cls._universities[country_code]),
-                "graduation_year": datetime.now().year - random.randint(0, 40)
-            }
-            
-            occupation = random.choice(cls._occupations[country_code])
-            languages = random.sample(cls._languages[country_code], random.randint(1, 3))
-            hobbies = random.sample(cls._hobbies[country_code], random.randint(2, 4))
-            marital_status = random.choice(cls._marital_status[country_code])
-            
-            # Формируем результат
-            return {
-                "gender": gender,
-                "first_name": first_name,
-                "last_name": last_name,
-                "address": address,
-                "email": email,
-                "phone": phone,
-                "birth_date": birth_date.strftime("%Y-%m-%d"),
-                "age": age,
-                "physical": physical,
-                "education": education,
-                "occupation": occupation,
-                "languages": languages,
-                "hobbies": hobbies,
-                "marital_status": marital_status,
-                "social_media": social_media,
-                "login": {
-                    "username": login_username,
-                    "password": password
-                },
-                "country": country_data["name"]
-            }
-        except Exception as e:
-            logger.error(f"Error in generate_user: {str(e)}")
-            raise
+        return cls._slugs
+
+    @classmethod
+    def _normalize_countries(cls, nationalities: Optional[List[str]]) -> List[str]:
+        """Приводит список национальностей к списку доступных кодов стран."""
+        if not nationalities:
+            return cls.get_available_countries()
+        countries = [code.upper() for code in nationalities if code and code.upper() in cls._countries]
+        return countries or ["RU"]
+
+    @classmethod
+    def generate_user(cls, country_code: str = "RU", gender: Optional[str] = None, password_settings: Optional[str] = None,
+                      rng: Optional[random.Random] = None) -> Dict[str, Union[str, int, List[str]]]:
+        """Генерирует случайного пользователя."""
+        return cls.generate_batch(1, [country_code], gender, password_settings, rng=rng)[0]
 
     @classmethod
-    def generate_users(cls, count: int, country_code: str = "RU", gender: Optional[str] = None) -> List[Dict[str, Union[str, int, List[str]]]]:
+    def generate_users(cls, count: int, country_code: str = "RU", gender: Optional[str] = None,
+                       rng: Optional[random.Random] = None) -> List[Dict[str, Union[str, int, List[str]]]]:
         """Генерирует несколько случайных пользователей."""
-        return [cls.generate_user(country_code, gender) for _ in range(count)]
+        return cls.generate_batch(count, [country_code], gender, rng=rng)
+
+    @classmethod
+    def generate_batch(cls, count: int, nationalities: Optional[List[str]] = None,
+                       gender: Optional[str] = None,
+                       password_settings: Optional[str] = None,
+                       fields: Optional[Collection[str]] = None,
+                       rng: Optional[random.Random] = None,
+                       now: Optional[datetime] = None) -> List[Dict[str, Union[str, int, List[str]]]]:
+        """
+        Генерирует пакет пользователей за один проход.
+
+        Сначала все случайные поля разыгрываются сразу для всего пакета
+        (по группам страна/пол), затем из них собираются записи.
+        Поля, которых нет в fields, не генерируются вовсе.
+
+        Args:
+            count: Количество пользователей
+            nationalities: Коды стран, из которых выбирается страна каждого
+                           пользователя, или None для всех доступных стран
+            gender: "male", "female" или None для случайного пола
+            password_settings: Строка настроек пароля
+            fields: Поля из USER_FIELDS, которые нужно сгенерировать,
+                    или None для всех полей
+            rng: Генератор случайных чисел; с одним и тем же зерном
+                 результат воспроизводится. None - новый независимый генератор
+            now: Текущий момент для расчета дат и возраста (по умолчанию - сейчас)
 
-    @staticmethod
-    def _generate_id() -> int:
-        """Генерирует случайный ID."""
-        return random.randint(10000, 99999)
+        Returns:
+            List[Dict]: Сгенерированные пользователи
+        """
+        try:
+            if count <= 0:
+                return []
+
+            wanted = USER_FIELDS if fields is None else [field for field in USER_FIELDS if field in fields]
+            rng = rng or random.Random()
+            now = now or datetime.now()
+            countries = cls._normalize_countries(nationalities)
+            columns: Dict[str, list] = {}
+
+            # Страна и пол каждого пользователя нужны всегда: от них зависят остальные поля
+            codes = rng.choices(countries, k=count) if len(countries) > 1 else [countries[0]] * count
+            if gender in ["male", "female"]:
+                genders = [gender] * count
+            else:
+                genders = rng.choices(["male", "female"], k=count)
+            columns["gender"] = genders
+            columns["country"] = [cls._countries[code]["name"] for code in codes]
+
+            # Группируем индексы, чтобы разыгрывать поля сразу для всей группы
+            by_country: Dict[str, List[int]] = {}
+            for i, code in enumerate(codes):
+                by_country.setdefault(code, []).append(i)
+
+            def per_country(draw) -> list:
+                column = [None] * count
+                for code, indices in by_country.items():
+                    _scatter(column, indices, draw(code, len(indices)))
+                return column
+
+            needs_names = any(field in wanted for field in ("first_name", "last_name", "email", "social_media", "login"))
+            if needs_names:
+                by_country_gender: Dict[tuple, List[int]] = {}
+                for i, key in enumerate(zip(codes, genders)):
+                    by_country_gender.setdefault(key, []).append(i)
+
+                first_names: List[str] = [""] * count
+                last_names: List[str] = [""] * count
+                for (code, user_gender), indices in by_country_gender.items():
+                    country_data = cls._countries[code]
+                    _scatter(first_names, indices, rng.choices(country_data[f"first_names_{user_gender}"], k=len(indices)))
+                    _scatter(last_names, indices, rng.choices(country_data[f"last_names_{user_gender}"], k=len(indices)))
+                columns["first_name"] = first_names
+                columns["last_name"] = last_names
+
+                slugs = cls._get_slugs()
+                first_slugs = [slugs[name] for name in first_names]
+                last_slugs = [slugs[name] for name in last_names]
+
+            if "address" in wanted:
+                columns["address"] = per_country(lambda code, size: cls._draw_addresses(code, size, rng))
+            if "phone" in wanted:
+                columns["phone"] = per_country(lambda code, size: cls._draw_phones(code, size, rng))
+            if "email" in wanted:
+                email_domains = per_country(lambda code, size: rng.choices(cls._email_domains[code], k=size))
+                columns["email"] = cls._draw_emails(first_slugs, last_slugs, email_domains, rng)
+
+            if "birth_date" in wanted or "age" in wanted:
+                birth_dates = cls._draw_birth_dates(now, count, rng)
+                columns["birth_date"] = [birth_date.isoformat() for birth_date in birth_dates]
+                columns["age"] = [now.year - birth_date.year for birth_date in birth_dates]
+
+            if "physical" in wanted:
+                columns["physical"] = [
+                    {"height": height, "weight": weight, "blood_type": blood_type}
+                    for height, weight, blood_type in zip(
+                        rng.choices(range(150, 201), k=count),
+                        rng.choices(range(45, 121), k=count),
+                        rng.choices(cls._blood_types, k=count)
+                    )
+                ]
+
+            if "education" in wanted:
+                columns["education"] = [
+                    {"level": level, "university": university, "graduation_year": graduation_year}
+                    for level, university, graduation_year in zip(
+                        per_country(lambda code, size: rng.choices(cls._education_levels[code], k=size)),
+                        per_country(lambda code, size: rng.choices(cls._universities[code], k=size)),
+                        rng.choices(range(now.year - 40, now.year + 1), k=count)
+                    )
+                ]
+
+            if "occupation" in wanted:
+                columns["occupation"] = per_country(lambda code, size: rng.choices(cls._occupations[code], k=size))
+            if "languages" in wanted:
+                columns["languages"] = per_country(
+                    lambda code, size: _draw_samples(cls._languages[code], rng.choices(range(1, 4), k=size), rng)
+                )
+            if "hobbies" in wanted:
+                columns["hobbies"] = per_country(
+                    lambda code, size: _draw_samples(cls._hobbies[code], rng.choices(range(2, 5), k=size), rng)
+                )
+            if "marital_status" in wanted:
+                columns["marital_status"] = per_country(lambda code, size: rng.choices(cls._marital_status[code], k=size))
+
+            if "social_media" in wanted:
+                # Сначала платформы, затем все username одним пакетом
+                platforms: List[tuple] = [()] * count
+                by_platform_count: Dict[int, List[int]] = {}
+                for i, size in enumerate(rng.choices(range(2, 5), k=count)):
+                    by_platform_count.setdefault(size, []).append(i)
+                for size, indices in by_platform_count.items():
+                    _scatter(platforms, indices, rng.choices(cls._social_media_samples[size], k=len(indices)))
+                owners = [i for i, user_platforms in enumerate(platforms) for _ in user_platforms]
+                usernames = iter(cls._draw_usernames([first_slugs[i] for i in owners], [last_slugs[i] for i in owners], rng))
+                columns["social_media"] = [
+                    {platform: next(usernames) for platform in user_platforms} for user_platforms in platforms
+                ]
+
+            if "login" in wanted:
+                columns["login"] = [
+                    {"username": username, "password": password}
+                    for username, password in zip(
+                        cls._draw_usernames(first_slugs, last_slugs, rng),
+                        generate_passwords(password_settings, count, rng)
+                    )
+                ]
+
+            # Собираем записи из колонок в порядке USER_FIELDS; без полей
+            # записи все равно создаются, чтобы их было ровно count
+            if not wanted:
+                return [{} for _ in range(count)]
+            return [dict(zip(wanted, row)) for row in zip(*(columns[field] for field in wanted))]
+        except Exception as e:
+            logger.error(f"Error in generate_batch: {str(e)}")
+            raise
 
     @classmethod
-    def _generate_birth_date(cls) -> datetime:
-        """Генерирует случайную дату рождения с более реалистичным распределением."""
-        today = datetime.now()
-        # Расширяем диапазон возрастов (от 18 до 90 лет)
-        start_date = today - timedelta(days=365 * 90)
-        end_date = today - timedelta(days=365 * 18)
-        
-        # Используем нормальное распределение для более реалистичного возраста
-        mean_age = 35
-        std_dev = 15
-        age = int(random.gauss(mean_age, std_dev))
-        
-        # Ограничиваем возраст в пределах 18-90 лет
-        age = max(18, min(90, age))
-        
-        birth_date = today - timedelta(days=365 * age)
-        
+    def _draw_birth_dates(cls, now: datetime, count: int, rng: random.Random) -> List[date]:
+        """Генерирует даты рождения с более реалистичным распределением."""
+        today = now.toordinal()
+        ages = rng.choices(range(18, 91), cum_weights=cls._age_cum_weights, k=count)
         # Добавляем случайное количество дней в пределах года
-        birth_date += timedelta(days=random.randint(0, 365))
-        
-        return birth_date
+        offsets = rng.choices(range(366), k=count)
+        return [date.fromordinal(today - 365 * age + offset) for age, offset in zip(ages, offsets)]
 
     @classmethod
-    def _generate_email(cls, first_name: str, last_name: str, country_code: str) -> str:
-        """Генерирует email адрес."""
-        # Транслитерация имени и фамилии
-        first_name = cls._transliterate(first_name.lower())
-        last_name = cls._transliterate(last_name.lower())
-        
-        # Удаляем все символы, кроме букв и цифр
-        first_name = ''.join(c for c in first_name if c.isalnum())
-        last_name = ''.join(c for c in last_name if c.isalnum())
-        
-        # Генерируем варианты username
-        username_variants = [
-            f"{first_name}{last_name}",
-            f"{first_name}.{last_name}",
-            f"{first_name[0]}{last_name}",
-            f"{first_name}{last_name[:3]}",
-            f"{first_name[:3]}{last_name[:3]}"
-        ]
-        username = random.choice(username_variants)
-        
-        # Добавляем случайные цифры, если нужно
-        if random.random() < 0.7:  # 70% шанс добавления цифр
-            username += str(random.randint(1, 9999))
-        
-        domain = random.choice(cls._email_domains[country_code])
-        return f"{username}@{domain}"
+    def _draw_emails(cls, first_slugs: List[str], last_slugs: List[str], domains: List[str], rng: random.Random) -> List[str]:
+        """Генерирует email адреса для пакета пользователей."""
+        rnd = rng.random
+
+        emails = []
+        for first, last, domain in zip(first_slugs, last_slugs, domains):
+            variant = int(rnd() * 5)
+            if variant == 0:
+                username = f"{first}{last}"
+            elif variant == 1:
+                username = f"{first}.{last}"
+            elif variant == 2:
+                username = f"{first[0]}{last}"
+            elif variant == 3:
+                username = f"{first}{last[:3]}"
+            else:
+                username = f"{first[:3]}{last[:3]}"
+
+            # 70% шанс добавления цифр
+            if rnd() < 0.7:
+                username += str(int(rnd() * 9999) + 1)
+            emails.append(f"{username}@{domain}")
+        return emails
 
     @classmethod
-    def _generate_address(cls, country_code: str) -> str:
-        """Генерирует адрес."""
+    def _draw_addresses(cls, country_code: str, count: int, rng: random.Random) -> List[str]:
+        """Генерирует адреса для пакета пользователей одной страны."""
         country_data = cls._countries[country_code]
-        city = random.choice(country_data["cities"])
-        street = random.choice(country_data["streets"])
-        house = str(random.randint(1, 150))
-        apartment = str(random.randint(1, 100))
-        
+        cities = rng.choices(country_data["cities"], k=count)
+        streets = rng.choices(country_data["streets"], k=count)
+        houses = rng.choices(range(1, 151), k=count)
+
         if country_code == "RU":
-            return f"г. {city}, ул. {street}, д. {house}, кв. {apartment}"
+            apartments = rng.choices(range(1, 101), k=count)
+            return [
+                f"г. {city}, ул. {street}, д. {house}, кв. {apartment}"
+                for city, street, house, apartment in zip(cities, streets, houses, apartments)
+            ]
         elif country_code == "US":
-            street_suffix = random.choice(country_data["street_suffixes"])
-            state = random.choice(country_data["states"])
-            postal_code = f"{random.randint(10000, 99999)}"
-            return f"{house} {street} {street_suffix}, {city}, {state} {postal_code}"
+            suffixes = rng.choices(country_data["street_suffixes"], k=count)
+            states = rng.choices(country_data["states"], k=count)
+            postal_codes = rng.choices(range(10000, 100000), k=count)
+            return [
+                f"{house} {street} {suffix}, {city}, {state} {postal_code}"
+                for house, street, suffix, city, state, postal_code
+                in zip(houses, streets, suffixes, cities, states, postal_codes)
+            ]
         else:
-            return f"{house} {street} St., {city}"
-
-    @staticmethod
-    def _generate_uk_postal_code() -> str:
-        """Генерирует почтовый индекс в формате UK."""
-        area = random.choice(["SW", "SE", "NW", "NE", "W", "E", "N", "S"])
-        district = random.randint(1, 99)
-        sector = random.randint(1, 9)
-        unit = f"{random.choice(string.ascii_uppercase)}{random.choice(string.ascii_uppercase)}"
-        return f"{area}{district} {sector}{unit}"
+            return [f"{house} {street} St., {city}" for house, street, city in zip(houses, streets, cities)]
 
     @classmethod
-    def _generate_phone(cls, country_code: str) -> str:
-        """Генерирует номер телефона с учетом реальных форматов."""
-        country_data = cls._countries[country_code]
-        prefix = country_data["phone_prefix"]
-        
+    def _draw_phones(cls, country_code: str, count: int, rng: random.Random) -> List[str]:
+        """Генерирует номера телефонов с учетом реальных форматов."""
+        prefix = cls._countries[country_code]["phone_prefix"]
+
         if country_code == "RU":
-            operators = ["900", "901", "902", "903", "904", "905", "906", "908", "909",
-                       "910", "911", "912", "913", "914", "915", "916", "917", "918",
-                       "919", "920", "921", "922", "923", "924", "925", "926", "927",
-                       "928", "929", "930", "931", "932", "933", "934", "935", "936",
-                       "937", "938", "939", "950", "951", "952", "953", "954", "955",
-                       "956", "957", "958", "959", "960", "961", "962", "963", "964",
-                       "965", "966", "967", "968", "969", "980", "981", "982", "983",
-                       "984", "985", "986", "987", "988", "989", "999"]
-            return f"{prefix} {random.choice(operators)} {random.randint(100, 999)}-{random.randint(10, 99)}-{random.randint(10, 99)}"
+            operators = rng.choices(cls._ru_phone_operators, k=count)
+            first = rng.choices(range(100, 1000), k=count)
+            second = rng.choices(range(10, 100), k=count)
+            third = rng.choices(range(10, 100), k=count)
+            return [f"{prefix} {o} {a}-{b}-{c}" for o, a, b, c in zip(operators, first, second, third)]
         elif country_code == "US":
-            area_codes = ["201", "202", "203", "205", "206", "207", "208", "209", "210",
-                         "212", "213", "214", "215", "216", "217", "218", "219", "220",
-                         "223", "224", "225", "227", "228", "229", "231", "234", "239",
-                         "240", "248", "251", "252", "253", "254", "256", "260", "262",
-                         "267", "269", "270", "272", "276", "281", "283", "301", "302",
-                         "303", "304", "305", "307", "308", "309", "310", "312", "313",
-                         "314", "315", "316", "317", "318", "319", "320", "321", "323",
-                         "325", "327", "330", "331", "334", "336", "337", "339", "346",
-                         "347", "351", "352", "360", "361", "364", "380", "385", "386",
-                         "401", "402", "404", "405", "406", "407", "408", "409", "410",
-                         "412", "413", "414", "415", "417", "419", "423", "424", "425",
-                         "430", "432", "434", "435", "440", "442", "443", "447", "458",
-                         "463", "469", "470", "475", "478", "479", "480", "484", "501",
-                         "502", "503", "504", "505", "507", "508", "509", "510", "512",
-                         "513", "515", "516", "517", "518", "520", "530", "531", "534",
-                         "539", "540", "541", "551", "559", "561", "562", "563", "564",
-                         "567", "570", "571", "573", "574", "575", "580", "585", "586",
-                         "601", "602", "603", "605", "606", "607", "608", "609", "610",
-                         "612", "614", "615", "616", "617", "618", "619", "620", "623",
-                         "626", "628", "629", "630", "631", "636", "641", "646", "650",
-                         "651", "657", "660", "661", "662", "667", "669", "678", "681",
-                         "682", "701", "702", "703", "704", "706", "707", "708", "712",
-                         "713", "714", "715", "716", "717", "718", "719", "720", "724",
-                         "725", "727", "730", "731", "732", "734", "737", "740", "743",
-                         "747", "754", "757", "760", "762", "763", "765", "769", "770",
-                         "772", "773", "774", "775", "779", "781", "785", "786", "801",
-                         "802", "803", "804", "805", "806", "808", "810", "812", "813",
-                         "814", "815", "816", "817", "818", "828", "830", "831", "832",
-                         "843", "845", "847", "848", "850", "854", "856", "857", "858",
-                         "859", "860", "862", "863", "864", "865", "870", "872", "878",
-                         "901", "903", "904", "906", "907", "908", "909", "910", "912",
-                         "913", "914", "915", "916", "917", "918", "919", "920", "925",
-                         "928", "929", "930", "931", "934", "936", "937", "938", "940",
-                         "941", "947", "949", "951", "952", "954", "956", "959", "970",
-                         "971", "972", "973", "975", "978", "979", "980", "984", "985",
-                         "989"]
-            return f"{prefix} ({random.choice(area_codes)}) {random.randint(100, 999)}-{random.randint(1000, 9999)}"
+            area_codes = rng.choices(cls._us_area_codes, k=count)
+            first = rng.choices(range(100, 1000), k=count)
+            second = rng.choices(range(1000, 10000), k=count)
+            return [f"{prefix} ({code}) {a}-{b}" for code, a, b in zip(area_codes, first, second)]
         else:
-            return f"{prefix} {random.randint(100000000, 999999999)}"
+            numbers = rng.choices(range(100000000, 1000000000), k=count)
+            return [f"{prefix} {number}" for number in numbers]
 
     @classmethod
     def get_available_countries(cls) -> List[str]:
@@ -720,37 +860,37 @@ class UserGenerator:
         return list(cls._countries.keys())
 
     @classmethod
-    def _generate_social_media_username(cls, first_name: str, last_name: str) -> str:
-        """Генерирует username для социальных сетей."""
-        # Транслитерация и подготовка имени и фамилии
-        first_name = cls._transliterate(first_name.lower())
-        last_name = cls._transliterate(last_name.lower())
-        
-        # Удаляем все символы, кроме букв и цифр
-        first_name = ''.join(c for c in first_name if c.isalnum())
-        last_name = ''.join(c for c in last_name if c.isalnum())
-        
-        # Генерируем варианты username
-        username_variants = [
-            f"{first_name}{last_name}",
-            f"{first_name}_{last_name}",
-            f"{first_name}.{last_name}",
-            f"{first_name[0]}{last_name}",
-            f"the_{first_name}",
-            f"real_{first_name}",
-            f"{first_name}{random.randint(1, 999)}"
-        ]
-        
-        username = random.choice(username_variants)
-        
-        # Добавляем случайные цифры или символы
-        if random.random() < 0.5:  # 50% шанс добавления
-            if random.random() < 0.7:  # 70% шанс цифр, 30% шанс символов
-                username += str(random.randint(1, 9999))
+    def _draw_usernames(cls, first_slugs: List[str], last_slugs: List[str], rng: random.Random) -> List[str]:
+        """Генерирует username для социальных сетей для пакета имен."""
+        rnd = rng.random
+        suffix_words = ["_official", "_real", "_original", "_me"]
+
+        usernames = []
+        for first, last in zip(first_slugs, last_slugs):
+            variant = int(rnd() * 7)
+            if variant == 0:
+                username = f"{first}{last}"
+            elif variant == 1:
+                username = f"{first}_{last}"
+            elif variant == 2:
+                username = f"{first}.{last}"
+            elif variant == 3:
+                username = f"{first[0]}{last}"
+            elif variant == 4:
+                username = f"the_{first}"
+            elif variant == 5:
+                username = f"real_{first}"
             else:
-                username += random.choice(["_official", "_real", "_original", "_me"])
-        
-        return username 
+                username = f"{first}{int(rnd() * 999) + 1}"
+
+            # 50% шанс добавления: 70% цифры, 30% символы
+            roll = rnd()
+            if roll < 0.35:
+                username += str(int(rnd() * 9999) + 1)
+            elif roll < 0.5:
+                username += suffix_words[int(rnd() * 4)]
+            usernames.append(username)
+        return usernames
 
     def format_user_data(self, user_data: Dict[str, Union[str, int, List[str]]]) -> Dict[str, Union[str, int, List[str]]]:
         """Форматирует данные пользователя в нужный формат."""
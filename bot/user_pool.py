@@ -0,0 +1,144 @@
+"""
+Пул заранее сгенерированных пользователей.
+
+Большинство пользователей бота генерируют данные с одними и теми же
+настройками, поэтому для каждого профиля настроек держится запас готовых
+записей, который пополняется фоновой задачей. /generate отдает запись из
+пула сразу, а генерация новых идет вне обработки запроса.
+"""
+import asyncio
+import copy
+import logging
+import os
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from .user_settings import UserSettings
+from .utils import get_random_users, format_user_data, resolve_fields
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество профилей настроек в пуле
+USER_POOL_PROFILES = int(os.getenv("USER_POOL_PROFILES", "32"))
+# Количество готовых записей на профиль
+USER_POOL_SIZE = int(os.getenv("USER_POOL_SIZE", "50"))
+
+Producer = Callable[[UserSettings, int], Awaitable[List[Any]]]
+
+def profile_key(settings: UserSettings) -> Hashable:
+    """
+    Нормализует настройки в ключ профиля.
+
+    Настройки, дающие одинаковый результат (порядок национальностей,
+    параметров пароля и полей), попадают в один профиль.
+    """
+    result_fields, _ = resolve_fields(settings)
+    nationality = tuple(sorted({nat.upper() for nat in settings.nationality})) if settings.nationality else None
+    password = ",".join(sorted(settings.password_settings.split(","))) if settings.password_settings else None
+    return settings.gender, nationality, password, frozenset(result_fields)
+
+class _Profile:
+    """Готовые записи одного профиля и задача их пополнения."""
+
+    def __init__(self, settings: UserSettings, size: int):
+        self.settings = settings
+        self.items: Deque[Any] = deque(maxlen=size)
+        self.refill_task: Optional[asyncio.Task] = None
+
+class UserPool:
+    """Пул готовых записей по профилям настроек с вытеснением редких профилей."""
+
+    def __init__(self, producer: Producer, max_profiles: int = USER_POOL_PROFILES,
+                 size: int = USER_POOL_SIZE):
+        """
+        Args:
+            producer: Корутина (settings, count) -> список готовых записей
+            max_profiles: Сколько профилей держать; давно не использованные вытесняются
+            size: Сколько записей держать в каждом профиле
+        """
+        self.producer = producer
+        self.max_profiles = max_profiles
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._profiles: "OrderedDict[Hashable, _Profile]" = OrderedDict()
+
+    async def take(self, settings: UserSettings, count: int = 1) -> List[Any]:
+        """
+        Возвращает count записей для настроек: сколько есть из пула,
+        остальное генерирует сразу. Пул профиля пополняется в фоне.
+        """
+        key = profile_key(settings)
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = self._add_profile(key, settings)
+        else:
+            self._profiles.move_to_end(key)
+
+        items = [profile.items.popleft() for _ in range(min(count, len(profile.items)))]
+        self.hits += len(items)
+        missing = count - len(items)
+        if missing:
+            self.misses += missing
+            items.extend(await self.producer(settings, missing))
+
+        self._schedule_refill(key, profile)
+        return items
+
+    def _add_profile(self, key: Hashable, settings: UserSettings) -> _Profile:
+        # Копия: настройки из кэша изменяются на месте при переключении в меню
+        profile = _Profile(copy.deepcopy(settings), self.size)
+        self._profiles[key] = profile
+        while len(self._profiles) > self.max_profiles:
+            _, evicted = self._profiles.popitem(last=False)
+            if evicted.refill_task is not None:
+                evicted.refill_task.cancel()
+        return profile
+
+    def _schedule_refill(self, key: Hashable, profile: _Profile) -> None:
+        if len(profile.items) >= self.size:
+            return
+        if profile.refill_task is not None and not profile.refill_task.done():
+            return
+        profile.refill_task = asyncio.create_task(self._refill(key, profile))
+
+    async def _refill(self, key: Hashable, profile: _Profile) -> None:
+        """Пополняет пул профиля до полного размера."""
+        try:
+            while len(profile.items) < self.size and self._profiles.get(key) is profile:
+                items = await self.producer(profile.settings, self.size - len(profile.items))
+                if not items:
+                    # Генератор ничего не вернул: повторять бессмысленно,
+                    # следующая попытка будет при следующем запросе профиля
+                    logger.warning(f"User pool producer returned no items for profile {key}")
+                    break
+                profile.items.extend(items)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in user pool refill: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики пула: попадания, промахи, профили и готовые записи."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "profiles": len(self._profiles),
+            "items": sum(len(profile.items) for profile in self._profiles.values()),
+        }
+
+    async def shutdown(self) -> None:
+        """Останавливает фоновые задачи пополнения."""
+        tasks = [profile.refill_task for profile in self._profiles.values() if profile.refill_task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._profiles.clear()
+
+async def _produce_messages(settings: UserSettings, count: int) -> List[str]:
+    """Генерирует пользователей и форматирует их в текст для чата."""
+    user_data = await get_random_users(settings, count)
+    return [await format_user_data({'results': [user]}) for user in user_data['results']]
+
+# Готовые текстовые сообщения /generate
+user_pool = UserPool(_produce_messages)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 @dataclass
 class UserSettings:
@@ -10,18 +10,24 @@ class UserSettings:
     results_count: int = 1
     include_fields: Optional[List[str]] = None
     exclude_fields: Optional[List[str]] = None
-    output_format: str = "text"  # text/json/xml/csv
+    output_format: str = "text"  # один из OUTPUT_FORMATS
+    compression: str = "auto"  # один из COMPRESSION_MODES
 
     @staticmethod
     def get_default_settings(telegram_id: int) -> 'UserSettings':
         return UserSettings(
             telegram_id=telegram_id,
             nationality=["US", "GB", "FR", "DE"],
-            include_fields=["gender", "name", "location", "email", "login", "dob", "phone", "cell", "picture"],
+            include_fields=["gender", "name", "location", "email", "login", "dob", "phone", "cell", "picture",
+                            *EXTENDED_FIELDS],
             results_count=1,
             output_format="text"
         )
 
+# Списки национальностей, полей и наборов символов пароля хранятся в базе
+# битовыми масками по позициям элементов, поэтому их можно только дополнять
+# в конце: перестановка или удаление элемента изменит смысл сохраненных масок
+
 AVAILABLE_NATIONALITIES = [
     "RU", "US", "GB", "DE", "FR"
 ]
@@ -29,9 +35,33 @@ AVAILABLE_NATIONALITIES = [
 AVAILABLE_FIELDS = [
     "first_name", "last_name", "gender", "name", "location", "email", 
     "login", "registered", "dob", "phone", "cell", "id", "picture", 
-    "nat", "address", "birth_date", "social_media", "hobbies"
+    "nat", "address", "birth_date", "social_media", "hobbies",
+    "physical", "education", "occupation", "languages", "marital_status"
+]
+
+# Разделы профиля (физические данные, образование и т.д.), которые
+# выводятся всегда, пока пользователь не отключит их в настройках полей
+EXTENDED_FIELDS = [
+    "physical", "education", "occupation", "languages", "hobbies", "marital_status", "social_media"
 ]
 
+# Форматы вывода /generate: text - сообщения в чате, остальные - файл
+OUTPUT_FORMATS = {
+    "text": "📝 Текст",
+    "json": "🧾 JSON",
+    "ndjson": "📜 NDJSON",
+    "csv": "📊 CSV",
+    "xml": "🏷 XML"
+}
+
+# Сжатие файлов: auto - gzip только для больших выгрузок
+COMPRESSION_MODES = {
+    "auto": "🤖 Авто",
+    "none": "📄 Без сжатия",
+    "gzip": "🗜 GZIP",
+    "zip": "📦 ZIP"
+}
+
 PASSWORD_CHARSETS = {
     "special": "!\"#$%&'()*+,-./:;<=>?@[]^_`{|}~",
     "upper": "ABCDEFGHIJKLMNOPQRSTUVWXYZ",
@@ -44,5 +74,20 @@ DEFAULT_SETTINGS = {
     "gender": None,      # None означает любой пол
     "include_fields": None,  # None означает все поля
     "results_count": 1,
-    "password_settings": "8-12,lower,upper,number"  # Стандартные настройки пароля
-} 
\ No newline at end of file
+    "password_settings": "8-12,lower,upper,number",  # Стандартные настройки пароля
+    "output_format": "text",
+    "compression": "auto"
+}
+
+def encode_mask(values: Optional[Sequence[str]], available: Sequence[str]) -> int:
+    """Кодирует список значений в битовую маску по позициям в available."""
+    mask = 0
+    for bit, value in enumerate(available):
+        if values and value in values:
+            mask |= 1 << bit
+    return mask
+
+def decode_mask(mask: Optional[int], available: Sequence[str]) -> Optional[List[str]]:
+    """Декодирует битовую маску в список значений; пустая маска - None."""
+    values = [value for bit, value in enumerate(available) if mask and mask >> bit & 1]
+    return values or None
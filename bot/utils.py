@@ -1,13 +1,13 @@
 import aiohttp
 import ssl
 import logging
-import random
 import asyncio
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Iterable, List, Set, Tuple
 from telegram import Bot
 from telegram.error import TelegramError
-from .user_settings import UserSettings
-from .user_generator import UserGenerator
+from .user_settings import UserSettings, OUTPUT_FORMATS, COMPRESSION_MODES
+from .generation_service import generation_service
+from .broadcast import Broadcaster
 
 logger = logging.getLogger(__name__)
 
@@ -21,61 +21,175 @@ def escape_markdown(text):
         text = text.replace(char, f'\\{char}')
     return text
 
-async def get_random_user(settings: UserSettings = None) -> Dict[str, Any]:
-    """Генерирует случайного пользователя с учетом настроек."""
+# Поля результата, которые включает каждое поле из настроек
+_SETTINGS_FIELD_RESULTS = {
+    "first_name": ["name"],
+    "last_name": ["name"],
+    "name": ["name"],
+    "gender": ["gender"],
+    "location": ["location"],
+    "address": ["location"],
+    "nat": ["location"],
+    "email": ["email"],
+    "login": ["login"],
+    "dob": ["dob"],
+    "birth_date": ["dob"],
+    "phone": ["phone"],
+    "cell": ["cell"],
+    "social_media": ["social_media"],
+    "hobbies": ["hobbies"],
+    "physical": ["physical"],
+    "education": ["education"],
+    "occupation": ["occupation"],
+    "languages": ["languages"],
+    "marital_status": ["marital_status"],
+}
+
+# Поля генератора, из которых строится каждое поле результата
+_RESULT_FIELD_SOURCES = {
+    "name": ["first_name", "last_name"],
+    "gender": ["gender"],
+    "location": ["address", "country"],
+    "email": ["email"],
+    "login": ["login"],
+    "phone": ["phone"],
+    "cell": ["phone"],
+    "dob": ["birth_date", "age"],
+    "physical": ["physical"],
+    "education": ["education"],
+    "occupation": ["occupation"],
+    "languages": ["languages"],
+    "hobbies": ["hobbies"],
+    "marital_status": ["marital_status"],
+    "social_media": ["social_media"],
+}
+
+def resolve_fields(settings: UserSettings) -> Tuple[Set[str], Set[str]]:
+    """
+    Определяет, какие поля результата нужны пользователю и какие поля
+    генератора для них необходимо вычислить.
+
+    Returns:
+        Tuple[Set[str], Set[str]]: (поля результата, поля генератора)
+    """
+    if settings.include_fields:
+        result_fields = {
+            result_field
+            for field in settings.include_fields
+            for result_field in _SETTINGS_FIELD_RESULTS.get(field, [])
+        }
+    else:
+        result_fields = set(_RESULT_FIELD_SOURCES)
+
+    for field in settings.exclude_fields or []:
+        result_fields.difference_update(_SETTINGS_FIELD_RESULTS.get(field, []))
+
+    # Если выбранные поля не дают ни одного поля результата (например,
+    # только неизвестные поля), генерируем поля по умолчанию
+    if not result_fields:
+        result_fields = set(_RESULT_FIELD_SOURCES)
+
+    generator_fields = {
+        source for field in result_fields for source in _RESULT_FIELD_SOURCES[field]
+    }
+    return result_fields, generator_fields
+
+def _format_result(user_data: Dict[str, Any], fields: Set[str]) -> Dict[str, Any]:
+    """Приводит сгенерированного пользователя к формату результата."""
+    result = {}
+    if "name" in fields:
+        result["name"] = {
+            "first": user_data["first_name"],
+            "last": user_data["last_name"]
+        }
+    if "gender" in fields:
+        result["gender"] = user_data["gender"]
+    if "location" in fields:
+        address = user_data["address"]
+        address_parts = address.split(",") if "," in address else None
+        result["location"] = {
+            "street": {
+                "name": address_parts[0] if address_parts else "",
+                "number": ""
+            },
+            "city": address_parts[1].strip() if address_parts else "",
+            "country": user_data["country"]
+        }
+    if "email" in fields:
+        result["email"] = user_data["email"]
+    if "login" in fields:
+        result["login"] = user_data["login"]
+    if "phone" in fields:
+        result["phone"] = user_data["phone"]
+    if "cell" in fields:
+        result["cell"] = user_data["phone"]
+    if "dob" in fields:
+        result["dob"] = {
+            "date": user_data["birth_date"],
+            "age": user_data["age"]
+        }
+    for field in ("physical", "education", "occupation", "languages", "hobbies", "marital_status", "social_media"):
+        if field in fields:
+            result[field] = user_data[field]
+    return result
+
+async def iter_random_users(settings: UserSettings = None, count: int = 1,
+                            seed: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Генерирует случайных пользователей с учетом настроек и отдает
+    результаты пакетами по мере готовности шардов.
+
+    С одинаковыми seed и настройками результат воспроизводится полностью:
+    даты и возраст при заданном seed считаются от SEED_EPOCH, а не от
+    текущей даты.
+    """
     try:
         if settings is None:
             settings = UserSettings.get_default_settings(0)
 
-        # Определяем национальность
-        nationality = random.choice(settings.nationality) if settings.nationality else random.choice(UserGenerator.get_available_countries())
-
-        # Генерируем пользователя
-        user_data = UserGenerator.generate_user(
-            country_code=nationality,
+        # Генерируются только поля, которые попадут в результат
+        result_fields, generator_fields = resolve_fields(settings)
+        async for users in generation_service.iter_batches(
+            count,
+            nationalities=settings.nationality,
             gender=settings.gender,
-            password_settings=settings.password_settings
-        )
-
-        # Форматируем данные в нужный формат
-        formatted_data = {
-            "results": [{
-                "name": {
-                    "first": user_data.get("first_name", ""),
-                    "last": user_data.get("last_name", "")
-                },
-                "gender": user_data.get("gender", ""),
-                "location": {
-                    "street": {
-                        "name": user_data.get("address", "").split(",")[0] if "," in user_data.get("address", "") else "",
-                        "number": ""
-                    },
-                    "city": user_data.get("address", "").split(",")[1].strip() if "," in user_data.get("address", "") else "",
-                    "country": user_data.get("country", "")
-                },
-                "email": user_data.get("email", ""),
-                "login": user_data.get("login", {}),
-                "phone": user_data.get("phone", ""),
-                "cell": user_data.get("phone", ""),
-                "dob": {
-                    "date": user_data.get("birth_date", ""),
-                    "age": user_data.get("age", 0)
-                },
-                "physical": user_data.get("physical", {}),
-                "education": user_data.get("education", {}),
-                "occupation": user_data.get("occupation", ""),
-                "languages": user_data.get("languages", []),
-                "hobbies": user_data.get("hobbies", []),
-                "marital_status": user_data.get("marital_status", ""),
-                "social_media": user_data.get("social_media", {})
-            }]
-        }
-        
-        return formatted_data
+            password_settings=settings.password_settings,
+            fields=generator_fields,
+            seed=seed
+        ):
+            # Форматируем данные в нужный формат
+            yield [_format_result(user_data, result_fields) for user_data in users]
     except Exception as e:
-        logger.error(f"Error in get_random_user: {str(e)}")
+        logger.error(f"Error in iter_random_users: {str(e)}")
         raise
 
+async def get_random_users(settings: UserSettings = None, count: int = 1,
+                           seed: Optional[int] = None) -> Dict[str, Any]:
+    """Генерирует пакет случайных пользователей с учетом настроек."""
+    return {
+        "results": [
+            result
+            async for results in iter_random_users(settings, count, seed)
+            for result in results
+        ]
+    }
+
+async def get_random_user(settings: UserSettings = None, seed: Optional[int] = None) -> Dict[str, Any]:
+    """Генерирует случайного пользователя с учетом настроек."""
+    return await get_random_users(settings, 1, seed)
+
+def parse_seed(args: Optional[List[str]]) -> Optional[int]:
+    """
+    Извлекает зерно генерации из аргументов команды вида seed=12345.
+
+    Raises:
+        ValueError: если значение seed не является целым числом
+    """
+    for arg in args or []:
+        if arg.lower().startswith("seed="):
+            return int(arg.split("=", 1)[1])
+    return None
+
 async def format_user_data(user_data):
     user = user_data['results'][0]
     
@@ -193,36 +307,56 @@ async def check_subscription(bot: Bot, user_id: int, channel_id: str) -> bool:
         return False
 
 async def broadcast_message(bot: Bot, users, message: str):
-    failed_users = []
-    logger.info(f"Starting broadcast to {len(users) if users else 0} users")
-    
+    """Рассылает сообщение пользователям и возвращает тех, кому отправить не удалось."""
     if not users:
         logger.warning("No users to broadcast to!")
-        return failed_users
-        
-    for i, user in enumerate(users, 1):
-        try:
-            # Получаем telegram_id в зависимости от типа user
-            telegram_id = user.telegram_id if hasattr(user, 'telegram_id') else user[0]
-            logger.info(f"Sending message to user {telegram_id} ({i}/{len(users)})")
-            
-            await bot.send_message(
-                chat_id=telegram_id,
-                text=message,
-                parse_mode='Markdown'  # Добавляем поддержку Markdown
-            )
-            logger.info(f"Successfully sent message to user {telegram_id}")
-            await asyncio.sleep(0.05)  # Добавляем небольшую задержку
-            
-        except TelegramError as e:
-            logger.error(f"Telegram error while sending to user {telegram_id}: {str(e)}")
-            failed_users.append(user)
-        except Exception as e:
-            logger.error(f"Unexpected error while sending to user {telegram_id}: {str(e)}")
-            failed_users.append(user)
-            
-    logger.info(f"Broadcast completed. Failed: {len(failed_users)}/{len(users)}")
-    return failed_users
+        return []
+
+    # Получаем telegram_id в зависимости от типа user
+    by_id = {user.telegram_id if hasattr(user, 'telegram_id') else user[0]: user for user in users}
+    result = await Broadcaster(bot).run(list(by_id), message, parse_mode='Markdown')
+    return [by_id[telegram_id] for telegram_id in result.failed_users]
+
+# Максимальная длина сообщения Telegram (в единицах UTF-16)
+MESSAGE_LIMIT = 4096
+# Разделитель пользователей в одном сообщении
+RECORD_SEPARATOR = "\n\n➖➖➖➖➖\n\n"
+
+def message_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram: эмодзи вне BMP - две единицы."""
+    return len(text.encode("utf-16-le")) // 2
+
+def pack_messages(parts: Iterable[str], limit: int = MESSAGE_LIMIT,
+                  separator: str = RECORD_SEPARATOR) -> List[str]:
+    """
+    Собирает отформатированные записи в как можно меньшее число сообщений
+    не длиннее limit.
+
+    Записи не разрываются между сообщениями; запись длиннее limit
+    делится по строкам, чтобы не разорвать разметку внутри строки,
+    а слишком длинная строка - на куски.
+    """
+    messages: List[str] = []
+    current = ""
+    for part in parts:
+        if message_length(part) <= limit:
+            pieces = [part]
+        elif "\n" in part:
+            pieces = pack_messages(part.split("\n"), limit, "\n")
+        else:
+            # Символ занимает не больше двух единиц UTF-16
+            pieces = [part[i:i + limit // 2] for i in range(0, len(part), limit // 2)]
+        for piece in pieces:
+            candidate = f"{current}{separator}{piece}" if current else piece
+            if message_length(candidate) <= limit:
+                current = candidate
+                continue
+            if current:
+                messages.append(current)
+            current = piece
+    if current:
+        messages.append(current)
+    return messages
 
 def format_settings(settings):
     """Форматирует настройки для отображения пользователю."""
@@ -243,6 +377,10 @@ def format_settings(settings):
     # Количество результатов
     formatted.append(f"🔢 *Количество результатов:* {settings.results_count}")
     
+    # Формат вывода
+    formatted.append(f"📄 *Формат:* {OUTPUT_FORMATS.get(settings.output_format, settings.output_format)}")
+    formatted.append(f"🗜 *Сжатие файлов:* {COMPRESSION_MODES.get(settings.compression, settings.compression)}")
+    
     # Настройки пароля
     if settings.password_settings:
         pass_settings = []
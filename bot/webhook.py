@@ -0,0 +1,139 @@
+"""
+Прием обновлений через вебхук вместо long polling.
+
+Telegram сам отправляет обновления POST-запросами на встроенный
+aiohttp-сервер, и они сразу попадают в очередь обновлений приложения:
+нет холостых запросов getUpdates, а Telegram может держать к боту
+несколько соединений одновременно (WEBHOOK_MAX_CONNECTIONS).
+
+Режим включается переменной BOT_MODE=webhook. Если WEBHOOK_URL не задан,
+вебхук в Telegram не регистрируется - так сервер можно проверить
+локально, отправляя на него сохраненные обновления:
+
+    curl -X POST -H "Content-Type: application/json" \\
+         -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \\
+         -d @update.json http://localhost:8080/telegram
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Способ получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Публичный адрес сервера, например https://bot.example.com (без пути)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Путь, на который Telegram присылает обновления
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Адрес и порт встроенного сервера
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Сколько одновременных соединений Telegram открывает к вебхуку (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Выставляется run_webhook, когда бот запущен и вебхук зарегистрирован
+READY = web.AppKey("ready", asyncio.Event)
+
+def create_webhook_app(application: Application, path: str = WEBHOOK_PATH,
+                       secret: Optional[str] = WEBHOOK_SECRET) -> web.Application:
+    """
+    Создает aiohttp-приложение вебхука.
+
+    Маршруты:
+        POST path - обновление от Telegram, передается в очередь application
+        GET /healthz - процесс жив
+        GET /readyz - бот запущен и принимает обновления (иначе 503)
+    """
+    app = web.Application()
+    app[READY] = asyncio.Event()
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and request.headers.get(SECRET_HEADER) != secret:
+            logger.warning(f"Rejected webhook request from {request.remote}: bad secret token")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, application.bot)
+            if update is None:
+                raise ValueError("empty update")
+        except (json.JSONDecodeError, TypeError, ValueError, KeyError) as e:
+            logger.error(f"Error in webhook update parsing: {str(e)}")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def readyz(request: web.Request) -> web.Response:
+        ready = app[READY].is_set() and application.running
+        return web.json_response(
+            {"ready": ready, "pending_updates": application.update_queue.qsize()},
+            status=200 if ready else 503
+        )
+
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    return app
+
+async def run_webhook(application: Application) -> None:
+    """
+    Запускает бота в режиме вебхука и работает до SIGINT/SIGTERM.
+
+    Порядок запуска и остановки, включая post_init и post_shutdown,
+    повторяет Application.run_polling.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    app = create_webhook_app(application)
+    runner = web.AppRunner(app)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        logger.info(f"Webhook server listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                secret_token=WEBHOOK_SECRET or None
+            )
+            logger.info(f"Webhook registered with max_connections={WEBHOOK_MAX_CONNECTIONS}")
+        else:
+            logger.warning("WEBHOOK_URL is not set, webhook is not registered with Telegram")
+        app[READY].set()
+
+        await stop.wait()
+        logger.info("Stopping webhook server")
+    finally:
+        app[READY].clear()
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
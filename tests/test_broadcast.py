@@ -0,0 +1,142 @@
+"""
+Проверка рассылки против локального сервера, изображающего Bot API.
+
+Бот python-telegram-bot отправляет настоящие HTTP-запросы на aiohttp-сервер,
+который отвечает так же, как Telegram: 403 для заблокировавших бота,
+400 для несуществующих чатов и 429 с retry_after при превышении лимита.
+"""
+import asyncio
+from typing import Dict, List, Tuple
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+from telegram import Bot
+
+TOKEN = "123456:TEST"
+
+# Ответы сервера по chat_id: (HTTP-статус, описание ошибки)
+ERRORS = {
+    1: (403, "Forbidden: bot was blocked by the user"),
+    2: (400, "Bad Request: chat not found"),
+    3: (403, "Forbidden: user is deactivated"),
+    4: (400, "Bad Request: message is too long"),
+}
+# Чат, на первую отправку в который сервер отвечает 429
+FLOOD_CHAT = 5
+RETRY_AFTER = 1
+
+@pytest.fixture
+def broadcast(tmp_path, monkeypatch):
+    # База создается при импорте модуля, поэтому импортируем его во временном каталоге
+    monkeypatch.chdir(tmp_path)
+    from bot import broadcast
+    return broadcast
+
+class FakeBotApi:
+    """Локальный Bot API: getMe и sendMessage с журналом запросов."""
+
+    def __init__(self):
+        self.requests: List[Tuple[float, int]] = []
+        self.flood_at: float = 0.0
+        self._flooded = False
+        self._runner = None
+        self.url = ""
+
+    async def _get_me(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True, "result": {
+            "id": 123456, "is_bot": True, "first_name": "Test", "username": "test_bot"
+        }})
+
+    async def _send_message(self, request: web.Request) -> web.Response:
+        data = await request.post() if request.content_type != "application/json" else await request.json()
+        chat_id = int(data["chat_id"])
+        now = asyncio.get_running_loop().time()
+        self.requests.append((now, chat_id))
+        if chat_id == FLOOD_CHAT and not self._flooded:
+            self._flooded = True
+            self.flood_at = now
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {RETRY_AFTER}",
+                "parameters": {"retry_after": RETRY_AFTER}
+            }, status=429)
+        if chat_id in ERRORS:
+            status, description = ERRORS[chat_id]
+            return web.json_response({"ok": False, "error_code": status, "description": description},
+                                     status=status)
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(self.requests), "date": 0,
+            "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", "")
+        }})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post(f"/bot{TOKEN}/getMe", self._get_me)
+        app.router.add_post(f"/bot{TOKEN}/sendMessage", self._send_message)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        port = unused_port()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+        self.url = f"http://127.0.0.1:{port}/bot"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+async def _run_broadcast(broadcast, chat_ids: List[int], rate: float, concurrency: int = 5):
+    api = FakeBotApi()
+    await api.start()
+    try:
+        async with Bot(TOKEN, base_url=api.url) as bot:
+            broadcaster = broadcast.Broadcaster(
+                bot, bucket=broadcast.TokenBucket(rate, capacity=1), concurrency=concurrency, max_retries=0
+            )
+            result = await broadcaster.run(chat_ids, "test")
+    finally:
+        await api.stop()
+    return api, result
+
+def test_rate_limit(broadcast):
+    rate = 20
+    chat_ids = list(range(100, 140))
+    api, result = asyncio.run(_run_broadcast(broadcast, chat_ids, rate))
+
+    assert result.sent == len(chat_ids)
+    times = sorted(t for t, _ in api.requests)
+    # Корзина на один токен: запросы идут не чаще rate в секунду
+    assert times[-1] - times[0] >= (len(times) - 1) / rate * 0.9
+    for i in range(len(times) - rate):
+        assert times[i + rate] - times[i] >= 0.9
+
+def test_retry_after_pauses_broadcast(broadcast):
+    chat_ids = list(range(100, 110)) + [FLOOD_CHAT] + list(range(110, 130))
+    api, result = asyncio.run(_run_broadcast(broadcast, chat_ids, rate=50))
+
+    assert result.sent == len(chat_ids)
+    # Повтор после 429 не считается ошибкой, а отправка в этот чат повторяется
+    assert [chat_id for _, chat_id in api.requests].count(FLOOD_CHAT) == 2
+    # Пока действует retry_after, не отправляется ни одно сообщение рассылки;
+    # успевают только запросы, получившие токен до ответа 429
+    during_pause = [t for t, _ in api.requests if api.flood_at + 0.1 < t < api.flood_at + RETRY_AFTER - 0.05]
+    assert not during_pause
+    retried = [t for t, chat_id in api.requests if chat_id == FLOOD_CHAT][1]
+    assert retried >= api.flood_at + RETRY_AFTER - 0.05
+
+def test_error_classification(broadcast):
+    chat_ids = [1, 2, 3, 4, 100]
+    _, result = asyncio.run(_run_broadcast(broadcast, chat_ids, rate=50))
+
+    statuses: Dict[int, str] = dict(result.statuses)
+    assert statuses == {
+        1: broadcast.BLOCKED,
+        2: broadcast.NOT_FOUND,
+        3: broadcast.BLOCKED,
+        4: broadcast.FAILED,
+        100: broadcast.SENT,
+    }
+    assert (result.sent, result.blocked, result.not_found, result.failed) == (1, 2, 1, 1)
+    assert sorted(result.failed_users) == [1, 2, 3, 4]
+
+def test_broadcasters_share_bucket(broadcast):
+    bot = Bot(TOKEN)
+    assert broadcast.Broadcaster(bot).bucket is broadcast.Broadcaster(bot).bucket is broadcast.broadcast_bucket
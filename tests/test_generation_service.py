@@ -0,0 +1,67 @@
+"""
+Воспроизводимость генерации с зерном.
+
+Одинаковые зерно и настройки должны давать одинаковые записи независимо
+от дня запуска и от того, генерировались шарды в цикле событий или в
+пуле процессов: на этом держатся фикстуры и кэш по (seed, настройки).
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List
+
+import pytest
+
+from bot import generation_service as service_module
+from bot.generation_service import SEED_EPOCH, GenerationService
+
+SEED = 12345
+COUNT = 60
+
+class _FrozenDatetime(datetime):
+    """datetime, у которого now() возвращает заданный момент."""
+
+    frozen: datetime = datetime(2030, 6, 15, 12, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen
+
+def _generate(service: GenerationService, seed=SEED, count: int = COUNT) -> List[Dict]:
+    async def run() -> List[Dict]:
+        return await service.generate_batch(count, nationalities=["US", "DE"], seed=seed)
+    try:
+        return asyncio.run(run())
+    finally:
+        service.shutdown()
+
+@pytest.fixture
+def frozen_now(monkeypatch):
+    monkeypatch.setattr(service_module, "datetime", _FrozenDatetime)
+    return _FrozenDatetime
+
+def _pool_service() -> GenerationService:
+    # count > inline_limit: шарды считаются в пуле процессов
+    return GenerationService(max_workers=2, shard_size=25, inline_limit=10)
+
+def test_seed_reproducible_across_days_in_process_pool(frozen_now):
+    frozen_now.frozen = datetime(2026, 1, 1, 9, 0)
+    first = _generate(_pool_service())
+    frozen_now.frozen = datetime(2031, 12, 31, 23, 59)
+    second = _generate(_pool_service())
+
+    assert len(first) == COUNT
+    assert first == second
+    assert all(user["age"] == SEED_EPOCH.year - int(user["birth_date"][:4]) for user in first)
+
+def test_seed_same_in_process_pool_and_inline():
+    pooled = _generate(_pool_service())
+    inline = _generate(GenerationService(max_workers=2, shard_size=25, inline_limit=COUNT))
+
+    assert pooled == inline
+
+def test_without_seed_dates_follow_current_day(frozen_now):
+    frozen_now.frozen = datetime(2040, 1, 1)
+    users = _generate(GenerationService(max_workers=1, inline_limit=COUNT), seed=None)
+
+    # Без зерна возраст по-прежнему считается от текущего момента
+    assert all(user["age"] == 2040 - int(user["birth_date"][:4]) for user in users)
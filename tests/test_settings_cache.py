@@ -0,0 +1,56 @@
+"""
+Отложенная запись SettingsCache при недоступной базе.
+
+Вместо базы используется объект, который отказывает заданное число раз,
+а затем запоминает записанные настройки.
+"""
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+@pytest.fixture
+def cache_module(tmp_path, monkeypatch):
+    # База создается при импорте модуля, поэтому импортируем его во временном каталоге
+    monkeypatch.chdir(tmp_path)
+    from bot import settings_cache
+    return settings_cache
+
+class FlakyDatabase:
+    """Отказывает в записи failures раз, затем сохраняет настройки."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts: List[float] = []
+        self.saved: Dict[int, List[str]] = {}
+
+    async def save_user_settings_batch(self, batch) -> None:
+        self.attempts.append(asyncio.get_running_loop().time())
+        if len(self.attempts) <= self.failures:
+            raise RuntimeError("database is locked")
+        for settings in batch:
+            self.saved[settings.telegram_id] = list(settings.nationality)
+
+def test_failed_flush_is_retried_with_backoff(cache_module):
+    from bot.user_settings import UserSettings
+
+    async def run() -> FlakyDatabase:
+        database = FlakyDatabase(failures=3)
+        cache = cache_module.SettingsCache(database, flush_delay=0.01, flush_retry_max=0.4)
+        await cache.save(UserSettings(telegram_id=1, nationality=["US"]))
+        await cache.save(UserSettings(telegram_id=2, nationality=["DE"]))
+        # Новых изменений нет: запись повторяется без вызовов save
+        for _ in range(100):
+            if database.saved:
+                break
+            await asyncio.sleep(0.05)
+        assert cache._flush_task.done()
+        return database
+
+    database = asyncio.run(run())
+    assert database.saved == {1: ["US"], 2: ["DE"]}
+    assert len(database.attempts) == 4
+    pauses = [b - a for a, b in zip(database.attempts, database.attempts[1:])]
+    # Паузы растут: 0.2, 0.4 и дальше не больше flush_retry_max
+    assert pauses[0] >= 0.19 and pauses[1] >= 0.39 and pauses[2] >= 0.39
+    assert max(pauses) < 0.6
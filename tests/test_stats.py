@@ -0,0 +1,51 @@
+"""
+Счетчики генераций StatsCollector.
+
+Вместо базы используется объект, который запоминает записанные итоги.
+"""
+import asyncio
+from typing import Dict, List, Tuple
+
+import pytest
+
+@pytest.fixture
+def stats_module(tmp_path, monkeypatch):
+    # База создается при импорте модуля, поэтому импортируем его во временном каталоге
+    monkeypatch.chdir(tmp_path)
+    from bot import stats
+    return stats
+
+class FakeDatabase:
+    """Запоминает итоги, которые StatsCollector записывает в базу."""
+
+    def __init__(self):
+        self.rows: List[Tuple[str, str, str, int]] = []
+
+    async def save_stats(self, rows, active) -> None:
+        self.rows.extend(rows)
+
+def _track(stats_module, requests) -> Dict[Tuple[str, str], int]:
+    async def run() -> Dict[Tuple[str, str], int]:
+        database = FakeDatabase()
+        collector = stats_module.StatsCollector(database, flush_interval=60)
+        for nationalities, fmt, count in requests:
+            collector.track_generation(nationalities, fmt, count)
+        await collector.close()
+        totals: Dict[Tuple[str, str], int] = {}
+        for _, metric, key, value in database.rows:
+            totals[metric, key] = totals.get((metric, key), 0) + value
+        return totals
+    return asyncio.run(run())
+
+def test_nationalities_count_requests_not_records(stats_module):
+    totals = _track(stats_module, [
+        (["US", "DE", "fr"], "json", 100),
+        (["us"], "text", 5),
+        (None, "inline", 20),
+    ])
+
+    # Записи считаются один раз, а не по разу на каждую выбранную национальность
+    assert totals[stats_module.GENERATED_USERS, ""] == 125
+    assert {key: value for (metric, key), value in totals.items()
+            if metric == stats_module.REQUESTED_NATIONALITY} == {"US": 2, "DE": 1, "FR": 1, "ALL": 1}
+    assert totals[stats_module.GENERATED_FORMAT, "json"] == 1
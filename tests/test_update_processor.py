@@ -0,0 +1,124 @@
+"""
+Нагрузочная проверка ChatOrderedUpdateProcessor.
+
+Поток обновлений моделирует обычную нагрузку бота: много коротких
+запросов от разных пользователей, редкие тяжелые /generate и долгая
+рассылка администратора. Последовательная обработка (как без
+concurrent_updates) сравнивается с параллельной по задержке от прихода
+обновления до окончания его обработки.
+
+Запуск с выводом задержек: python -m tests.test_update_processor
+"""
+import asyncio
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from telegram import Chat, InlineQuery, Message, Update, User
+
+from bot.update_processor import ChatOrderedUpdateProcessor
+
+# Интервал между обновлениями и длительность обработчиков, секунды
+ARRIVAL_INTERVAL = 0.0005
+LIGHT, HEAVY, BROADCAST = 0.0015, 0.04, 0.2
+HEAVY_CHAT, ADMIN_CHAT = 1, 2
+
+def _message_update(update_id: int, chat_id: int) -> Update:
+    user = User(chat_id, "user", False)
+    return Update(update_id, message=Message(update_id, datetime.now(), Chat(chat_id, "private"),
+                                             from_user=user, text="x"))
+
+def _workload(count: int = 600, seed: int = 1) -> List[Tuple[Update, float]]:
+    rng = random.Random(seed)
+    work = []
+    for update_id in range(count):
+        r = rng.random()
+        if r < 0.03:
+            work.append((_message_update(update_id, HEAVY_CHAT), HEAVY))
+        elif r < 0.035:
+            work.append((_message_update(update_id, ADMIN_CHAT), BROADCAST))
+        else:
+            work.append((_message_update(update_id, rng.randint(3, 52)), LIGHT))
+    return work
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+async def _run(work: List[Tuple[Update, float]], concurrent: bool) -> Tuple[List[float], Dict[int, List[int]], int]:
+    """Прогоняет поток обновлений; возвращает задержки, порядок по чатам и оставшиеся блокировки."""
+    processor = ChatOrderedUpdateProcessor(workers=32, max_pending=256)
+    await processor.initialize()
+    latencies: List[float] = []
+    order: Dict[int, List[int]] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def handler(update: Update, duration: float, received: float) -> None:
+        await asyncio.sleep(duration)
+        latencies.append(time.perf_counter() - received)
+        order.setdefault(update.effective_chat.id, []).append(update.update_id)
+
+    async def producer() -> None:
+        for update, duration in work:
+            await queue.put((update, duration, time.perf_counter()))
+            await asyncio.sleep(ARRIVAL_INTERVAL)
+        await queue.put(None)
+
+    async def consumer() -> None:
+        tasks = []
+        while (item := await queue.get()) is not None:
+            update, duration, received = item
+            if concurrent:
+                tasks.append(asyncio.create_task(processor.process_update(update, handler(*item))))
+            else:
+                await handler(update, duration, received)
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(producer(), consumer())
+    return latencies, order, len(processor._chats)
+
+def test_concurrent_processing_cuts_tail_latency():
+    work = _workload()
+    sequential, _, _ = asyncio.run(_run(work, concurrent=False))
+    concurrent, order, chats_left = asyncio.run(_run(work, concurrent=True))
+
+    assert len(concurrent) == len(work)
+    # Долгие обработчики одного чата больше не задерживают остальных
+    assert _percentile(concurrent, 0.99) < _percentile(sequential, 0.99) / 4
+    assert _percentile(concurrent, 0.5) < _percentile(sequential, 0.5) / 10
+    # Внутри чата обновления обработаны в порядке прихода
+    assert all(ids == sorted(ids) for ids in order.values())
+    assert chats_left == 0
+
+def test_inline_query_bypasses_chat_lock():
+    user = User(HEAVY_CHAT, "user", False)
+    inline = Update(2, inline_query=InlineQuery("1", user, "de", ""))
+    assert ChatOrderedUpdateProcessor.chat_key(inline) is None
+    assert ChatOrderedUpdateProcessor.chat_key(_message_update(1, HEAVY_CHAT)) == HEAVY_CHAT
+
+    async def run() -> List[str]:
+        processor = ChatOrderedUpdateProcessor(workers=4)
+        finished: List[str] = []
+
+        async def handle(name: str, duration: float) -> None:
+            await asyncio.sleep(duration)
+            finished.append(name)
+
+        await asyncio.gather(
+            processor.process_update(_message_update(1, HEAVY_CHAT), handle("generate", 0.2)),
+            processor.process_update(inline, handle("inline", 0.01)),
+        )
+        return finished
+
+    # Inline-запрос того же пользователя отвечается, не дожидаясь /generate в его личном чате
+    assert asyncio.run(run()) == ["inline", "generate"]
+
+if __name__ == "__main__":
+    work = _workload()
+    for concurrent in (False, True):
+        latencies, order, _ = asyncio.run(_run(work, concurrent))
+        print(f"{'concurrent' if concurrent else 'sequential'}: "
+              f"p50={_percentile(latencies, 0.5) * 1000:.1f}ms "
+              f"p99={_percentile(latencies, 0.99) * 1000:.1f}ms "
+              f"ordered={all(ids == sorted(ids) for ids in order.values())}")
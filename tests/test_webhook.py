@@ -0,0 +1,110 @@
+"""
+Проверка сервера вебхука на aiohttp.test_utils.
+
+Приложение python-telegram-bot настоящее: его бот при запуске вызывает
+getMe у локального сервера, изображающего Bot API, а обновления, как от
+Telegram, приходят POST-запросами на сервер create_webhook_app.
+"""
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder
+
+from bot.webhook import READY, SECRET_HEADER, create_webhook_app
+
+TOKEN = "123456:TEST"
+PATH = "/telegram"
+SECRET = "s3cret"
+
+# Обновление в том виде, в каком его присылает Telegram
+RECORDED_UPDATE = {
+    "update_id": 10001,
+    "message": {
+        "message_id": 42,
+        "date": 1700000000,
+        "chat": {"id": 777, "type": "private", "first_name": "Test"},
+        "from": {"id": 777, "is_bot": False, "first_name": "Test", "language_code": "ru"},
+        "text": "/generate",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 9}],
+    },
+}
+
+async def _get_me(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True, "result": {
+        "id": 123456, "is_bot": True, "first_name": "Test", "username": "test_bot"
+    }})
+
+async def _with_webhook(check: Callable[[Application, web.Application, TestClient], Awaitable[None]],
+                        secret: Optional[str] = SECRET) -> None:
+    """Поднимает Bot API и сервер вебхука и выполняет check с клиентом вебхука."""
+    api = web.Application()
+    api.router.add_post(f"/bot{TOKEN}/getMe", _get_me)
+    async with TestServer(api) as api_server:
+        application = (
+            ApplicationBuilder().token(TOKEN).base_url(str(api_server.make_url("/bot")))
+            .updater(None).build()
+        )
+        webhook_app = create_webhook_app(application, path=PATH, secret=secret)
+        async with TestClient(TestServer(webhook_app)) as client:
+            try:
+                await check(application, webhook_app, client)
+            finally:
+                if application.running:
+                    await application.stop()
+                await application.shutdown()
+
+def test_update_is_delivered_to_queue():
+    async def check(application, webhook_app, client):
+        response = await client.post(PATH, json=RECORDED_UPDATE, headers={SECRET_HEADER: SECRET})
+        assert response.status == 200
+        update = application.update_queue.get_nowait()
+        assert isinstance(update, Update)
+        assert update.update_id == RECORDED_UPDATE["update_id"]
+        assert update.effective_chat.id == 777
+        assert update.message.text == "/generate"
+
+    asyncio.run(_with_webhook(check))
+
+def test_bad_secret_is_rejected():
+    async def check(application, webhook_app, client):
+        for headers in ({}, {SECRET_HEADER: "wrong"}):
+            response = await client.post(PATH, json=RECORDED_UPDATE, headers=headers)
+            assert response.status == 403
+        assert application.update_queue.empty()
+
+    asyncio.run(_with_webhook(check))
+
+def test_invalid_update_is_rejected():
+    async def check(application, webhook_app, client):
+        for body in ("not json", "{}"):
+            response = await client.post(PATH, data=body, headers={SECRET_HEADER: SECRET})
+            assert response.status == 400
+        assert application.update_queue.empty()
+
+    asyncio.run(_with_webhook(check))
+
+def test_health_and_readiness():
+    async def check(application, webhook_app, client):
+        assert (await client.get("/healthz")).status == 200
+
+        # До запуска бота сервер жив, но обновления не принимает
+        response = await client.get("/readyz")
+        assert response.status == 503
+        assert (await response.json())["ready"] is False
+
+        await application.initialize()
+        await application.start()
+        webhook_app[READY].set()
+        response = await client.get("/readyz")
+        assert response.status == 200
+        assert await response.json() == {"ready": True, "pending_updates": 0}
+
+        # После остановки приложения снова не готов
+        await application.stop()
+        assert (await client.get("/readyz")).status == 503
+        assert (await client.get("/healthz")).status == 200
+
+    asyncio.run(_with_webhook(check))